@@ -0,0 +1,299 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+import polars as pl
+from bank_app.services import storage
+from bank_app.services.bank_account import ACCOUNTS, BankAccount, BankAccountService
+from bank_app.services.users import User
+
+logging.basicConfig(level=logging.INFO)
+
+OPERATIONS = ["create", "authorize", "deposit", "withdraw", "transfer"]
+DEFAULT_MIX = "authorize=10,deposit=40,withdraw=30,transfer=20"
+
+# Every synthetic account shares this password
+BENCH_PASSWORD = "hello"
+
+# In cents - large enough that withdrawals and transfers never run out of money
+BENCH_BALANCE = 100_000_000_000
+# Cents moved by each deposit, withdrawal and transfer
+BENCH_AMOUNT = 100
+
+
+def generate_csv(path: str, accounts: int, balance: int = BENCH_BALANCE) -> None:
+    """
+    Write a synthetic bank system CSV with usernames user0..user{accounts - 1}
+
+    Built column-wise by polars so 10M rows take seconds, not minutes
+
+    Args:
+        path (str): CSV file to write
+        accounts (int): Number of accounts
+        balance (int, optional): Starting balance of every account in cents. Defaults to BENCH_BALANCE.
+    """
+    password = hashlib.sha256(BENCH_PASSWORD.encode()).hexdigest()
+    pl.select(
+        pl.format("user{}", pl.int_range(0, accounts, eager=False)).alias("Username"),
+        pl.lit(password).alias("Password"),
+        pl.lit(int(balance), dtype=pl.datatypes.Int64).alias("BalanceCents"),
+    ).write_csv(path)
+
+
+def parse_mix(mix: str) -> typing.Dict[str, float]:
+    """
+    Parse an operation mix like "deposit=3,withdraw=1"
+
+    Args:
+        mix (str): Comma separated op=weight pairs
+
+    Raises:
+        ValueError: Unknown operation or no positive weight
+
+    Returns:
+        typing.Dict[str, float]: Operation -> relative weight
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}, expected one of {OPERATIONS}")
+        weights[name] = float(weight or 1)
+    if not any(weight > 0 for weight in weights.values()):
+        raise ValueError("Operation mix needs at least one positive weight")
+    return weights
+
+
+class Workload:
+    """
+    The benchmarked operations, each going through the same User /
+    BankAccount code paths the interactive menu and server use
+    """
+    def __init__(self, csv_path: str, accounts: int) -> None:
+        self.csv_path = csv_path
+        self.accounts = accounts
+
+    def _user(self, username: str, password: typing.Optional[str] = None) -> User:
+        return User(username, password, csv_path=self.csv_path)
+
+    def _account(self, username: str) -> BankAccount:
+        return ACCOUNTS.account(username, self.csv_path)
+
+    def _random_user(self, rng: random.Random) -> str:
+        return f"user{rng.randrange(self.accounts)}"
+
+    def create(self, rng: random.Random, worker: int, seq: int) -> None:
+        self._user(f"bench-{worker}-{seq}-{rng.getrandbits(32)}", BENCH_PASSWORD).create(0)
+
+    def authorize(self, rng: random.Random, worker: int, seq: int) -> None:
+        user = self._user(self._random_user(rng), BENCH_PASSWORD)
+        user.authorize(user.password)
+
+    def deposit(self, rng: random.Random, worker: int, seq: int) -> None:
+        self._account(self._random_user(rng)).deposit(BENCH_AMOUNT)
+
+    def withdraw(self, rng: random.Random, worker: int, seq: int) -> None:
+        self._account(self._random_user(rng)).withdraw(BENCH_AMOUNT)
+
+    def transfer(self, rng: random.Random, worker: int, seq: int) -> None:
+        source = self._account(self._random_user(rng))
+        recipient = self._random_user(rng)
+        while recipient == source.user.username and self.accounts > 1:
+            recipient = self._random_user(rng)
+        BankAccountService(source.user, source).transfer(source, self._account(recipient), BENCH_AMOUNT)
+
+
+def percentile(sorted_values: typing.List[int], fraction: float) -> float:
+    """
+    Nearest-rank percentile
+
+    Args:
+        sorted_values (typing.List[int]): Ascending samples
+        fraction (float): 0.5 for p50, 0.99 for p99
+
+    Returns:
+        float: Sample at that rank, 0.0 for no samples
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return float(sorted_values[rank])
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process so far
+
+    Returns:
+        float: Megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_commit() -> typing.Optional[str]:
+    """
+    Git commit being benchmarked, so results can be compared across commits
+
+    Returns:
+        typing.Optional[str]: Short hash, None outside a git checkout
+    """
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    csv_path: str,
+    accounts: int,
+    ops: int,
+    concurrency: int = 1,
+    mix: str = DEFAULT_MIX,
+    seed: int = 0,
+) -> typing.Dict[str, typing.Any]:
+    """
+    Drive a random operation mix against csv_path from `concurrency` threads
+
+    Args:
+        csv_path (str): Bank system CSV, e.g. from generate_csv
+        accounts (int): Number of user{n} accounts in the CSV
+        ops (int): Total operations across all threads
+        concurrency (int, optional): Worker threads. Defaults to 1.
+        mix (str, optional): Operation weights, see parse_mix. Defaults to DEFAULT_MIX.
+        seed (int, optional): Random seed, each worker derives its own. Defaults to 0.
+
+    Returns:
+        typing.Dict[str, typing.Any]: JSON-serializable results
+    """
+    weights = parse_mix(mix)
+    names = list(weights)
+    workload = Workload(csv_path, accounts)
+
+    # Opening the backend parses the CSV (or imports it), time that separately
+    load_start = time.perf_counter()
+    storage.get_backend(csv_path)
+    load_seconds = time.perf_counter() - load_start
+
+    def worker(index: int, count: int) -> typing.Tuple[typing.Dict[str, typing.List[int]], typing.Dict[str, int]]:
+        rng = random.Random(seed * 1_000_003 + index)
+        latencies: typing.Dict[str, typing.List[int]] = {name: [] for name in names}
+        errors: typing.Dict[str, int] = {name: 0 for name in names}
+        for seq, name in enumerate(rng.choices(names, [weights[name] for name in names], k=count)):
+            operation = getattr(workload, name)
+            start = time.perf_counter_ns()
+            try:
+                operation(rng, index, seq)
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter_ns() - start)
+        return latencies, errors
+
+    counts = [ops // concurrency + (1 if i < ops % concurrency else 0) for i in range(concurrency)]
+    wall_start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency), counts))
+    wall_seconds = time.perf_counter() - wall_start
+
+    close_start = time.perf_counter()
+    storage.close_backends()
+    close_seconds = time.perf_counter() - close_start
+
+    operations = {}
+    for name in names:
+        samples = sorted(sample for latencies, _ in results for sample in latencies[name])
+        operations[name] = {
+            "count": len(samples),
+            "errors": sum(errors[name] for _, errors in results),
+            "ops_per_sec": len(samples) / wall_seconds if wall_seconds else 0.0,
+            "p50_ms": percentile(samples, 0.50) / 1e6,
+            "p99_ms": percentile(samples, 0.99) / 1e6,
+        }
+
+    return {
+        "commit": current_commit(),
+        "backend": storage.DEFAULT_BACKEND,
+        "accounts": accounts,
+        "ops": ops,
+        "concurrency": concurrency,
+        "mix": weights,
+        "load_seconds": load_seconds,
+        "wall_seconds": wall_seconds,
+        "close_seconds": close_seconds,
+        "ops_per_sec": ops / wall_seconds if wall_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "operations": operations,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Command line options for python -m bank_app.bench
+
+    Returns:
+        argparse.ArgumentParser: Parser for benchmark arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m bank_app.bench",
+        description="Throughput and latency benchmark. Set BANK_STORAGE_BACKEND to pick the backend.",
+    )
+    parser.add_argument("--accounts", type=int, default=1000, help="Synthetic accounts to generate. Defaults to 1000")
+    parser.add_argument("--ops", type=int, default=10000, help="Total operations to run. Defaults to 10000")
+    parser.add_argument("--concurrency", type=int, default=1, help="Worker threads. Defaults to 1")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights. Defaults to {DEFAULT_MIX}")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed. Defaults to 0")
+    parser.add_argument(
+        "--csv-path",
+        default=None,
+        help="Benchmark this existing CSV instead of generating one in a temporary directory (it will be modified)"
+    )
+    parser.add_argument("--output", default=None, help="Write the JSON results here instead of stdout")
+    return parser
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    """
+    Generate data, run the benchmark and print JSON results
+
+    Args:
+        argv (typing.Optional[typing.List[str]], optional): Command line arguments. Defaults to sys.argv[1:].
+    """
+    args = build_parser().parse_args(argv)
+    # Per-operation info logs would dominate the timings
+    logging.disable(logging.ERROR)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = args.csv_path
+            if csv_path is None:
+                csv_path = os.path.join(tmp_dir, "bank_system.csv")
+                generate_csv(csv_path, args.accounts)
+            results = run_benchmark(
+                csv_path, args.accounts, args.ops, args.concurrency, args.mix, args.seed
+            )
+    finally:
+        logging.disable(logging.NOTSET)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
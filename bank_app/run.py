@@ -1,41 +1,469 @@
+import argparse
 import logging
-from bank_app.services.bank_account import BankAccount, BankAccountService
-from bank_app.services.users import UserService
+import sys
+import typing
+from bank_app.services.aggregates import DEFAULT_TOP_N
+from bank_app.services.credentials import CREDENTIALS
+from bank_app.services.metrics import METRICS, PROFILE_MODE, PROFILER
+from bank_app.services.money import format_cents
+from bank_app.services.storage import close_backends, default_csv_path, get_backend, set_default_backend
 logging.basicConfig(level=logging.INFO)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Command line options for the non-interactive modes
     
-# Maybe refactor later to use Rich-Click package for formatting and pretty printing + colors
-def run() -> None:
+    With no subcommand the interactive menu runs as before
+
+    Returns:
+        argparse.ArgumentParser: Parser for entrypoint.py arguments
     """
-    Entrypoint script for mock banking system
+    parser = argparse.ArgumentParser(prog="entrypoint.py", description="Mock banking system")
+    parser.add_argument(
+        "--csv-path", 
+        default=None, 
+        help="Bank system CSV to operate on. Defaults to bank_app/data/bank_system.csv"
+    )
+    parser.add_argument(
+        "--metrics", 
+        action="store_true", 
+        help="Collect per-operation counters and latencies and print a breakdown on exit (same as BANK_METRICS=1)"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    
+    balance_parser = subparsers.add_parser(
+        "balance", help="Print one account's balance without loading the whole table"
+    )
+    balance_parser.add_argument("username", help="Account to look up")
+    
+    for op, help_text in (("deposit", "Add money to an account"), ("withdraw", "Take money out of an account")):
+        op_parser = subparsers.add_parser(op, help=help_text)
+        op_parser.add_argument("username", help="Account to update")
+        op_parser.add_argument("amount", help="Amount in dollars, e.g. 10.50")
+    
+    transfer_parser = subparsers.add_parser("transfer", help="Move money between two accounts")
+    transfer_parser.add_argument("username", help="Account sending the money")
+    transfer_parser.add_argument("recipient", help="Account receiving the money")
+    transfer_parser.add_argument("amount", help="Amount in dollars, e.g. 10.50")
+    
+    create_parser = subparsers.add_parser("create", help="Create an account")
+    create_parser.add_argument("username", help="New username")
+    create_parser.add_argument("--balance", default="0", help="Starting balance in dollars. Defaults to 0")
+    create_parser.add_argument(
+        "--password-stdin",
+        action="store_true",
+        help="Read the password from the first line of stdin instead of prompting for it"
+    )
+    
+    subparsers.add_parser(
+        "pipeline", help="Run newline-delimited JSON commands from stdin, writing one JSON result per line to stdout"
+    )
+    
+    batch_parser = subparsers.add_parser(
+        "batch", help="Apply a CSV/JSONL file of transactions as a single commit"
+    )
+    batch_parser.add_argument(
+        "path", help="File with Type (deposit/withdraw/transfer), Username, Recipient and Amount columns"
+    )
+    batch_parser.add_argument("--report", default=None, help="Write rejected rows to this CSV file")
+    
+    subparsers.add_parser(
+        "convert", help="One-time conversion of float balances to integer cents"
+    )
+    
+    export_parser = subparsers.add_parser(
+        "export", help="Write the current state of every account out as a CSV"
+    )
+    export_parser.add_argument(
+        "--output", required=True, help="CSV file to write. Can't be the live snapshot of the csv backend"
+    )
+    
+    provision_parser = subparsers.add_parser(
+        "provision", help="Create users in bulk from a CSV/JSONL file"
+    )
+    provision_parser.add_argument(
+        "path", help="File with Username, Password and optional Balance columns"
+    )
+    provision_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Users read, hashed and written at a time. Defaults to BANK_PROVISION_CHUNK"
+    )
+    provision_parser.add_argument("--report", default=None, help="Write rejected rows to this CSV file")
+    
+    reconcile_parser = subparsers.add_parser(
+        "reconcile", help="Compare every balance with an external balances CSV in bounded memory"
+    )
+    reconcile_parser.add_argument(
+        "path", help="CSV with Username and BalanceCents (or Balance in dollars) columns"
+    )
+    reconcile_parser.add_argument("--output", default=None, help="Write mismatches to this CSV file as they are found")
+    reconcile_parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Stop with a partial result after this many seconds, 0 for no limit. Defaults to BANK_RECONCILE_TIME_BUDGET"
+    )
+    reconcile_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Rows read at a time. Defaults to BANK_RECONCILE_CHUNK"
+    )
+    reconcile_parser.add_argument(
+        "--buckets", type=int, default=None, help="Bucket files per side. Defaults to one per 64 MiB of the external file"
+    )
+    
+    report_parser = subparsers.add_parser(
+        "report", help="Print account count, total balance, operation totals and the largest balances"
+    )
+    report_parser.add_argument(
+        "--top", type=int, default=DEFAULT_TOP_N, help=f"Largest balances to list. Defaults to {DEFAULT_TOP_N}"
+    )
+    
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve the bank over TCP with a line-delimited JSON protocol"
+    )
+    serve_parser.add_argument("--host", default=None, help="Interface to bind. Defaults to 127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=None, help="Port to listen on. Defaults to 8080")
+    serve_parser.add_argument(
+        "--workers", 
+        type=int, 
+        default=None, 
+        help="Threads running storage operations. Defaults to 32"
+    )
+    serve_parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Run the account store in this many worker processes, split by username hash (the sharded backend)"
+    )
+    return parser
+
+
+def run_balance(args: argparse.Namespace) -> None:
+    """
+    Balance mode - answer a single lookup and exit
+
+    The CSV backend answers from its precompiled account cache plus the
+    journal, so this never parses the snapshot or imports the dataframe
+    library unless the cache has to be rebuilt. Other backends are opened
+    as usual.
+
+    Args:
+        args (argparse.Namespace): Parsed `balance` arguments
+
+    Raises:
+        ValueError: Unknown username
+    """
+    from bank_app.services import storage
+
+    csv_path = args.csv_path or default_csv_path()
+    if storage.DEFAULT_BACKEND == "csv":
+        from bank_app.services.account_cache import cached_user
+
+        user = cached_user(csv_path, args.username)
+        balance = user.balance if user is not None else None
+    else:
+        balance = get_backend(csv_path).get_balance(args.username)
+    if balance is None:
+        raise ValueError(f"User {args.username} does not exist")
+    logging.info(f"{args.username}: {format_cents(balance)}")
+
+
+def run_command(args: argparse.Namespace) -> None:
+    """
+    Scripted mode - run a single deposit, withdraw, transfer or create and exit
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of one of those subcommands
+
+    Raises:
+        ValueError: The operation was rejected
+    """
+    from bank_app.services.commands import CommandRunner
+
+    request = {"op": args.command, "username": args.username}
+    if args.command == "create":
+        if args.password_stdin:
+            request["password"] = sys.stdin.readline().rstrip("\r\n")
+        else:
+            import getpass
+
+            request["password"] = getpass.getpass("Password: ")
+        request["balance"] = args.balance
+    else:
+        request["amount"] = args.amount
+        if args.command == "transfer":
+            request["recipient"] = args.recipient
+    response = CommandRunner(args.csv_path).run(request)
+    logging.info(f"{args.username}: {response['balance']}")
+
+
+def run_pipeline(args: argparse.Namespace) -> None:
+    """
+    Pipeline mode - stream JSON commands from stdin against one open store
+
+    Args:
+        args (argparse.Namespace): Parsed `pipeline` arguments
+    """
+    from bank_app.services import storage
+    from bank_app.services.commands import PIPELINE_FLUSH_EVERY, CommandRunner
+
+    csv_path = args.csv_path or default_csv_path()
+    if storage.DEFAULT_BACKEND == "csv":
+        get_backend(csv_path, flush_every=PIPELINE_FLUSH_EVERY)
+    answered = CommandRunner(csv_path).run_pipeline(sys.stdin.buffer, sys.stdout.buffer)
+    logging.info(f"Answered {answered} commands")
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    """
+    Bulk ingestion mode - apply a whole transaction file in one commit
+
+    Args:
+        args (argparse.Namespace): Parsed `batch` arguments
+    """
+    from bank_app.services.batch import apply_batch, load_transactions
+    from bank_app.services.history import get_history
+
+    csv_path = args.csv_path or default_csv_path()
+    report = apply_batch(get_backend(csv_path), load_transactions(args.path), get_history(csv_path))
+    
+    if report.rejected.height:
+        logging.warning(f"Rejected rows:\n{report.rejected}")
+        if args.report:
+            report.rejected.write_csv(args.report)
+            logging.info(f"Wrote rejected rows to {args.report}")
+
+
+def run_provision(args: argparse.Namespace) -> None:
+    """
+    Bulk provisioning mode - create every user in a file, one write per chunk
+
+    Args:
+        args (argparse.Namespace): Parsed `provision` arguments
+    """
+    from bank_app.services.provisioning import DEFAULT_PROVISION_CHUNK, load_user_chunks, provision_users
+
+    csv_path = args.csv_path or default_csv_path()
+    chunk_size = args.chunk_size or DEFAULT_PROVISION_CHUNK
+    report = provision_users(get_backend(csv_path), load_user_chunks(args.path, chunk_size))
+    
+    if report.rejected.height:
+        logging.warning(f"Rejected rows:\n{report.rejected}")
+        if args.report:
+            report.rejected.write_csv(args.report)
+            logging.info(f"Wrote rejected rows to {args.report}")
+
+
+def run_convert(args: argparse.Namespace) -> None:
     """
+    Convert mode - rewrite files from before balances were integer cents
+    
+    Snapshots are converted here; opening the configured backend converts
+    its own sqlite or mmap file. Files already in cents are left alone.
+
+    Args:
+        args (argparse.Namespace): Parsed `convert` arguments
+    """
+    from bank_app.services.locks import get_lock_manager, lock_path_for
+    from bank_app.services.snapshot import convert_legacy_snapshots
+
+    csv_path = args.csv_path or default_csv_path()
+    with get_lock_manager(lock_path_for(csv_path)).exclusive():
+        converted = convert_legacy_snapshots(csv_path)
+    get_backend(csv_path)
+    if not converted:
+        logging.info(f"No float balance snapshots found next to {csv_path}")
+
+
+def run_export(args: argparse.Namespace) -> None:
+    """
+    Export mode - dump the live account table to CSV for inspection
+
+    Args:
+        args (argparse.Namespace): Parsed `export` arguments
+    """
+    import os
+    from bank_app.services import storage
+    from bank_app.services.paths import DEFAULT_SNAPSHOT_FORMAT, snapshot_path_for
+    from bank_app.services.snapshot import export_csv
+
+    csv_path = args.csv_path or default_csv_path()
+    live_path = snapshot_path_for(csv_path, DEFAULT_SNAPSHOT_FORMAT)
+    if storage.DEFAULT_BACKEND == "csv" and os.path.abspath(args.output) == os.path.abspath(live_path):
+        # The ledger only ever rewrites its snapshot during a checkpoint, with the journal rotated to match
+        raise ValueError(f"{args.output} is the live snapshot, export to another file")
+    export_csv(get_backend(csv_path), args.output)
+
+
+def run_reconcile(args: argparse.Namespace) -> None:
+    """
+    Reconciliation mode - stream the account store and an external file and report every mismatch
+
+    Args:
+        args (argparse.Namespace): Parsed `reconcile` arguments
+    """
+    from bank_app.services import storage
+    from bank_app.services.reconcile import (
+        DEFAULT_RECONCILE_CHUNK,
+        DEFAULT_TIME_BUDGET,
+        reconcile,
+        snapshot_balance_chunks,
+    )
+
+    csv_path = args.csv_path or default_csv_path()
+    chunk_size = args.chunk_size or DEFAULT_RECONCILE_CHUNK
+    # The CSV backend is read from its files, opening it would load the whole table
+    if storage.DEFAULT_BACKEND == "csv":
+        store = snapshot_balance_chunks(csv_path, chunk_size)
+    else:
+        store = get_backend(csv_path)
+    report = reconcile(
+        store,
+        args.path,
+        output_path=args.output,
+        chunk_size=chunk_size,
+        buckets=args.buckets,
+        time_budget=DEFAULT_TIME_BUDGET if args.time_budget is None else args.time_budget,
+    )
+    if report.mismatches and args.output:
+        logging.info(f"Wrote {report.mismatches} mismatches to {args.output}")
+
+
+def run_report(args: argparse.Namespace) -> None:
+    """
+    Report mode - bank-wide totals from the aggregates storage keeps up to date
+
+    Args:
+        args (argparse.Namespace): Parsed `report` arguments
+    """
+    report = get_backend(args.csv_path or default_csv_path()).aggregates().report(args.top)
+    lines = [
+        f"Accounts: {report['accounts']}",
+        f"Total balance: {format_cents(report['total_balance'])}",
+        f"Total deposits: {format_cents(report['total_deposits'])}",
+        f"Total withdrawals: {format_cents(report['total_withdrawals'])}",
+    ]
+    for op, stats in report["operations"].items():
+        lines.append(
+            f"{op}: {stats['count']} operations, {format_cents(stats['credited'])} credited, "
+            f"{format_cents(stats['debited'])} debited"
+        )
+    lines.append(f"Top {len(report['top_balances'])} balances:")
+    for rank, entry in enumerate(report["top_balances"], start=1):
+        lines.append(f"{rank:>4}. {entry['username']}: {format_cents(entry['balance'])}")
+    logging.info("\n".join(lines))
+
+
+def run_serve(args: argparse.Namespace) -> None:
+    """
+    Network mode - serve many sessions from one process until interrupted
+
+    Args:
+        args (argparse.Namespace): Parsed `serve` arguments
+    """
+    import asyncio
+    from bank_app.services.server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WORKERS, BankServer
+
+    if args.shards:
+        set_default_backend("sharded")
+        get_backend(args.csv_path or default_csv_path(), shards=args.shards)
+    server = BankServer(args.csv_path, workers=args.workers or DEFAULT_WORKERS)
     try:
-        logging.info("Welcome to the bank system!")
-        user_input = input("\n1: Create a new user\n2: Login to existing user\nEnter your choice (1/2): ")
+        asyncio.run(server.serve_forever(
+            args.host or DEFAULT_HOST, DEFAULT_PORT if args.port is None else args.port
+        ))
+    except KeyboardInterrupt:
+        logging.info("Shutting down server...")
+    finally:
+        server.close()
+
+
+# Maybe refactor later to use Rich-Click package for formatting and pretty printing + colors
+def run_interactive() -> None:
+    """
+    Interactive menu to create a user or log in and manage an account
+    """
+    from bank_app.services.bank_account import BankAccount, BankAccountService
+    from bank_app.services.users import UserService
+
+    logging.info("Welcome to the bank system!")
+    user_input = input("\n1: Create a new user\n2: Login to existing user\nEnter your choice (1/2): ")
+    
+    user_service = UserService()
+    
+    if user_input == "1":
+        logging.info("Process will now create a new user")
+        user_service.create_user()
         
-        user_service = UserService()
+    elif user_input == "2":
+        logging.info("Attempting login process now...")
         
-        if user_input == "1":
-            logging.info("Process will now create a new user")
-            user_service.create_user()
-            
-        elif user_input == "2":
-            logging.info("Attempting login process now...")
-            
-            # Get boolean for success and user object
-            logged_in_bool, user = user_service.login()
-            
-            if logged_in_bool and user is not None:
-                logging.info("Setting up connection to banking services...")
-                account = BankAccount(user)
-                bank_service = BankAccountService(user, account)
-                bank_service.manage_account()
-            else:
-                raise Exception("Invalid login attempt, please try again")
-            
-        logging.info("Exiting process...")
+        # Get boolean for success and user object
+        logged_in_bool, user = user_service.login()
+        
+        if logged_in_bool and user is not None:
+            logging.info("Setting up connection to banking services...")
+            account = BankAccount(user)
+            bank_service = BankAccountService(user, account)
+            bank_service.manage_account()
+        else:
+            raise Exception("Invalid login attempt, please try again")
+        
+    logging.info("Exiting process...")
+
+
+def run(argv: typing.Optional[typing.List[str]] = None) -> None:
+    """
+    Entrypoint script for mock banking system
+
+    Args:
+        argv (typing.Optional[typing.List[str]], optional): Command line arguments. Defaults to none, which runs the interactive menu.
+    """
+    args = build_parser().parse_args(argv if argv is not None else [])
+    if args.metrics:
+        METRICS.enable()
+    if PROFILE_MODE:
+        PROFILER.start(PROFILE_MODE)
+        
+    try:
+        if args.command == "balance":
+            run_balance(args)
+        elif args.command in ("deposit", "withdraw", "transfer", "create"):
+            run_command(args)
+        elif args.command == "pipeline":
+            run_pipeline(args)
+        elif args.command == "batch":
+            run_batch(args)
+        elif args.command == "convert":
+            run_convert(args)
+        elif args.command == "export":
+            run_export(args)
+        elif args.command == "provision":
+            run_provision(args)
+        elif args.command == "reconcile":
+            run_reconcile(args)
+        elif args.command == "report":
+            run_report(args)
+        elif args.command == "serve":
+            run_serve(args)
+        else:
+            run_interactive()
             
     except Exception as e:
         raise e
     
+    finally:
+        close_backends()
+        if PROFILE_MODE:
+            logging.info(f"{PROFILE_MODE} profile:\n{PROFILER.stop()}")
+        if METRICS.enabled:
+            logging.info(f"Operation metrics:\n{METRICS.report()}")
+            logging.info(f"Credential cache: {CREDENTIALS.stats()}")
+    
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run(sys.argv[1:])
@@ -0,0 +1,311 @@
+import array
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import typing
+import zlib
+from bank_app.services.durable import replace_durably
+from bank_app.services.journal import journal_cents
+from bank_app.services.locks import get_lock_manager, lock_path_for
+from bank_app.services.metrics import instrumented
+from bank_app.services.paths import DEFAULT_SNAPSHOT_FORMAT, journal_path_for, snapshot_path_for
+from bank_app.services.storage import UserRecord
+
+logging.basicConfig(level=logging.INFO)
+
+MAGIC = b"BANKACCT"
+# Bump whenever the layout below changes, older files are then rebuilt
+FORMAT_VERSION = 1
+
+# magic, version, snapshot mtime (ns), snapshot size, snapshot inode, accounts, slots
+_HEADER = struct.Struct("<8sIqqqQQ")
+# Offset of an account's record, 0 for an empty slot
+_SLOT = struct.Struct("<Q")
+# username length, password length, balance - followed by the two strings
+_RECORD = struct.Struct("<HHq")
+
+
+def cache_path_for(snapshot_path: str) -> str:
+    """
+    Account cache that sits next to a snapshot
+
+    Args:
+        snapshot_path (str): Snapshot file the cache is built from
+
+    Returns:
+        str: Path of the matching .cache file
+    """
+    return os.path.splitext(snapshot_path)[0] + ".cache"
+
+
+def snapshot_signature(snapshot_path: str) -> typing.Tuple[int, int, int]:
+    """
+    Fingerprint a cache is tagged with, same as the ledger's
+
+    Args:
+        snapshot_path (str): Snapshot file
+
+    Returns:
+        typing.Tuple[int, int, int]: mtime (ns), size and inode of the snapshot
+    """
+    stat = os.stat(snapshot_path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class AccountCache:
+    """
+    Read-only view of a precompiled account cache file
+
+    The file holds every account of one snapshot as packed binary records
+    plus an open-addressing hash table of record offsets keyed by the
+    crc32 of the username. It is memory-mapped, so a lookup reads a
+    handful of pages no matter how many accounts there are, and opening
+    it costs no parsing at all.
+    """
+    def __init__(self, path: str, data: mmap.mmap, accounts: int, slots: int) -> None:
+        self.path = path
+        self.accounts = accounts
+        self._data = data
+        self._slots = slots
+
+    @classmethod
+    def open(cls, path: str, signature: typing.Sequence[int]) -> typing.Optional["AccountCache"]:
+        """
+        Map a cache file, if it was built by this version for this exact snapshot
+
+        Args:
+            path (str): File written by write_cache
+            signature (typing.Sequence[int]): Signature of the current snapshot
+
+        Returns:
+            typing.Optional[AccountCache]: The cache, or None if missing, stale or unreadable
+        """
+        try:
+            with open(path, "rb") as cache_file:
+                data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # mmap refuses empty files
+            return None
+        if len(data) < _HEADER.size:
+            data.close()
+            return None
+        magic, version, mtime, size, inode, accounts, slots = _HEADER.unpack_from(data)
+        if (
+            magic != MAGIC
+            or version != FORMAT_VERSION
+            or (mtime, size, inode) != tuple(signature)
+            or len(data) < _HEADER.size + slots * _SLOT.size
+        ):
+            data.close()
+            return None
+        return cls(path, data, accounts, slots)
+
+    def get(self, username: str) -> typing.Optional[UserRecord]:
+        """
+        Args:
+            username (str): Account to look up
+
+        Returns:
+            typing.Optional[UserRecord]: Row for username as of the snapshot, or None if it is not in it
+        """
+        if not self._slots:
+            return None
+        name = username.encode()
+        slot = zlib.crc32(name) % self._slots
+        while True:
+            (offset,) = _SLOT.unpack_from(self._data, _HEADER.size + slot * _SLOT.size)
+            if not offset:
+                return None
+            name_length, password_length, balance = _RECORD.unpack_from(self._data, offset)
+            start = offset + _RECORD.size
+            if self._data[start:start + name_length] == name:
+                password = self._data[start + name_length:start + name_length + password_length]
+                return UserRecord(username, password.decode(), balance)
+            slot = (slot + 1) % self._slots
+
+    def close(self) -> None:
+        self._data.close()
+
+
+@instrumented("account_cache.write")
+def write_cache(
+    usernames: typing.Sequence[str],
+    passwords: typing.Sequence[str],
+    balances: typing.Sequence[int],
+    path: str,
+    signature: typing.Sequence[int],
+) -> None:
+    """
+    Atomically and durably write a cache of the given columns, tagged with the snapshot they came from
+
+    If a username appears more than once the first row wins, same as the ledger's index.
+
+    Args:
+        usernames (typing.Sequence[str]): Username column
+        passwords (typing.Sequence[str]): Password column
+        balances (typing.Sequence[int]): BalanceCents column
+        path (str): Cache file to write
+        signature (typing.Sequence[int]): Signature of the snapshot the columns were read from
+    """
+    # Zipping in reverse lets earlier rows overwrite later duplicates
+    index = dict(zip(reversed(usernames), range(len(usernames) - 1, -1, -1)))
+    rows: typing.Iterable[int] = (
+        range(len(usernames)) if len(index) == len(usernames) else sorted(index.values())
+    )
+    slots = 2 * len(index)
+    table = array.array("Q", bytes(_SLOT.size * slots))
+    records = []
+    offset = _HEADER.size + slots * _SLOT.size
+    pack = _RECORD.pack
+    for row in rows:
+        name = usernames[row].encode()
+        secret = passwords[row].encode()
+        slot = zlib.crc32(name) % slots
+        while table[slot]:
+            slot = (slot + 1) % slots
+        table[slot] = offset
+        record = pack(len(name), len(secret), balances[row]) + name + secret
+        records.append(record)
+        offset += len(record)
+    if sys.byteorder != "little":
+        table.byteswap()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as cache_file:
+            cache_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, *signature, len(records), slots))
+            cache_file.write(table.tobytes())
+            cache_file.write(b"".join(records))
+        replace_durably(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@instrumented("account_cache.build")
+def build_cache(snapshot_path: str, snapshot_format: str) -> AccountCache:
+    """
+    Read a snapshot in full and write its cache
+
+    The only path that needs the dataframe library, so it is imported here
+    rather than at the top of the module.
+
+    Args:
+        snapshot_path (str): Snapshot file
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+
+    Raises:
+        e: Error reading the snapshot or writing the cache
+
+    Returns:
+        AccountCache: The new cache
+    """
+    from bank_app.services.snapshot import read_snapshot
+
+    try:
+        path = cache_path_for(snapshot_path)
+        signature = snapshot_signature(snapshot_path)
+        df = read_snapshot(snapshot_path, snapshot_format)
+        write_cache(
+            df["Username"].to_list(), df["Password"].to_list(), df["BalanceCents"].to_list(), path, signature
+        )
+        cache = AccountCache.open(path, signature)
+        if cache is None:
+            raise ValueError(f"Snapshot {snapshot_path} changed while its cache was being built")
+        return cache
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        raise e
+
+
+def _replay_user(journal_path: str, username: str, user: typing.Optional[UserRecord]) -> typing.Optional[UserRecord]:
+    """
+    Apply the journal records that touch one account, the way Ledger._apply_record would
+
+    Lines that don't mention the username are skipped without being parsed.
+
+    Args:
+        journal_path (str): Journal file
+        username (str): Account to follow
+        user (typing.Optional[UserRecord]): Row as of the snapshot, None if it isn't in it
+
+    Returns:
+        typing.Optional[UserRecord]: Row with every journaled change applied
+    """
+    needle = json.dumps(username).encode()
+    try:
+        journal_file = open(journal_path, "rb")
+    except FileNotFoundError:
+        return user
+    with journal_file:
+        for line in journal_file:
+            if needle not in line or not line.endswith(b"\n"):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record["op"]
+            if op == "create":
+                if user is None and record["user"] == username:
+                    user = UserRecord(username, record["password"], journal_cents(record["balance"]))
+            elif op == "create_many":
+                for name, password, balance in record["users"]:
+                    if user is None and name == username:
+                        user = UserRecord(username, password, journal_cents(balance))
+            elif user is None:
+                continue
+            elif op in ("deposit", "withdraw", "set"):
+                if record["user"] == username:
+                    user = user._replace(balance=journal_cents(record["balance"]))
+            elif op == "password":
+                if record["user"] == username:
+                    user = user._replace(password=record["password"])
+            elif op == "batch":
+                if username in record["balances"]:
+                    user = user._replace(balance=journal_cents(record["balances"][username]))
+            elif op == "transfer":
+                if record["from"] == username:
+                    user = user._replace(balance=journal_cents(record["from_balance"]))
+                elif record["to"] == username:
+                    user = user._replace(balance=journal_cents(record["to_balance"]))
+    return user
+
+
+@instrumented("account_cache.cached_user")
+def cached_user(
+    csv_path: str, username: str, snapshot_format: str = DEFAULT_SNAPSHOT_FORMAT
+) -> typing.Optional[UserRecord]:
+    """
+    Current row for one account of the CSV backend, without loading the table
+
+    Looks the account up in the snapshot's cache, building it first if it
+    is missing or was written for another snapshot, then applies the
+    journal records that mention it. Holds the account's lock the whole
+    time like a Ledger read would, so a checkpoint can't swap the snapshot
+    and rotate the journal in between.
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        username (str): Account to look up
+        snapshot_format (str, optional): One of SNAPSHOT_FORMATS. Defaults to BANK_SNAPSHOT_FORMAT.
+
+    Returns:
+        typing.Optional[UserRecord]: Row for username, or None if it does not exist
+    """
+    snapshot_path = snapshot_path_for(csv_path, snapshot_format)
+    if not os.path.exists(snapshot_path):
+        # The IPC snapshot is created from the CSV the first time a ledger opens it
+        snapshot_path, snapshot_format = csv_path, "csv"
+    with get_lock_manager(lock_path_for(csv_path)).accounts(username):
+        cache = AccountCache.open(cache_path_for(snapshot_path), snapshot_signature(snapshot_path))
+        if cache is None:
+            cache = build_cache(snapshot_path, snapshot_format)
+        try:
+            user = cache.get(username)
+        finally:
+            cache.close()
+        return _replay_user(journal_path_for(csv_path), username, user)
@@ -0,0 +1,333 @@
+import heapq
+import json
+import logging
+import os
+import typing
+from bank_app.services.durable import replace_durably
+
+logging.basicConfig(level=logging.INFO)
+
+# Largest balances a report can list
+DEFAULT_TOP_N = int(os.environ.get("BANK_TOP_N", "10"))
+FORMAT_VERSION = 1
+
+# username, balance before (None for a new account), balance after
+BalanceChange = typing.Tuple[str, typing.Optional[int], int]
+
+
+def aggregates_path_for(snapshot_path: str) -> str:
+    """
+    File the aggregates are saved in alongside a snapshot
+
+    Args:
+        snapshot_path (str): Snapshot file the aggregates describe
+
+    Returns:
+        str: Path of the matching .aggregates.json file
+    """
+    return os.path.splitext(snapshot_path)[0] + ".aggregates.json"
+
+
+class TopBalances:
+    """
+    The n largest balances, kept up to date as balances change
+
+    Tracks a candidate set of up to 2n accounts with a min-heap over it.
+    Every account outside the set has a balance no higher than `floor`,
+    and every candidate one no lower, so as long as there are at least n
+    candidates the top n of the set are the top n of the bank. A change
+    costs O(log n): a rising balance above the floor joins the set,
+    evicting its smallest member, and a candidate falling below the floor
+    leaves it. Only when enough candidates have fallen out that fewer
+    than n remain is the set rebuilt from every balance.
+
+    Heap entries are never updated in place. A new one is pushed instead
+    and entries that no longer match a candidate's balance are skipped.
+    """
+    def __init__(self, n: int = DEFAULT_TOP_N) -> None:
+        self.n = max(1, n)
+        self.capacity = 2 * self.n
+        self._members: typing.Dict[str, int] = {}
+        self._heap: typing.List[typing.Tuple[int, str]] = []
+        # Highest balance an account outside _members can have, None while every account is a member
+        self.floor: typing.Optional[int] = None
+
+    def update(self, username: str, balance: int) -> None:
+        """
+        Account for a new or changed balance
+
+        Args:
+            username (str): Account name
+            balance (int): Its balance now, in cents
+        """
+        if username in self._members:
+            if self.floor is not None and balance < self.floor:
+                del self._members[username]
+                return
+        elif self.floor is not None and balance <= self.floor:
+            return
+        self._members[username] = balance
+        heapq.heappush(self._heap, (balance, username))
+        if len(self._members) > self.capacity:
+            self._evict()
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(balance, username) for username, balance in self._members.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self) -> None:
+        while True:
+            balance, username = heapq.heappop(self._heap)
+            if self._members.get(username) == balance:
+                break
+        del self._members[username]
+        self.floor = balance if self.floor is None else max(self.floor, balance)
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether top() is exact without a rebuild
+
+        Returns:
+            bool: False once fewer than n candidates are left and others exist
+        """
+        return self.floor is None or len(self._members) >= self.n
+
+    def rebuild(self, balances: typing.Iterable[typing.Tuple[str, int]]) -> None:
+        """
+        Start over from every account's balance - O(accounts)
+
+        Args:
+            balances (typing.Iterable[typing.Tuple[str, int]]): (username, balance) for every account
+        """
+        largest = heapq.nlargest(self.capacity + 1, balances, key=lambda item: item[1])
+        self.floor = largest[self.capacity][1] if len(largest) > self.capacity else None
+        self._members = dict(largest[:self.capacity])
+        self._heap = [(balance, username) for username, balance in self._members.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n: typing.Optional[int] = None) -> typing.List[typing.Tuple[str, int]]:
+        """
+        Largest balances, highest first - O(n log n) whatever the number of accounts
+
+        Args:
+            n (typing.Optional[int], optional): How many, at most the n it was built with. Defaults to that n.
+
+        Returns:
+            typing.List[typing.Tuple[str, int]]: (username, balance) pairs
+        """
+        n = self.n if n is None else min(n, self.n)
+        return heapq.nlargest(n, self._members.items(), key=lambda item: (item[1], item[0]))
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {"n": self.n, "floor": self.floor, "members": self._members}
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any]) -> "TopBalances":
+        top = cls(data["n"])
+        top.floor = data["floor"]
+        top._members = dict(data["members"])
+        top._heap = [(balance, username) for username, balance in top._members.items()]
+        heapq.heapify(top._heap)
+        return top
+
+
+class Aggregates:
+    """
+    Bank-wide totals maintained as balances change
+
+    Holds the number of accounts, the sum of balances, per-operation
+    counts with the money they credited and debited, and the largest
+    balances. Every write updates them in O(1) (O(log n) for the top
+    balances), so reporting never scans the account table.
+
+    The Ledger saves these next to its snapshot each time it compacts and
+    replays the journal on top of them at startup, like the balances
+    themselves. Operation counts start from zero for a table whose saved
+    aggregates are missing or don't match its snapshot.
+    """
+    def __init__(self, top_n: int = DEFAULT_TOP_N) -> None:
+        self.accounts = 0
+        self.total_balance = 0
+        # Op -> {"count", "credited", "debited"}, amounts in cents
+        self.operations: typing.Dict[str, typing.Dict[str, int]] = {}
+        self.top = TopBalances(top_n)
+
+    def record(
+        self,
+        op: str,
+        changes: typing.Iterable[BalanceChange],
+        gross: typing.Optional[typing.Dict[str, int]] = None,
+    ) -> None:
+        """
+        Account for one operation
+
+        Args:
+            op (str): Journal op - "deposit", "withdraw", "transfer", "batch", "set" or "create"
+            changes (typing.Iterable[BalanceChange]): Every balance it changed
+            gross (typing.Optional[typing.Dict[str, int]], optional): Cents "deposited" and "withdrawn" by a batch before netting, added to op's counters. Defaults to None.
+        """
+        # A journal record replayed over state that already includes it changes nothing and isn't counted again
+        changes = [change for change in changes if change[1] != change[2]]
+        if not changes:
+            return
+        stats = self.operations.get(op)
+        if stats is None:
+            stats = self.operations[op] = {"count": 0, "credited": 0, "debited": 0}
+        stats["count"] += 1
+        for key, amount in (gross or {}).items():
+            stats[key] = stats.get(key, 0) + amount
+        for username, before, after in changes:
+            if before is None:
+                self.accounts += 1
+                before = 0
+            delta = after - before
+            self.total_balance += delta
+            if delta > 0:
+                stats["credited"] += delta
+            else:
+                stats["debited"] -= delta
+            self.top.update(username, after)
+
+    @classmethod
+    def from_balances(
+        cls, usernames: typing.Sequence[str], balances: typing.Sequence[int], top_n: int = DEFAULT_TOP_N
+    ) -> "Aggregates":
+        """
+        Totals and top balances of a table, with no operation history - O(accounts)
+
+        Args:
+            usernames (typing.Sequence[str]): Every account
+            balances (typing.Sequence[int]): Their balances, in the same order
+            top_n (int, optional): Largest balances to track. Defaults to BANK_TOP_N.
+
+        Returns:
+            Aggregates: Aggregates of the table as it stands
+        """
+        aggregates = cls(top_n)
+        aggregates.accounts = len(usernames)
+        aggregates.total_balance = sum(balances)
+        aggregates.top.rebuild(zip(usernames, balances))
+        return aggregates
+
+    @classmethod
+    def merge(cls, parts: typing.Iterable["Aggregates"], top_n: int = DEFAULT_TOP_N) -> "Aggregates":
+        """
+        Combine the aggregates of disjoint sets of accounts, e.g. partitions
+
+        The top balances of the whole are among the top balances of the
+        parts, so only those are looked at. The result is for reporting.
+
+        Args:
+            parts (typing.Iterable[Aggregates]): Aggregates with exact top balances
+            top_n (int, optional): Largest balances to keep. Defaults to BANK_TOP_N.
+
+        Returns:
+            Aggregates: Aggregates of every account
+        """
+        merged = cls(top_n)
+        candidates: typing.List[typing.Tuple[str, int]] = []
+        for part in parts:
+            merged.accounts += part.accounts
+            merged.total_balance += part.total_balance
+            for op, stats in part.operations.items():
+                merged_stats = merged.operations.setdefault(op, {"count": 0, "credited": 0, "debited": 0})
+                for key, value in stats.items():
+                    merged_stats[key] = merged_stats.get(key, 0) + value
+            candidates.extend(part.top.top(top_n))
+        merged.top.rebuild(candidates)
+        return merged
+
+    def total(self, op: str, key: str) -> int:
+        """
+        One operation counter, 0 if the operation never happened
+
+        Args:
+            op (str): Journal op
+            key (str): "count", "credited", "debited", or for batches "deposited" and "withdrawn"
+
+        Returns:
+            int: Counter value
+        """
+        return self.operations.get(op, {}).get(key, 0)
+
+    def report(self, n: typing.Optional[int] = None) -> typing.Dict[str, typing.Any]:
+        """
+        JSON-serializable summary, amounts in cents
+
+        total_deposits and total_withdrawals add the gross deposit and
+        withdraw rows of batches to the single-account operations. A batch
+        spanning partitions or shards is written as "set" legs without its
+        gross amounts, so it only appears under operations, as money
+        credited and debited.
+
+        Args:
+            n (typing.Optional[int], optional): Largest balances to list. Defaults to all tracked.
+
+        Returns:
+            typing.Dict[str, typing.Any]: Accounts, totals, operations and top balances
+        """
+        return {
+            "accounts": self.accounts,
+            "total_balance": self.total_balance,
+            "total_deposits": self.total("deposit", "credited") + self.total("batch", "deposited"),
+            "total_withdrawals": self.total("withdraw", "debited") + self.total("batch", "withdrawn"),
+            "operations": {op: dict(stats) for op, stats in sorted(self.operations.items())},
+            "top_balances": [{"username": username, "balance": balance} for username, balance in self.top.top(n)],
+        }
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "version": FORMAT_VERSION,
+            "accounts": self.accounts,
+            "total_balance": self.total_balance,
+            "operations": self.operations,
+            "top": self.top.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any]) -> "Aggregates":
+        aggregates = cls()
+        aggregates.accounts = data["accounts"]
+        aggregates.total_balance = data["total_balance"]
+        aggregates.operations = {op: dict(stats) for op, stats in data["operations"].items()}
+        aggregates.top = TopBalances.from_dict(data["top"])
+        return aggregates
+
+
+def save_aggregates(aggregates: Aggregates, path: str, snapshot: typing.Sequence[int]) -> None:
+    """
+    Atomically and durably write aggregates, tagged with the snapshot they describe
+
+    Args:
+        aggregates (Aggregates): Aggregates as of the snapshot
+        path (str): File to write
+        snapshot (typing.Sequence[int]): Signature of the snapshot file (mtime, size, inode)
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as aggregates_file:
+        json.dump({**aggregates.to_dict(), "snapshot": list(snapshot)}, aggregates_file)
+    replace_durably(tmp_path, path)
+
+
+def load_aggregates(path: str, snapshot: typing.Sequence[int]) -> typing.Optional[Aggregates]:
+    """
+    Saved aggregates, if they were written for this exact snapshot
+
+    Args:
+        path (str): File written by save_aggregates
+        snapshot (typing.Sequence[int]): Signature of the current snapshot file
+
+    Returns:
+        typing.Optional[Aggregates]: Aggregates, or None if missing, unreadable or for another snapshot
+    """
+    try:
+        with open(path) as aggregates_file:
+            data = json.load(aggregates_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable aggregates {path}: {e}")
+        return None
+    if data.get("version") != FORMAT_VERSION or data.get("snapshot") != list(snapshot):
+        return None
+    return Aggregates.from_dict(data)
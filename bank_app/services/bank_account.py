@@ -1,120 +1,279 @@
-import os
-import polars as pl
+import collections
+import datetime
 import logging
+import os
+import threading
+import typing
+from bank_app.services.history import DEFAULT_STATEMENT_LIMIT, HistoryEntry, HistoryStore, get_history
 from bank_app.services.users import User
+from bank_app.services.storage import BackendRef, StorageBackend, backends_generation, default_csv_path
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import format_cents, parse_amount
 
 logging.basicConfig(level=logging.INFO)
 
+# Account handles kept per process before the least recently used is dropped
+DEFAULT_HANDLE_CACHE_SIZE = int(os.environ.get("BANK_HANDLE_CACHE_SIZE", "100000"))
+
+
+def format_statement(entries: typing.List[HistoryEntry]) -> str:
+    """
+    Human readable statement, one line per entry
+
+    Args:
+        entries (typing.List[HistoryEntry]): Output of BankAccount.statement
+
+    Returns:
+        str: Date, type, counterparty, signed amount and resulting balance per line
+    """
+    if not entries:
+        return "No transactions"
+    lines = []
+    for entry in entries:
+        when = datetime.datetime.fromtimestamp(entry.ts).strftime("%Y-%m-%d %H:%M:%S")
+        if entry.type == "transfer":
+            detail = f"to {entry.destination}" if entry.amount < 0 else f"from {entry.source}"
+        else:
+            detail = ""
+        amount = format_cents(entry.amount) if entry.amount < 0 else f"+{format_cents(entry.amount)}"
+        lines.append(f"{when}  {entry.type:<8}  {detail:<20}  {amount:>12}  {format_cents(entry.balance):>12}")
+    return "\n".join(lines)
+
+
 class BankAccount:
-    def __init__(self, user: User):
+    def __init__(self, user: User, csv_path: typing.Optional[str] = None):
         self.user = user
-        self.csv_path = os.path.join(
-            os.getcwd(),"bank_app", "data", "bank_system.csv"
-        )
+        # Passing csv_path skips the os.getcwd() lookup in default_csv_path
+        self.csv_path = csv_path or default_csv_path()
+        self._backend = BackendRef()
                 
     @property
-    def balance(self) -> float:
+    def balance(self) -> int:
         """
         Simplify balance operations by using property decorator
         
         All setters + getters will interface with this balance property
         
         Balance can be updated with simple reassignment of value in 
-        class context.
+        class context. Balances are integer cents.
 
         Returns:
-            float: Balance in account
+            int: Balance in account, in cents
         """
         return self.read_balance_from_file()
     
     @balance.setter
-    def balance(self, new_balance: float):
+    def balance(self, new_balance: int):
         """
         This function dictates that a setter function will be called
         any time this self.balance attribute is being assigned
 
         Args:
-            new_balance (float): new balance to be set
+            new_balance (int): new balance to be set, in cents
         """
         self.write_balance_to_file(new_balance, self.user.username)
     
-    def read_balance_from_file(self) -> float:
+    @property
+    def storage(self) -> StorageBackend:
+        """
+        Shared storage backend for the CSV this account lives in
+        
+        Resolved once and reused, but reassigning csv_path still takes
+        effect immediately
+
+        Returns:
+            StorageBackend: Process-wide backend picked by BANK_STORAGE_BACKEND
+        """
+        return self._backend.resolve(self.csv_path)
+
+    @property
+    def history(self) -> HistoryStore:
+        """
+        Shared transaction history for the CSV this account lives in
+
+        Returns:
+            HistoryStore: Process-wide history store
+        """
+        return get_history(self.csv_path)
+    
+    @instrumented("account.read_balance_from_file")
+    def read_balance_from_file(self) -> int:
         """
-        Every operation will read the balance from file.
+        Reads the balance through the shared storage backend.
         
-        Not holding state within class context
+        With the default CSV backend the file is only parsed when it is
+        first loaded or was changed by another writer
 
         Raises:
             e: Exception
 
         Returns:
-            float: Balance from file
+            int: Balance from storage, in cents
         """
         try:
-            df = pl.read_csv(self.csv_path)
-            user_row = df.filter(df["Username"] == self.user.username)
-            if user_row.height != 0:
-                return float(user_row["Balance"][0])
+            return self.storage.get_balance(self.user.username)
         except Exception as e:
             logging.error(f"Error: {e}")
             raise e
         
-    def write_balance_to_file(self, new_balance: float, username: str) -> None:
+    @instrumented("account.write_balance_to_file")
+    def write_balance_to_file(self, new_balance: int, username: str) -> None:
         """
-        Overwrites balance for user in CSV File
+        Updates balance for user in the storage backend
 
         Args:
-            new_balance (float): new balance
+            new_balance (int): new balance in cents
             username (str): current user
 
         Raises:
             e: Error with write operation
         """
         try:
-            df = pl.read_csv(self.csv_path)
-            user_row = df.filter(df["Username"] == username)
-            if user_row.height != 0:
-                df = df.with_columns(
-                    (
-                        pl.when(pl.col("Username") == username)
-                            .then(pl.lit(new_balance))
-                            .otherwise(pl.col("Balance"))
-                        .alias("Balance")
-                    )
-                )
-                df.write_csv(self.csv_path)
+            self.storage.set_balance(username, new_balance)
         except Exception as e:
             logging.error(f"Error: {e}")
             raise e 
+    
+    @instrumented("account.flush")
+    def flush(self) -> None:
+        """
+        Make every completed balance update durable
+        """
+        self.storage.flush()
         
-    def deposit(self, amount: float) -> None:
+    @instrumented("account.deposit")
+    def deposit(self, amount: int) -> int:
         """
         Add amount to balance of current user
 
         Args:
-            amount (float): Any float value
+            amount (int): Amount in cents
 
         Raises:
             ValueError: Deposit can't be negative
+
+        Returns:
+            int: New balance in cents
         """
         if amount <= 0:
             raise ValueError("Deposit must be greater than 0")
-        self.balance += amount
+        balance = self.storage.apply_delta(self.user.username, amount, "deposit")
+        self.history.record(self.user.username, "deposit", amount, balance, destination=self.user.username)
+        return balance
 
-    def withdraw(self, amount: float) -> None:
+    @instrumented("account.withdraw")
+    def withdraw(self, amount: int) -> int:
         """
         Subtract amount from balance of current user
 
         Args:
-            amount (float): Any float value
+            amount (int): Amount in cents
 
         Raises:
-            ValueError: Can't withdraw more than balance
+            ValueError: Withdrawal must be positive, for an existing account and no more than balance
+
+        Returns:
+            int: New balance in cents
         """
-        if amount > self.balance:
+        if amount <= 0:
+            raise ValueError("Withdrawal must be greater than 0")
+        current = self.balance
+        if current is None:
+            raise ValueError(f"User {self.user.username} does not exist")
+        if amount > current:
             raise ValueError("Insufficient funds")
-        self.balance -= amount
-            
+        balance = self.storage.apply_delta(self.user.username, -amount, "withdraw")
+        self.history.record(self.user.username, "withdraw", -amount, balance, source=self.user.username)
+        return balance
+
+    @instrumented("account.statement")
+    def statement(
+        self,
+        limit: int = DEFAULT_STATEMENT_LIMIT,
+        start: typing.Optional[datetime.date] = None,
+        end: typing.Optional[datetime.date] = None,
+    ) -> typing.List[HistoryEntry]:
+        """
+        Past transactions of this account, oldest first
+
+        Args:
+            limit (int, optional): Most recent entries to return when no dates are given. Defaults to DEFAULT_STATEMENT_LIMIT.
+            start (typing.Optional[datetime.date], optional): First day to include instead. Defaults to None.
+            end (typing.Optional[datetime.date], optional): Last day to include, with start. Defaults to today.
+
+        Returns:
+            typing.List[HistoryEntry]: Matching history entries
+        """
+        if start is None:
+            return self.history.last(self.user.username, limit)
+        end = end or datetime.date.today()
+        # Local midnight at the start of `start` up to midnight after `end`
+        first = datetime.datetime.combine(start, datetime.time()).timestamp()
+        last = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time()).timestamp()
+        return self.history.between(self.user.username, first, last)
+
+
+class AccountRegistry:
+    """
+    Interned BankAccount handles, one per (csv path, username)
+
+    Sessions that look up the same counterparties over and over - transfer
+    recipients, server connections, benchmark workers - get the same
+    BankAccount back every time instead of building a User and BankAccount
+    (and resolving paths and the storage backend) per operation.
+
+    Handles carry no credentials or login state, only the username and
+    where the account lives, so one handle can safely be shared by every
+    session. The least recently used handle is dropped once `max_size` are
+    held, and all of them when the storage backends are closed.
+    """
+    def __init__(self, max_size: int = DEFAULT_HANDLE_CACHE_SIZE) -> None:
+        self.max_size = max(1, max_size)
+        self._accounts: "collections.OrderedDict[typing.Tuple[str, str], BankAccount]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._generation = backends_generation()
+
+    def account(self, username: str, csv_path: typing.Optional[str] = None) -> BankAccount:
+        """
+        Shared handle for an account
+
+        Args:
+            username (str): Account name, which doesn't have to exist yet
+            csv_path (typing.Optional[str], optional): Bank system CSV. Defaults to bank_app/data/bank_system.csv.
+
+        Returns:
+            BankAccount: The same object on every call until it is evicted
+        """
+        key = (csv_path or default_csv_path(), username)
+        with self._lock:
+            if self._generation != backends_generation():
+                self._accounts.clear()
+                self._generation = backends_generation()
+            account = self._accounts.get(key)
+            if account is not None:
+                self._accounts.move_to_end(key)
+                return account
+
+            account = BankAccount(User(username, csv_path=key[0]), key[0])
+            self._accounts[key] = account
+            if len(self._accounts) > self.max_size:
+                self._accounts.popitem(last=False)
+            return account
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+
+# Process-wide registry shared by the menu, the server and the benchmarks
+ACCOUNTS = AccountRegistry()
+
+
 class BankAccountService:
     def __init__(self, user, bank_account):
         """
@@ -131,7 +290,7 @@ class BankAccountService:
         """
         While loop to manage account operations
         
-        User inputs 1-5 to manage account
+        User inputs 1-6 to manage account
         
         Will update balance in CSV file after every transaction
         """
@@ -140,54 +299,84 @@ class BankAccountService:
         
         while True:
             try:
-                choice = input("\n1: Deposit\n2: Withdraw\n3: Transfer\n4: Check Balance\n5: Exit\n")
+                choice = input("\n1: Deposit\n2: Withdraw\n3: Transfer\n4: Check Balance\n5: Exit\n6: Statement\n")
                 
                 if choice == "1":
-                    amount = float(input("Enter the amount you want to deposit: "))
+                    amount = parse_amount(input("Enter the amount you want to deposit: "))
                     self.bank_account.deposit(amount)
-                    logging.info(f"Deposited {amount} into your account.")
-                    logging.info(f"Your new balance is: {self.bank_account.balance}")
+                    logging.info(f"Deposited {format_cents(amount)} into your account.")
+                    logging.info(f"Your new balance is: {format_cents(self.bank_account.balance)}")
                     
                 elif choice == "2":
-                    amount = float(input("Enter the amount you want to withdraw: "))
+                    amount = parse_amount(input("Enter the amount you want to withdraw: "))
                     self.bank_account.withdraw(amount)
-                    logging.info(f"Withdrew {amount} from your account.")
-                    logging.info(f"Your new balance is: {self.bank_account.balance}")
+                    logging.info(f"Withdrew {format_cents(amount)} from your account.")
+                    logging.info(f"Your new balance is: {format_cents(self.bank_account.balance)}")
                     
                 elif choice == "3":
                     recipient = input("Enter the username of the recipient: ")
-                    amount = float(input("Enter the amount you want to transfer: "))
+                    amount = parse_amount(input("Enter the amount you want to transfer: "))
                     
                     self.transfer(
                         self.bank_account, 
-                        BankAccount(User(recipient)), 
+                        ACCOUNTS.account(recipient, self.bank_account.csv_path), 
                         amount
                     )
                 elif choice == "4":
-                    logging.info(f"Your current balance is: {self.bank_account.balance}")
+                    logging.info(f"Your current balance is: {format_cents(self.bank_account.balance)}")
                     
                 elif choice == "5":
                     break
+
+                elif choice == "6":
+                    start = input("Enter a start date (YYYY-MM-DD) or leave blank for recent transactions: ")
+                    if start:
+                        end = input("Enter an end date (YYYY-MM-DD) or leave blank for today: ")
+                        entries = self.bank_account.statement(
+                            start=datetime.date.fromisoformat(start),
+                            end=datetime.date.fromisoformat(end) if end else None,
+                        )
+                    else:
+                        entries = self.bank_account.statement()
+                    logging.info(f"Statement:\n{format_statement(entries)}")
                 
             except Exception as e:
                 logging.error(f"Error: {e}")
                 logging.error("Please try again or exit the process with '5'")
+        
+        # Don't leave batched writes sitting in memory once the session ends
+        self.bank_account.flush()
                 
+    @instrumented("service.transfer")
     def transfer(
         self, 
         source_account: BankAccount, 
         recipient_account: BankAccount, 
-        amount: float
-    ) -> None:
+        amount: int
+    ) -> int:
         """
         Transfer amount from current user to recipient
+        
+        Both legs are applied by the storage backend in one all-or-nothing
+        write, so a failure can't take money out of one account without
+        putting it in the other
 
         Args:
             source_account (BankAccount): Source account
             recipient_account (BankAccount): Recipient account
-            amount (float): Amount to transfer
+            amount (int): Amount to transfer in cents
+
+        Returns:
+            int: New balance of the source account in cents
         """
-        source_account.withdraw(amount)
-        recipient_account.deposit(amount)
-        logging.info(f"Transferred {amount} to {recipient_account.user.username}.")
-        logging.info(f"Your new balance is: {source_account.balance}")
\ No newline at end of file
+        source_balance, recipient_balance = source_account.storage.transfer(
+            source_account.user.username, 
+            recipient_account.user.username, 
+            amount
+        )
+        source_account.history.record_transfer(
+            source_account.user.username, recipient_account.user.username, amount, source_balance, recipient_balance
+        )
+        logging.info(f"Transferred {format_cents(amount)} to {recipient_account.user.username}.")
+        logging.info(f"Your new balance is: {format_cents(source_balance)}")
+        return source_balance
\ No newline at end of file
@@ -0,0 +1,350 @@
+import decimal
+import logging
+import os
+import typing
+import polars as pl
+from bank_app.services.history import HistoryStore
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import parse_amount
+from bank_app.services.storage import StorageBackend
+
+logging.basicConfig(level=logging.INFO)
+
+TRANSACTION_TYPES = ["deposit", "withdraw", "transfer"]
+
+# Columns of a transaction file. Recipient is only used by transfers and
+# Amount is in whole units, as people write it - kept as text until it is
+# converted to cents with money.parse_amount's rules.
+TRANSACTION_SCHEMA = {
+    "Type": pl.datatypes.Utf8,
+    "Username": pl.datatypes.Utf8,
+    "Recipient": pl.datatypes.Utf8,
+    "Amount": pl.datatypes.Utf8,
+}
+
+# Largest amount in cents an Int64 column holds
+MAX_CENTS = 2 ** 63 - 1
+
+
+class BatchReport:
+    """
+    Outcome of one batch - what was committed and which rows were rejected
+    """
+    def __init__(
+        self,
+        total: int,
+        rejected: pl.DataFrame,
+        balances: typing.Dict[str, int],
+    ) -> None:
+        """
+        Args:
+            total (int): Rows in the batch
+            rejected (pl.DataFrame): Rejected rows with their Row number and Reason
+            balances (typing.Dict[str, int]): New balance in cents of every account the batch touched
+        """
+        self.total = total
+        self.rejected = rejected
+        self.balances = balances
+
+    @property
+    def accepted(self) -> int:
+        return self.total - self.rejected.height
+
+    def summary(self) -> str:
+        """
+        One-line human readable summary
+
+        Returns:
+            str: Counts of accepted and rejected rows
+        """
+        return (
+            f"Batch of {self.total} transactions: {self.accepted} applied, "
+            f"{self.rejected.height} rejected, {len(self.balances)} accounts updated"
+        )
+
+
+@instrumented("batch.load_transactions")
+def load_transactions(path: str) -> pl.DataFrame:
+    """
+    Read a CSV or JSONL transaction file
+
+    Args:
+        path (str): File with Type, Username, Recipient and Amount columns
+
+    Raises:
+        ValueError: Unsupported file extension
+
+    Returns:
+        pl.DataFrame: Transactions in file order
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        df = pl.read_csv(path, infer_schema_length=0)
+    elif extension in (".jsonl", ".ndjson", ".json"):
+        df = pl.read_ndjson(path)
+    else:
+        raise ValueError(f"Unsupported transaction file {path}, expected .csv or .jsonl")
+
+    if "Recipient" not in df.columns:
+        df = df.with_columns(pl.lit(None, dtype=pl.datatypes.Utf8).alias("Recipient"))
+    return df.select(
+        pl.col("Type").cast(pl.datatypes.Utf8).str.to_lowercase(),
+        pl.col("Username").cast(pl.datatypes.Utf8),
+        pl.col("Recipient").cast(pl.datatypes.Utf8),
+        # Parsed by _with_cents, unparseable amounts are rejected by validation
+        pl.col("Amount").cast(pl.datatypes.Utf8),
+    )
+
+
+def _parse_cents(amount: typing.Optional[str]) -> typing.Tuple[typing.Optional[int], typing.Optional[str]]:
+    """
+    Amount in cents, read by the same rules as money.parse_amount
+
+    Args:
+        amount (typing.Optional[str]): Amount as written in the file
+
+    Returns:
+        typing.Tuple[typing.Optional[int], typing.Optional[str]]: Cents, or None and the reason it was refused
+    """
+    if amount is None:
+        return None, "Amount must be greater than 0"
+    try:
+        value = decimal.Decimal(amount.strip())
+    except decimal.InvalidOperation:
+        return None, "Amount must be greater than 0"
+    if not value.is_finite():
+        return None, "Amount must be greater than 0"
+    try:
+        cents = parse_amount(value)
+    except ValueError:
+        return None, "Amount can't have fractions of a cent"
+    if abs(cents) > MAX_CENTS:
+        return None, "Amount is too large"
+    return cents, None
+
+
+def _with_cents(transactions: pl.DataFrame) -> pl.DataFrame:
+    """
+    Conversion of the Amount column to Int64 cents
+
+    Amounts are parsed one by one with parse_amount's Decimal rules, so
+    batches accept exactly what the CLI and the server do and never go
+    through binary floating point. Each distinct amount is parsed once.
+
+    Args:
+        transactions (pl.DataFrame): Transactions as read by load_transactions, with a Row column
+
+    Returns:
+        pl.DataFrame: transactions plus Cents and AmountError columns, AmountError null for a valid amount
+    """
+    transactions = transactions.with_columns(pl.col("Amount").cast(pl.datatypes.Utf8))
+    amounts = transactions["Amount"].unique().to_list()
+    cents, errors = zip(*map(_parse_cents, amounts)) if amounts else ((), ())
+    parsed = pl.DataFrame(
+        {"Amount": amounts, "Cents": cents, "AmountError": errors},
+        schema={"Amount": pl.datatypes.Utf8, "Cents": pl.datatypes.Int64, "AmountError": pl.datatypes.Utf8},
+    )
+    return transactions.join(parsed, on="Amount", how="left", join_nulls=True).sort("Row")
+
+
+def _validate(transactions: pl.DataFrame, known: pl.DataFrame) -> pl.DataFrame:
+    """
+    Vectorized checks that don't depend on transaction order
+
+    Args:
+        transactions (pl.DataFrame): Transactions with Row and Cents columns
+        known (pl.DataFrame): Username column of every account that exists
+
+    Returns:
+        pl.DataFrame: transactions plus a Reason column, null for valid rows
+    """
+    known_usernames = known["Username"]
+    return transactions.with_columns(
+        # is_in gives null for a null value, which when() treats as false, so
+        # missing fields are caught explicitly first
+        pl.when(pl.col("Type").is_null() | ~pl.col("Type").is_in(TRANSACTION_TYPES))
+            .then(pl.lit("Unknown transaction type"))
+        .when(pl.col("AmountError").is_not_null())
+            .then(pl.col("AmountError"))
+        .when(pl.col("Cents") <= 0)
+            .then(pl.lit("Amount must be greater than 0"))
+        .when(pl.col("Username").is_null() | (pl.col("Username").str.strip_chars() == ""))
+            .then(pl.lit("Account is required"))
+        .when(
+            (pl.col("Type") == "transfer")
+            & (pl.col("Recipient").is_null() | (pl.col("Recipient").str.strip_chars() == ""))
+        )
+            .then(pl.lit("Recipient is required"))
+        .when(~pl.col("Username").is_in(known_usernames))
+            .then(pl.lit("Unknown account"))
+        .when((pl.col("Type") == "transfer") & ~pl.col("Recipient").is_in(known_usernames))
+            .then(pl.lit("Unknown recipient"))
+        .when((pl.col("Type") == "transfer") & (pl.col("Recipient") == pl.col("Username")))
+            .then(pl.lit("Cannot transfer to the same account"))
+        .otherwise(pl.lit(None, dtype=pl.datatypes.Utf8))
+        .alias("Reason")
+    ).drop("AmountError")
+
+
+def _legs(transactions: pl.DataFrame) -> pl.DataFrame:
+    """
+    Split transactions into signed per-account balance changes
+
+    Args:
+        transactions (pl.DataFrame): Valid transactions with a Row column
+
+    Returns:
+        pl.DataFrame: Row, Username, Delta in cents - two legs per transfer, in Row order
+    """
+    debits = transactions.filter(pl.col("Type") != "deposit").select(
+        "Row", "Username", (-pl.col("Cents")).alias("Delta")
+    )
+    deposits = transactions.filter(pl.col("Type") == "deposit").select(
+        "Row", "Username", pl.col("Cents").alias("Delta")
+    )
+    credits = transactions.filter(pl.col("Type") == "transfer").select(
+        "Row", pl.col("Recipient").alias("Username"), pl.col("Cents").alias("Delta")
+    )
+    return pl.concat([debits, deposits, credits]).sort("Row", maintain_order=True)
+
+
+def _overdrafts_in_order(
+    transactions: pl.DataFrame, balances: typing.Dict[str, int]
+) -> typing.Set[int]:
+    """
+    Walk the batch in order, rejecting any debit that would overdraw
+
+    Only called when the vectorized check found an overdraft, since a
+    rejected row changes the running balance every later row sees.
+
+    Args:
+        transactions (pl.DataFrame): Valid transactions with a Row column
+        balances (typing.Dict[str, int]): Starting balances in cents, updated in place
+
+    Returns:
+        typing.Set[int]: Row numbers to reject
+    """
+    rejected = set()
+    for row, tx_type, username, recipient, amount in transactions.select(
+        "Row", "Type", "Username", "Recipient", "Cents"
+    ).iter_rows():
+        if tx_type == "deposit":
+            balances[username] += amount
+        elif amount > balances[username]:
+            rejected.add(row)
+        else:
+            balances[username] -= amount
+            if tx_type == "transfer":
+                balances[recipient] += amount
+    return rejected
+
+
+def _history_entries(
+    transactions: pl.DataFrame, legs: pl.DataFrame, starting: typing.Dict[str, typing.Optional[int]]
+) -> pl.DataFrame:
+    """
+    History rows for the accepted legs, with each account's balance after every leg
+
+    Args:
+        transactions (pl.DataFrame): Valid transactions with a Row column
+        legs (pl.DataFrame): Accepted legs from _legs, in Row order
+        starting (typing.Dict[str, typing.Optional[int]]): Balances before the batch
+
+    Returns:
+        pl.DataFrame: account, type, source, destination, amount, balance - the columns HistoryStore.record_many takes
+    """
+    parties = transactions.select(
+        "Row",
+        "Type",
+        pl.when(pl.col("Type") == "deposit").then(None).otherwise(pl.col("Username")).alias("Source"),
+        pl.when(pl.col("Type") == "withdraw").then(None)
+            .when(pl.col("Type") == "deposit").then(pl.col("Username"))
+            .otherwise(pl.col("Recipient"))
+        .alias("Destination"),
+    )
+    return legs.join(parties, on="Row", how="left").sort("Row", maintain_order=True).select(
+        "Username",
+        "Type",
+        "Source",
+        "Destination",
+        "Delta",
+        (
+            pl.col("Username").replace(starting, default=None, return_dtype=pl.Int64)
+            + pl.col("Delta").cum_sum().over("Username")
+        ).alias("Balance"),
+    )
+
+
+@instrumented("batch.apply_batch")
+def apply_batch(
+    storage: StorageBackend, transactions: pl.DataFrame, history: typing.Optional[HistoryStore] = None
+) -> BatchReport:
+    """
+    Validate, net and commit a batch of transactions in one write
+
+    Rows are validated with vectorized expressions, then overdrafts are
+    rejected in file order: a withdrawal or transfer is refused if it
+    would overdraw the account given every earlier accepted row. Accepted
+    rows are netted per account with a group-by and the net deltas are
+    committed with a single StorageBackend.apply_deltas call, along with
+    the gross amounts of the deposit and withdraw rows. Amounts are
+    converted to cents up front, so the netting and running balances are
+    all Int64 column arithmetic.
+
+    Args:
+        storage (StorageBackend): Account store to apply the batch to
+        transactions (pl.DataFrame): Output of load_transactions
+        history (typing.Optional[HistoryStore], optional): Store to record every accepted row in, in one bulk insert. Defaults to None.
+
+    Returns:
+        BatchReport: Rejected rows and resulting balances
+    """
+    transactions = _with_cents(transactions.with_row_index("Row"))
+
+    usernames = pl.concat([transactions["Username"], transactions["Recipient"]]).drop_nulls().unique()
+    starting = {username: storage.get_balance(username) for username in usernames.to_list()}
+    known = pl.DataFrame(
+        {"Username": [username for username, balance in starting.items() if balance is not None]},
+        schema={"Username": pl.datatypes.Utf8},
+    )
+
+    validated = _validate(transactions, known)
+    valid = validated.filter(pl.col("Reason").is_null()).drop("Reason")
+
+    # Fast path: if no account's running balance ever dips below zero,
+    # nothing is rejected for overdraft and no ordered walk is needed
+    legs = _legs(valid)
+    running = legs.with_columns(
+        (
+            pl.col("Username").replace(starting, default=None, return_dtype=pl.Int64)
+            + pl.col("Delta").cum_sum().over("Username")
+        ).alias("Running")
+    )
+    overdrawn: typing.Set[int] = set()
+    if running.height and running["Running"].min() < 0:
+        overdrawn = _overdrafts_in_order(
+            valid, {username: balance for username, balance in starting.items() if balance is not None}
+        )
+        legs = legs.filter(~pl.col("Row").is_in(list(overdrawn)))
+
+    deltas = legs.group_by("Username").agg(pl.col("Delta").sum())
+    accepted = valid.filter(~pl.col("Row").is_in(list(overdrawn)))
+    gross = {
+        "deposited": accepted.filter(pl.col("Type") == "deposit")["Cents"].sum(),
+        "withdrawn": accepted.filter(pl.col("Type") == "withdraw")["Cents"].sum(),
+    }
+    balances = storage.apply_deltas(dict(deltas.iter_rows()), gross) if deltas.height else {}
+    if history is not None and legs.height:
+        history.record_many(_history_entries(valid, legs, starting).iter_rows())
+        history.flush()
+
+    rejected = validated.with_columns(
+        pl.when(pl.col("Row").is_in(list(overdrawn)))
+            .then(pl.lit("Insufficient funds"))
+            .otherwise(pl.col("Reason"))
+        .alias("Reason")
+    ).filter(pl.col("Reason").is_not_null()).drop("Cents")
+
+    report = BatchReport(transactions.height, rejected, balances)
+    logging.info(report.summary())
+    return report
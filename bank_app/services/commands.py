@@ -0,0 +1,234 @@
+import json
+import logging
+import typing
+from bank_app.services.bank_account import ACCOUNTS, BankAccount, BankAccountService
+from bank_app.services.metrics import METRICS, instrumented
+from bank_app.services.money import format_cents, parse_amount
+from bank_app.services.storage import default_csv_path, get_backend
+from bank_app.services.users import User
+
+logging.basicConfig(level=logging.INFO)
+
+# Bytes of stdin taken per read in pipeline mode - every command in one read shares a flush
+PIPELINE_READ_BYTES = 64 * 1024
+
+# Longest request line accepted, by the server and in pipeline mode
+MAX_LINE_BYTES = 64 * 1024
+
+# Ledger records between fsyncs in pipeline mode. The pipeline flushes
+# before it answers each read's commands, so the ledger needn't sync on
+# its own as well.
+PIPELINE_FLUSH_EVERY = 1000000
+
+Operation = typing.Callable[..., typing.Dict[str, typing.Any]]
+
+
+def encode(response: typing.Dict[str, typing.Any]) -> bytes:
+    """
+    Serialize one response line
+
+    Args:
+        response (typing.Dict[str, typing.Any]): JSON-serializable response
+
+    Returns:
+        bytes: Compact JSON terminated by a newline
+    """
+    return (json.dumps(response, separators=(",", ":")) + "\n").encode()
+
+
+def dispatch(
+    operations: typing.Dict[str, Operation], request: typing.Any, *args: typing.Any, metric_prefix: str
+) -> typing.Dict[str, typing.Any]:
+    """
+    Run one decoded JSON request and turn the outcome into a response
+
+    Shared by every line-delimited JSON front-end. Errors never escape:
+    they come back as {"ok": false, "error": "..."}. The request's
+    optional id is echoed.
+
+    Args:
+        operations (typing.Dict[str, Operation]): op name -> handler returning the response fields
+        request (typing.Any): Decoded JSON line
+        args (typing.Any): Passed to the handler ahead of the request
+        metric_prefix (str): Handlers are timed as "<metric_prefix>.<op>"
+
+    Returns:
+        typing.Dict[str, typing.Any]: Response object
+    """
+    if not isinstance(request, dict):
+        return {"ok": False, "error": "Request must be a JSON object"}
+
+    response: typing.Dict[str, typing.Any]
+    operation = operations.get(request.get("op"))
+    if operation is None:
+        response = {"ok": False, "error": f"Unknown op {request.get('op')!r}"}
+    else:
+        with METRICS.timer(f"{metric_prefix}.{request['op']}"):
+            try:
+                response = {"ok": True, **operation(*args, request)}
+            except KeyError as e:
+                response = {"ok": False, "error": f"Missing field {e.args[0]!r}"}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+
+    if "id" in request:
+        response["id"] = request["id"]
+    return response
+
+
+class CommandRunner:
+    """
+    Scripted, non-interactive access to accounts by username
+
+    Backs the deposit, withdraw, transfer and create subcommands and the
+    pipeline mode. Like batch mode it acts on any account by name, with
+    no login: it's meant for automation that already has access to the
+    bank's files. Commands use the same JSON shapes as the server, e.g.
+    {"op": "deposit", "username": "Test", "amount": "10.50", "id": 1}
+    gets {"ok": true, "balance": "409.50", "id": 1}.
+
+    Every command goes through BankAccount and User, so they are recorded
+    in the transaction history and validated the same way as in the
+    interactive menu. The store is opened once and shared by every command.
+    """
+    def __init__(self, csv_path: typing.Optional[str] = None) -> None:
+        """
+        Args:
+            csv_path (typing.Optional[str], optional): Bank system CSV to operate on. Defaults to bank_app/data/bank_system.csv.
+        """
+        self.csv_path = csv_path or default_csv_path()
+        self.operations: typing.Dict[str, Operation] = {
+            "create": self.op_create,
+            "deposit": self.op_deposit,
+            "withdraw": self.op_withdraw,
+            "transfer": self.op_transfer,
+            "balance": self.op_balance,
+        }
+
+    def _account(self, username: typing.Any) -> BankAccount:
+        return ACCOUNTS.account(str(username), self.csv_path)
+
+    def op_create(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        user = User(str(request["username"]), str(request["password"]), csv_path=self.csv_path)
+        balance = parse_amount(request.get("balance", 0))
+        user.create(balance)
+        return {"username": user.username, "balance": format_cents(balance)}
+
+    def op_deposit(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        balance = self._account(request["username"]).deposit(parse_amount(request["amount"]))
+        return {"balance": format_cents(balance)}
+
+    def op_withdraw(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        balance = self._account(request["username"]).withdraw(parse_amount(request["amount"]))
+        return {"balance": format_cents(balance)}
+
+    def op_transfer(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        source = self._account(request["username"])
+        recipient = self._account(request["recipient"])
+        balance = BankAccountService(source.user, source).transfer(
+            source, recipient, parse_amount(request["amount"])
+        )
+        return {"balance": format_cents(balance)}
+
+    def op_balance(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        balance = self._account(request["username"]).balance
+        if balance is None:
+            raise ValueError(f"User {request['username']} does not exist")
+        return {"balance": format_cents(balance)}
+
+    def run(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        """
+        Run one command and let errors propagate - used by the single-command subcommands
+
+        Args:
+            request (typing.Dict[str, typing.Any]): Command with an op field
+
+        Raises:
+            ValueError: Unknown op, or the operation was rejected
+
+        Returns:
+            typing.Dict[str, typing.Any]: Response fields
+        """
+        operation = self.operations.get(request.get("op"))
+        if operation is None:
+            raise ValueError(f"Unknown op {request.get('op')!r}")
+        response = operation(request)
+        self.flush()
+        return response
+
+    def execute(self, request: typing.Any) -> typing.Dict[str, typing.Any]:
+        """
+        Run one decoded command, turning any error into an error response
+
+        Args:
+            request (typing.Any): Decoded JSON line
+
+        Returns:
+            typing.Dict[str, typing.Any]: Response object
+        """
+        return dispatch(self.operations, request, metric_prefix="command")
+
+    def flush(self) -> None:
+        """
+        Make every command run so far durable
+        """
+        get_backend(self.csv_path).flush()
+
+    @instrumented("command.pipeline")
+    def run_pipeline(self, input_file: typing.BinaryIO, output_file: typing.BinaryIO) -> int:
+        """
+        Run newline-delimited JSON commands from input_file until it ends, streaming one response line each
+
+        Commands are answered in order. Input is taken a read at a time,
+        up to PIPELINE_READ_BYTES of whatever has arrived, and every
+        command in a read shares one flush before its responses are
+        written. A response therefore means the command is durable, and a
+        piped file of commands costs one group commit per read instead of
+        one per command. A caller that sends one command and waits still
+        gets its response straight away. Blank lines are skipped.
+
+        Args:
+            input_file (typing.BinaryIO): Command lines, e.g. sys.stdin.buffer
+            output_file (typing.BinaryIO): Response lines, e.g. sys.stdout.buffer
+
+        Returns:
+            int: Number of commands answered
+        """
+        read = getattr(input_file, "read1", input_file.read)
+        answered = 0
+        pending = b""
+        # Set while skipping the rest of a line that was too long
+        discarding = False
+        while True:
+            data = read(PIPELINE_READ_BYTES)
+            lines = (pending + data).split(b"\n")
+            # Without more data the last piece is a final line with no newline
+            pending = lines.pop() if data else b""
+
+            responses = []
+            for line in lines:
+                if discarding:
+                    discarding = False
+                    continue
+                if line.strip():
+                    responses.append(encode(self._execute_line(line)))
+            if len(pending) > MAX_LINE_BYTES:
+                if not discarding:
+                    responses.append(encode({"ok": False, "error": "Request too long"}))
+                pending = b""
+                discarding = True
+
+            if responses:
+                self.flush()
+                output_file.write(b"".join(responses))
+                output_file.flush()
+                answered += len(responses)
+            if not data:
+                return answered
+
+    def _execute_line(self, line: bytes) -> typing.Dict[str, typing.Any]:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "Invalid JSON"}
+        return self.execute(request)
@@ -0,0 +1,134 @@
+import collections
+import logging
+import os
+import threading
+import time
+import typing
+
+logging.basicConfig(level=logging.INFO)
+
+# Most accounts kept in the credential cache. 0 turns the cache off.
+DEFAULT_CACHE_SIZE = int(os.environ.get("BANK_CREDENTIAL_CACHE_SIZE", "10000"))
+# Seconds a cached hash is trusted before storage is asked again. Bounds
+# how long a password changed by another process can go unnoticed.
+DEFAULT_CACHE_TTL = float(os.environ.get("BANK_CREDENTIAL_CACHE_TTL", "300"))
+
+
+class CredentialCache:
+    """
+    Bounded LRU cache of (csv path, username) -> password hash with a TTL
+
+    User.authorize checks here before going to storage, so repeated logins
+    and session re-validations don't touch the backend at all. Entries
+    are dropped least recently used first once `max_size` is reached, and
+    treated as missing once they are older than `ttl` seconds.
+
+    Anything that creates a user or changes a password must call
+    invalidate() for that account. Unknown usernames are never cached, so
+    a failed login can't hide an account created afterwards.
+    """
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "collections.OrderedDict[typing.Tuple[str, str], typing.Tuple[str, float]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, csv_path: str, username: str) -> typing.Optional[str]:
+        """
+        Cached password hash for an account
+
+        Args:
+            csv_path (str): Bank system CSV the account lives in
+            username (str): Account name
+
+        Returns:
+            typing.Optional[str]: Hash, or None on a miss
+        """
+        key = (csv_path, username)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, csv_path: str, username: str, password: str) -> None:
+        """
+        Remember an account's password hash, evicting the oldest entry if full
+
+        Args:
+            csv_path (str): Bank system CSV the account lives in
+            username (str): Account name
+            password (str): Password hash read from storage
+        """
+        if self.max_size <= 0:
+            return
+        key = (csv_path, username)
+        with self._lock:
+            self._entries[key] = (password, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, csv_path: str, username: str) -> None:
+        """
+        Forget an account - call after creating it or changing its password
+
+        Args:
+            csv_path (str): Bank system CSV the account lives in
+            username (str): Account name
+        """
+        with self._lock:
+            self._entries.pop((csv_path, username), None)
+
+    def clear(self) -> None:
+        """
+        Forget every account, e.g. when the backends are closed and files may be replaced
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def reset(self) -> None:
+        """
+        Forget every account and zero the stats
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        """
+        Hit/miss counters and occupancy
+
+        Returns:
+            typing.Dict[str, typing.Any]: JSON-serializable stats
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Process-wide cache shared by every User
+CREDENTIALS = CredentialCache()
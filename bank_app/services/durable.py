@@ -0,0 +1,67 @@
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+
+
+def fsync_file(path: str) -> None:
+    """
+    Flush a file's contents to disk
+
+    Args:
+        path (str): File to sync
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(path: str) -> None:
+    """
+    Flush the directory entry of a file that was just created, renamed or replaced
+
+    Without this a crash can forget the rename even though the file's
+    contents were synced. Platforms that can't open directories skip it.
+
+    Args:
+        path (str): File whose parent directory to sync
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def replace_file(tmp_path: str, path: str) -> None:
+    """
+    Atomically swap a fully written, synced file in for path
+
+    Args:
+        tmp_path (str): New file, already synced with fsync_file
+        path (str): File to replace
+    """
+    os.replace(tmp_path, path)
+    fsync_directory(path)
+
+
+def replace_durably(tmp_path: str, path: str) -> None:
+    """
+    Sync a freshly written file and atomically swap it in for path
+
+    After a crash path holds either the old contents or the complete
+    new ones, never a truncated mix.
+
+    Args:
+        tmp_path (str): New file beside path
+        path (str): File to replace
+    """
+    fsync_file(tmp_path)
+    replace_file(tmp_path, path)
@@ -0,0 +1,296 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+import typing
+from bank_app.services.metrics import instrumented
+
+logging.basicConfig(level=logging.INFO)
+
+# Entries buffered before they are written out in one transaction
+DEFAULT_HISTORY_BATCH = int(os.environ.get("BANK_HISTORY_BATCH", "256"))
+# Seconds between background flushes of the buffer, 0 to only flush from record(), queries and close()
+DEFAULT_HISTORY_FLUSH_INTERVAL = float(os.environ.get("BANK_HISTORY_FLUSH_INTERVAL", "1"))
+# Entries in a statement when no dates are given
+DEFAULT_STATEMENT_LIMIT = 10
+
+# One row per account a transaction touched, so every statement query
+# is a range scan of history_account_ts for a single account
+CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS history ("
+    "id INTEGER PRIMARY KEY, ts REAL NOT NULL, account TEXT NOT NULL, type TEXT NOT NULL, "
+    "source TEXT, destination TEXT, amount INTEGER NOT NULL, balance INTEGER NOT NULL)"
+)
+CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS history_account_ts ON history (account, ts, id)"
+INSERT_SQL = (
+    "INSERT INTO history (ts, account, type, source, destination, amount, balance) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+SELECT_LAST_SQL = (
+    "SELECT id, ts, account, type, source, destination, amount, balance FROM history "
+    "WHERE account = ? ORDER BY ts DESC, id DESC LIMIT ?"
+)
+SELECT_BETWEEN_SQL = (
+    "SELECT id, ts, account, type, source, destination, amount, balance FROM history "
+    "WHERE account = ? AND ts >= ? AND ts < ? ORDER BY ts, id"
+)
+
+
+def history_path_for(csv_path: str) -> str:
+    """
+    Transaction history database that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .history.sqlite file
+    """
+    return os.path.splitext(csv_path)[0] + ".history.sqlite"
+
+
+class HistoryEntry(typing.NamedTuple):
+    """
+    One account's side of a transaction - amount is the signed change to its balance in cents
+    """
+    id: int
+    ts: float
+    account: str
+    type: str
+    source: typing.Optional[str]
+    destination: typing.Optional[str]
+    amount: int
+    balance: int
+
+
+# account, type, source, destination, amount, balance - what callers hand to record_many()
+PendingEntry = typing.Tuple[str, str, typing.Optional[str], typing.Optional[str], int, int]
+
+
+class HistoryStore:
+    """
+    Append-only SQLite log of every deposit, withdrawal and transfer
+
+    Entries are buffered in memory and written with a single executemany
+    per batch, so recording history adds one INSERT transaction per
+    `batch_size` operations (or per `flush_interval` seconds, when a
+    background thread writes out whatever is buffered) rather than one per
+    operation. Queries flush the buffer first and so always see every
+    recorded entry.
+
+    Statements are answered from the (account, ts, id) index: the last N
+    entries are the last N index keys for the account, and a date range
+    is one contiguous index range, whatever the size of the table.
+
+    History is a record for people, not the source of truth for balances,
+    so entries still in the buffer when the process dies are lost. Set
+    BANK_HISTORY_BATCH=1 to write every entry as it happens.
+    """
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = DEFAULT_HISTORY_BATCH,
+        flush_interval: float = DEFAULT_HISTORY_FLUSH_INTERVAL,
+    ) -> None:
+        """
+        Args:
+            db_path (str): SQLite database path, created if missing
+            batch_size (int, optional): Entries buffered between writes. Defaults to BANK_HISTORY_BATCH.
+            flush_interval (float, optional): Most seconds an entry is buffered, 0 for no background flushes. Defaults to BANK_HISTORY_FLUSH_INTERVAL.
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(CREATE_TABLE_SQL)
+        self._conn.execute(CREATE_INDEX_SQL)
+        self._lock = threading.Lock()
+        self._buffer: typing.List[typing.Tuple[typing.Any, ...]] = []
+        self._oldest = 0.0
+        self._closed = threading.Event()
+        self._flusher: typing.Optional[threading.Thread] = None
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="history-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def record(
+        self,
+        account: str,
+        tx_type: str,
+        amount: int,
+        balance: int,
+        source: typing.Optional[str] = None,
+        destination: typing.Optional[str] = None,
+    ) -> None:
+        """
+        Record one account's side of a transaction
+
+        Args:
+            account (str): Account whose balance changed
+            tx_type (str): "deposit", "withdraw" or "transfer"
+            amount (int): Signed change to the balance in cents
+            balance (int): Balance afterwards in cents
+            source (typing.Optional[str], optional): Account money left. Defaults to None.
+            destination (typing.Optional[str], optional): Account money went to. Defaults to None.
+        """
+        self.record_many([(account, tx_type, source, destination, amount, balance)])
+
+    def record_transfer(
+        self, source: str, destination: str, amount: int, source_balance: int, destination_balance: int
+    ) -> None:
+        """
+        Record both sides of a transfer with the same timestamp
+
+        Args:
+            source (str): Account money left
+            destination (str): Account money went to
+            amount (int): Amount moved in cents
+            source_balance (int): Source balance afterwards
+            destination_balance (int): Destination balance afterwards
+        """
+        self.record_many([
+            (source, "transfer", source, destination, -amount, source_balance),
+            (destination, "transfer", source, destination, amount, destination_balance),
+        ])
+
+    @instrumented("history.record_many")
+    def record_many(self, entries: typing.Iterable[PendingEntry], ts: typing.Optional[float] = None) -> None:
+        """
+        Buffer entries sharing one timestamp, writing the buffer out if it is due
+
+        Args:
+            entries (typing.Iterable[PendingEntry]): (account, type, source, destination, amount, balance) tuples
+            ts (typing.Optional[float], optional): Unix time of the transactions. Defaults to now.
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend((ts, *entry) for entry in entries)
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._oldest >= self.flush_interval
+            )
+        if due:
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # The money has already moved - keep the entries and retry on the next write
+                logging.error(f"Error: {e}")
+
+    @instrumented("history.flush")
+    def flush(self) -> None:
+        """
+        Write every buffered entry in one transaction
+        """
+        with self._lock:
+            if not self._buffer:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(INSERT_SQL, self._buffer)
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                raise e
+            self._buffer.clear()
+
+    def _flush_periodically(self) -> None:
+        """
+        Background loop so buffered entries are written out even when no more arrive
+        """
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Error: {e}")
+
+    def _query(self, sql: str, params: typing.Tuple[typing.Any, ...]) -> typing.List[HistoryEntry]:
+        self.flush()
+        with self._lock:
+            return [HistoryEntry(*row) for row in self._conn.execute(sql, params)]
+
+    @instrumented("history.last")
+    def last(self, account: str, limit: int = DEFAULT_STATEMENT_LIMIT) -> typing.List[HistoryEntry]:
+        """
+        Most recent entries for an account, oldest first
+
+        Args:
+            account (str): Account name
+            limit (int, optional): Most entries to return. Defaults to DEFAULT_STATEMENT_LIMIT.
+
+        Returns:
+            typing.List[HistoryEntry]: Up to limit entries
+        """
+        return self._query(SELECT_LAST_SQL, (account, limit))[::-1]
+
+    @instrumented("history.between")
+    def between(self, account: str, start: float, end: float) -> typing.List[HistoryEntry]:
+        """
+        Entries for an account in a time range, oldest first
+
+        Args:
+            account (str): Account name
+            start (float): Unix time, inclusive
+            end (float): Unix time, exclusive
+
+        Returns:
+            typing.List[HistoryEntry]: Entries with start <= ts < end
+        """
+        return self._query(SELECT_BETWEEN_SQL, (account, start, end))
+
+    def close(self) -> None:
+        """
+        Stop the background flushes, write out the buffer and close the database
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._conn.close()
+
+
+_HISTORIES: typing.Dict[str, HistoryStore] = {}
+_HISTORIES_LOCK = threading.Lock()
+
+
+def get_history(csv_path: str) -> HistoryStore:
+    """
+    Shared history store for csv_path, opening it on first use
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        HistoryStore: Process-wide history for that file
+    """
+    key = os.path.abspath(csv_path)
+    with _HISTORIES_LOCK:
+        history = _HISTORIES.get(key)
+        if history is None:
+            history = _HISTORIES[key] = HistoryStore(history_path_for(key))
+        return history
+
+
+def close_histories() -> None:
+    """
+    Flush and close every open history store
+    """
+    with _HISTORIES_LOCK:
+        histories = list(_HISTORIES.values())
+        _HISTORIES.clear()
+    for history in histories:
+        try:
+            history.close()
+        except sqlite3.Error as e:
+            logging.error(f"Error: {e}")
+
+
+atexit.register(close_histories)
@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import threading
+import typing
+from bank_app.services.durable import replace_file
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import units_to_cents
+
+logging.basicConfig(level=logging.INFO)
+
+
+def journal_cents(balance: typing.Union[int, float]) -> int:
+    """
+    Balance from a journal record in cents
+
+    Records written since balances moved to cents hold ints. Older records
+    hold floats in whole units and are converted as they are replayed.
+
+    Args:
+        balance (typing.Union[int, float]): Balance as stored in the record
+
+    Returns:
+        int: Balance in cents
+    """
+    return units_to_cents(balance) if isinstance(balance, float) else balance
+
+
+class Journal:
+    """
+    Append-only JSONL write-ahead log of ledger transactions
+
+    Each committed operation is one small line appended to the file, so a
+    deposit costs O(1) I/O instead of rewriting the whole account table.
+
+    Durability uses group commit: append() returns a log sequence number and
+    sync() fsyncs everything appended so far. Threads that arrive while
+    another thread is fsyncing wait for it and usually find their record
+    already covered, so N concurrent commits share one fsync.
+    """
+    def __init__(self, path: str, sync_every: int = 1) -> None:
+        """
+        Args:
+            path (str): Journal file path, created if missing
+            sync_every (int, optional): Records appended between automatic fsyncs. Defaults to 1.
+        """
+        self.path = path
+        self.sync_every = max(1, sync_every)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._appended_lsn = 0
+        self._synced_lsn = 0
+
+    @instrumented("journal.append")
+    def append(self, record: typing.Dict[str, typing.Any]) -> int:
+        """
+        Append a single record
+
+        The whole line goes out in one O_APPEND write so concurrent
+        appenders never interleave within a record.
+
+        Args:
+            record (typing.Dict[str, typing.Any]): JSON-serializable transaction record
+
+        Returns:
+            int: Log sequence number of the record
+        """
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self._append_lock:
+            os.write(self._fd, line)
+            self._appended_lsn += 1
+            return self._appended_lsn
+
+    def maybe_sync(self, lsn: int) -> None:
+        """
+        Fsync if at least sync_every records are waiting
+
+        Args:
+            lsn (int): Sequence number the caller just appended
+        """
+        if lsn - self._synced_lsn >= self.sync_every:
+            self.sync(lsn)
+
+    @instrumented("journal.sync")
+    def sync(self, lsn: typing.Optional[int] = None) -> None:
+        """
+        Make every record up to lsn durable
+
+        Args:
+            lsn (typing.Optional[int], optional): Sequence number to wait for. Defaults to everything appended.
+        """
+        target = self._appended_lsn if lsn is None else lsn
+        if self._synced_lsn >= target:
+            return
+        with self._sync_lock:
+            # Another thread's fsync may have covered us while we waited
+            if self._synced_lsn >= target:
+                return
+            upto = self._appended_lsn
+            os.fsync(self._fd)
+            self._synced_lsn = upto
+
+    def size(self) -> int:
+        """
+        Current length of the journal file we have open
+
+        Returns:
+            int: Size in bytes
+        """
+        return os.fstat(self._fd).st_size
+
+    @instrumented("journal.read_from")
+    def read_from(self, offset: int) -> typing.Tuple[typing.List[typing.Dict[str, typing.Any]], int]:
+        """
+        Read every complete record appended after offset
+
+        Used to pick up records other processes appended. A line that is
+        still being written is left for the next call.
+
+        Args:
+            offset (int): Byte offset to start from
+
+        Returns:
+            typing.Tuple[typing.List[typing.Dict[str, typing.Any]], int]: Records and the offset just past them
+        """
+        with open(self.path, "rb") as journal_file:
+            journal_file.seek(offset)
+            data = journal_file.read()
+        end = data.rfind(b"\n") + 1
+        records = []
+        position = offset
+        for line in data[:end].splitlines(keepends=True):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning(f"Ignoring corrupt record at offset {position} of {self.path}")
+            position += len(line)
+        return records, offset + end
+
+    def replay(self) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        """
+        Yield every complete record in the journal, oldest first
+
+        A torn final line left by a crash mid-append is skipped.
+
+        Returns:
+            typing.Iterator[typing.Dict[str, typing.Any]]: Transaction records
+        """
+        with open(self.path, "rb") as journal_file:
+            position = 0
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    logging.warning(f"Ignoring torn record at offset {position} of {self.path}")
+                    break
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f"Ignoring corrupt record at offset {position} of {self.path}")
+                position += len(line)
+
+    def torn(self) -> bool:
+        """
+        Whether the file ends part way through a line, as a crash mid-append leaves it
+
+        Returns:
+            bool: True if the last byte isn't a newline
+        """
+        with open(self.path, "rb") as journal_file:
+            journal_file.seek(0, os.SEEK_END)
+            if journal_file.tell() == 0:
+                return False
+            journal_file.seek(-1, os.SEEK_END)
+            return journal_file.read(1) != b"\n"
+
+    def truncate_torn_tail(self) -> int:
+        """
+        Cut a torn final line off the file
+
+        Left in place, the next record appended would be glued onto it and
+        read back as one corrupt line, losing a committed record. The
+        caller must keep every appender out while it runs.
+
+        Returns:
+            int: Bytes removed
+        """
+        with self._append_lock, open(self.path, "rb") as journal_file:
+            size = journal_file.seek(0, os.SEEK_END)
+            keep = size
+            while keep > 0:
+                start = max(0, keep - 65536)
+                journal_file.seek(start)
+                chunk = journal_file.read(keep - start)
+                if keep == size and chunk.endswith(b"\n"):
+                    return 0
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                keep = start
+            os.ftruncate(self._fd, keep)
+            os.fsync(self._fd)
+        logging.warning(f"Truncated torn record at offset {keep} of {self.path}")
+        return size - keep
+
+    def replaced_on_disk(self) -> bool:
+        """
+        Whether another process rotated the journal since we opened it
+
+        Returns:
+            bool: True if the path now points at a different file
+        """
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def reopen(self) -> None:
+        """
+        Switch to whatever file is at self.path now
+        """
+        with self._append_lock, self._sync_lock:
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._synced_lsn = self._appended_lsn
+
+    @instrumented("journal.rotate")
+    def rotate(self, carry_from: typing.Optional[int] = None) -> int:
+        """
+        Swap in a new journal - called once records are folded into a snapshot
+
+        The new file replaces the old one atomically, so other processes
+        still appending to the old inode can notice via replaced_on_disk().
+        The caller must keep every appender out while it runs.
+
+        Args:
+            carry_from (typing.Optional[int], optional): Byte offset of the first record the snapshot doesn't include. Records from there on are copied into the new journal. Defaults to None, an empty journal.
+
+        Returns:
+            int: Number of records carried over
+        """
+        tail = b""
+        if carry_from is not None:
+            with open(self.path, "rb") as journal_file:
+                journal_file.seek(carry_from)
+                tail = journal_file.read()
+            # A torn final line is dropped, as replay() would skip it anyway
+            tail = tail[:tail.rfind(b"\n") + 1]
+        tmp_path = f"{self.path}.tmp"
+        tmp_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if tail:
+                os.write(tmp_fd, tail)
+            os.fsync(tmp_fd)
+        finally:
+            os.close(tmp_fd)
+        replace_file(tmp_path, self.path)
+        self.reopen()
+        return tail.count(b"\n")
+
+    def close(self) -> None:
+        """
+        Sync outstanding records and release the file descriptor
+        """
+        self.sync()
+        os.close(self._fd)
@@ -0,0 +1,778 @@
+import contextlib
+import logging
+import os
+import threading
+import typing
+import polars as pl
+from bank_app.services.account_cache import cache_path_for, write_cache
+from bank_app.services.aggregates import (
+    DEFAULT_TOP_N,
+    Aggregates,
+    TopBalances,
+    aggregates_path_for,
+    load_aggregates,
+    save_aggregates,
+)
+from bank_app.services.durable import replace_file
+from bank_app.services.journal import Journal, journal_cents
+from bank_app.services.loader import ACCOUNT_SCHEMA
+from bank_app.services.locks import get_lock_manager, lock_path_for
+from bank_app.services.metrics import METRICS, instrumented
+from bank_app.services.paths import DEFAULT_SNAPSHOT_FORMAT, journal_path_for, snapshot_path_for
+from bank_app.services.snapshot import (
+    convert_legacy_snapshots,
+    is_legacy_snapshot,
+    migrate_csv_to_ipc,
+    read_snapshot,
+    stage_snapshot,
+)
+from bank_app.services.storage import DEFAULT_SCAN_BATCH, StorageBackend, UserRecord, validate_deltas, validate_transfer
+
+logging.basicConfig(level=logging.INFO)
+
+# Journal records / seconds between fsyncs (group commit).
+# Defaults keep the CLI behaviour of one durable write per transaction.
+DEFAULT_FLUSH_EVERY = int(os.environ.get("BANK_LEDGER_FLUSH_EVERY", "1"))
+DEFAULT_FLUSH_INTERVAL = float(os.environ.get("BANK_LEDGER_FLUSH_INTERVAL", "0"))
+# Journal records between compactions back into the CSV snapshot
+DEFAULT_COMPACT_EVERY = int(os.environ.get("BANK_LEDGER_COMPACT_EVERY", "1000"))
+# Seconds between background checkpoints. 0 compacts inline on the commit
+# that reaches compact_every instead, with no background thread.
+DEFAULT_CHECKPOINT_INTERVAL = float(os.environ.get("BANK_CHECKPOINT_INTERVAL", "30"))
+
+
+class Ledger(StorageBackend):
+    """
+    CSV storage backend - process-wide in-memory view of the bank system CSV
+
+    State is the CSV snapshot plus an append-only journal of every
+    transaction since the snapshot was written. On load the snapshot is
+    parsed once into column lists plus a Username -> row offset hash index
+    and the journal is replayed on top of it.
+
+    Every deposit, withdrawal or new user appends one small journal record
+    instead of rewriting the table. Records are fsynced in groups of
+    `flush_every` (or every `flush_interval` seconds) and folded back into
+    the snapshot by a background checkpoint thread every
+    `checkpoint_interval` seconds, or sooner once `compact_every` records
+    have built up. close() only fsyncs the journal, the next process to
+    open the files folds it in. Commits never wait for a snapshot to be
+    written; with checkpoint_interval=0 the commit that reaches
+    compact_every compacts inline instead.
+
+    The snapshot is the CSV itself by default. With snapshot_format="ipc"
+    (BANK_SNAPSHOT_FORMAT=ipc) it is an Arrow IPC file next to the CSV,
+    created from the CSV on first use and read back memory-mapped. The CSV
+    is then left alone; use snapshot.export_csv to refresh it.
+
+    If the snapshot has an account cache (see account_cache.cached_user),
+    each checkpoint rewrites it from the same copy of the columns, so
+    one-shot lookups keep finding it current.
+
+    Balances are integer cents throughout: in memory, in the journal and
+    in the snapshot's BalanceCents column. Files from before the switch
+    are converted once, on first open.
+
+    Several processes can share the same files. Every write holds the
+    LockManager locks for the accounts it touches, then catches up on
+    records other processes appended to the journal before reading any
+    balance, so read-modify-write never works from stale state.
+
+    Use storage.get_backend() rather than constructing this directly so every
+    User and BankAccount in the process shares the same instance per CSV file.
+    """
+    def __init__(
+        self,
+        csv_path: str,
+        flush_every: int = DEFAULT_FLUSH_EVERY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        snapshot_format: str = DEFAULT_SNAPSHOT_FORMAT,
+        checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    ) -> None:
+        self.csv_path = csv_path
+        self.snapshot_format = snapshot_format
+        self.snapshot_path = snapshot_path_for(csv_path, snapshot_format)
+        self.aggregates_path = aggregates_path_for(self.snapshot_path)
+        self.cache_path = cache_path_for(self.snapshot_path)
+        self.flush_interval = flush_interval
+        self.compact_every = max(1, compact_every)
+        self.checkpoint_interval = checkpoint_interval
+
+        # Guards the in-memory structures. Only ever held for in-memory
+        # work plus one journal append - never while waiting on another
+        # process, which is what the per-account locks are for.
+        self._lock = threading.RLock()
+        self._usernames: typing.List[str] = []
+        self._passwords: typing.List[str] = []
+        self._balances: typing.List[int] = []
+        self._index: typing.Dict[str, int] = {}
+        self._aggregates = Aggregates()
+        self._journal_records = 0
+        self._journal_offset = 0
+        self._signature: typing.Optional[typing.Tuple[int, int, int]] = None
+        self._closed = threading.Event()
+        self._flusher: typing.Optional[threading.Thread] = None
+        self._checkpointer: typing.Optional[threading.Thread] = None
+        self._checkpoint_due = threading.Event()
+        # One checkpoint at a time in this process
+        self._checkpoint_lock = threading.Lock()
+        # Bumped by every load(), so a checkpoint can tell the state it copied was replaced
+        self._loads = 0
+
+        self.locks = get_lock_manager(lock_path_for(csv_path))
+        self.journal = Journal(journal_path_for(csv_path), sync_every=flush_every)
+        if self.journal.torn():
+            # Appends are made holding the account locks, so none can be half written under exclusive
+            with self.locks.exclusive():
+                if self.journal.torn():
+                    self.journal.truncate_torn_tail()
+        if snapshot_format == "ipc" or is_legacy_snapshot(csv_path, "csv"):
+            with self.locks.exclusive():
+                convert_legacy_snapshots(csv_path)
+                if snapshot_format == "ipc":
+                    migrate_csv_to_ipc(csv_path)
+        with self.locks.accounts():
+            self.load()
+
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="ledger-flusher", daemon=True
+            )
+            self._flusher.start()
+        if self.checkpoint_interval > 0:
+            self._checkpointer = threading.Thread(
+                target=self._checkpoint_periodically, name="ledger-checkpointer", daemon=True
+            )
+            self._checkpointer.start()
+
+    def _file_signature(self) -> typing.Tuple[int, int, int]:
+        """
+        Cheap fingerprint used to notice snapshot writes made behind our back
+
+        Returns:
+            typing.Tuple[int, int, int]: mtime (ns), size and inode of the snapshot
+        """
+        stat = os.stat(self.snapshot_path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @instrumented("ledger.load")
+    def load(self) -> None:
+        """
+        Read the snapshot, rebuild the Username index and replay the journal
+
+        If a username appears more than once the first row wins, same as
+        the old filter()[0] lookups did.
+
+        Raises:
+            e: Error reading the snapshot or journal
+        """
+        try:
+            with self._lock:
+                with METRICS.timer("ledger.load.read_snapshot"):
+                    df = read_snapshot(self.snapshot_path, self.snapshot_format)
+                with METRICS.timer("ledger.load.to_lists"):
+                    self._usernames = df["Username"].to_list()
+                    self._passwords = df["Password"].to_list()
+                    self._balances = df["BalanceCents"].to_list()
+                # Zipping in reverse lets earlier rows overwrite later duplicates
+                self._index = dict(
+                    zip(reversed(self._usernames), range(len(self._usernames) - 1, -1, -1))
+                )
+                if len(self._index) != len(self._usernames):
+                    logging.warning(f"Duplicate usernames found in {self.snapshot_path}")
+                self._signature = self._file_signature()
+                self._loads += 1
+                self._load_aggregates()
+
+                records, self._journal_offset = self.journal.read_from(0)
+                with METRICS.timer("ledger.load.replay"):
+                    for record in records:
+                        self._apply_record(record)
+                self._journal_records = len(records)
+                METRICS.increment("ledger.replayed_records", len(records))
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            raise e
+
+    def _load_aggregates(self) -> None:
+        """
+        Aggregates saved with the snapshot, or recomputed from it if there are none
+        """
+        aggregates = load_aggregates(self.aggregates_path, self._signature)
+        if aggregates is None:
+            balances = [self._balances[row] for row in self._index.values()]
+            aggregates = Aggregates.from_balances(list(self._index), balances)
+        elif aggregates.top.n != DEFAULT_TOP_N:
+            top = TopBalances(DEFAULT_TOP_N)
+            top.rebuild((username, self._balances[row]) for username, row in self._index.items())
+            aggregates.top = top
+        self._aggregates = aggregates
+
+    def _apply_record(self, record: typing.Dict[str, typing.Any]) -> None:
+        """
+        Apply one journal record to the in-memory state
+
+        Records carry resulting balances rather than deltas, so replaying a
+        record that is already reflected in the snapshot is harmless.
+
+        Args:
+            record (typing.Dict[str, typing.Any]): Journal record
+        """
+        op = record["op"]
+        if op == "create":
+            if record["user"] not in self._index:
+                self._append_row(record["user"], record["password"], journal_cents(record["balance"]))
+        elif op == "create_many":
+            for username, password, balance in record["users"]:
+                if username not in self._index:
+                    self._append_row(username, password, journal_cents(balance))
+        elif op in ("deposit", "withdraw", "set"):
+            self._set_balances(op, {record["user"]: journal_cents(record["balance"])})
+        elif op == "password":
+            row = self._index.get(record["user"])
+            if row is not None:
+                self._passwords[row] = record["password"]
+        elif op == "batch":
+            self._set_balances(
+                op,
+                {username: journal_cents(balance) for username, balance in record["balances"].items()},
+                record.get("gross"),
+            )
+        elif op == "transfer":
+            self._set_balances(
+                op,
+                {
+                    record["from"]: journal_cents(record["from_balance"]),
+                    record["to"]: journal_cents(record["to_balance"]),
+                },
+            )
+        else:
+            logging.warning(f"Unknown journal op {op!r} skipped")
+
+    def _set_balances(
+        self, op: str, balances: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> None:
+        """
+        Overwrite the balances of existing accounts and update the aggregates
+
+        Unknown usernames are skipped
+
+        Args:
+            op (str): Journal op making the change
+            balances (typing.Dict[str, int]): Username -> new balance
+            gross (typing.Optional[typing.Dict[str, int]], optional): Gross amounts of a batch, see Aggregates.record. Defaults to None.
+        """
+        changes = []
+        for username, balance in balances.items():
+            row = self._index.get(username)
+            if row is not None:
+                changes.append((username, self._balances[row], balance))
+                self._balances[row] = balance
+        self._aggregates.record(op, changes, gross)
+
+    def _append_row(self, username: str, password: str, balance: int) -> None:
+        self._index[username] = len(self._usernames)
+        self._usernames.append(username)
+        self._passwords.append(password)
+        self._balances.append(int(balance))
+        self._aggregates.record("create", [(username, None, int(balance))])
+
+    @instrumented("ledger.refresh")
+    def refresh(self) -> None:
+        """
+        Catch up with everything other processes committed since we last looked
+
+        A replaced snapshot or rotated journal (another process compacted,
+        or someone edited the CSV) means a full reload. Otherwise only the
+        records appended to the journal past our offset are applied.
+        """
+        with self._lock:
+            if self.journal.replaced_on_disk():
+                self.journal.reopen()
+                self.load()
+            elif self._file_signature() != self._signature:
+                self.load()
+            elif self.journal.size() > self._journal_offset:
+                records, self._journal_offset = self.journal.read_from(self._journal_offset)
+                for record in records:
+                    self._apply_record(record)
+                self._journal_records += len(records)
+
+    def _log(self, record: typing.Dict[str, typing.Any]) -> int:
+        """
+        Append to the journal
+
+        Caller holds self._lock and has just called refresh(), so if the
+        journal grew by exactly our record nobody else appended in between
+        and our offset can skip it instead of re-reading it later.
+
+        Args:
+            record (typing.Dict[str, typing.Any]): Journal record
+
+        Returns:
+            int: Log sequence number to pass to _after_commit
+        """
+        size_before = self.journal.size()
+        lsn = self.journal.append(record)
+        self._journal_records += 1
+        if size_before == self._journal_offset:
+            self._journal_offset = self.journal.size()
+        return lsn
+
+    def _after_commit(self, lsn: int) -> None:
+        """
+        Group-commit fsync and compaction, once every lock is released
+
+        Args:
+            lsn (int): Sequence number returned by _log
+        """
+        self.journal.maybe_sync(lsn)
+        if self._journal_records >= self.compact_every:
+            if self._checkpointer is not None:
+                self._checkpoint_due.set()
+            else:
+                self.compact()
+
+    @instrumented("ledger.get_user")
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        """
+        Row for username served from memory
+
+        Args:
+            username (str): Account to look up
+
+        Returns:
+            typing.Optional[UserRecord]: Row, or None if the user does not exist
+        """
+        with self._lock:
+            self.refresh()
+            row = self._index.get(username)
+            if row is None:
+                return None
+            return UserRecord(username, self._passwords[row], self._balances[row])
+
+    @instrumented("ledger.get_balance")
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        """
+        Balance for username served from memory
+
+        Args:
+            username (str): Account to look up
+
+        Returns:
+            typing.Optional[int]: Balance, or None if the user does not exist
+        """
+        with self._lock:
+            self.refresh()
+            row = self._index.get(username)
+            return self._balances[row] if row is not None else None
+
+    @instrumented("ledger.set_balance")
+    def set_balance(self, username: str, new_balance: int) -> None:
+        """
+        Overwrite balance and journal it
+
+        Unknown usernames are ignored, matching the old CSV behaviour.
+
+        Args:
+            username (str): Account to update
+            new_balance (int): New balance
+        """
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            row = self._index.get(username)
+            if row is None:
+                return
+            self._set_balances("set", {username: int(new_balance)})
+            lsn = self._log({"op": "set", "user": username, "balance": self._balances[row]})
+        self._after_commit(lsn)
+
+    @contextlib.contextmanager
+    def hold(self) -> typing.Iterator[None]:
+        """
+        Keep the in-memory view current and private across several calls
+
+        For stores that coordinate writes across more than one ledger. The
+        caller must already hold self.locks.accounts() for every account it
+        will write. Inside the block, read with get_balance() and write with
+        set_held(); the normal write methods would take those locks again.
+
+        Returns:
+            typing.Iterator[None]: Context manager
+        """
+        with self._lock:
+            self.refresh()
+            yield
+
+    def set_held(self, username: str, new_balance: int, txn: str) -> None:
+        """
+        Overwrite a balance inside hold() and journal it with a transaction id
+
+        Not synced: call flush() once every leg of the transaction is written
+
+        Args:
+            username (str): Existing account to update
+            new_balance (int): New balance
+            txn (str): Id of the coordinating transaction
+        """
+        self._set_balances("set", {username: int(new_balance)})
+        self._log({"op": "set", "user": username, "balance": int(new_balance), "txn": txn})
+
+    @instrumented("ledger.apply_delta")
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        """
+        Add delta to a balance and journal the operation
+
+        Args:
+            username (str): Account to update
+            delta (int): Signed amount to add
+            op (str): Journal op name - "deposit" or "withdraw"
+
+        Raises:
+            ValueError: Unknown username or a debit that would overdraw
+
+        Returns:
+            int: Resulting balance
+        """
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            row = self._index.get(username)
+            validate_deltas(
+                {username: delta}, {username: self._balances[row] if row is not None else None}
+            )
+            new_balance = self._balances[row] + delta
+            self._set_balances(op, {username: new_balance})
+            lsn = self._log(
+                {"op": op, "user": username, "amount": abs(delta), "balance": new_balance}
+            )
+        self._after_commit(lsn)
+        return new_balance
+
+    @instrumented("ledger.transfer")
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        """
+        Apply both legs of a transfer and journal them as a single record
+
+        Args:
+            source (str): Username sending money
+            recipient (str): Username receiving money
+            amount (int): Amount to move
+
+        Raises:
+            ValueError: See validate_transfer
+
+        Returns:
+            typing.Tuple[int, int]: New source and recipient balances
+        """
+        with self.locks.accounts(source, recipient), self._lock:
+            self.refresh()
+            source_row = self._index.get(source)
+            recipient_row = self._index.get(recipient)
+            validate_transfer(
+                source,
+                recipient,
+                amount,
+                self._balances[source_row] if source_row is not None else None,
+                self._balances[recipient_row] if recipient_row is not None else None,
+            )
+            source_balance = self._balances[source_row] - amount
+            recipient_balance = self._balances[recipient_row] + amount
+            self._set_balances("transfer", {source: source_balance, recipient: recipient_balance})
+            lsn = self._log(
+                {
+                    "op": "transfer",
+                    "from": source,
+                    "to": recipient,
+                    "amount": amount,
+                    "from_balance": source_balance,
+                    "to_balance": recipient_balance,
+                }
+            )
+        self._after_commit(lsn)
+        return source_balance, recipient_balance
+
+    @instrumented("ledger.apply_deltas")
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        """
+        Apply net deltas for many accounts and journal them as a single record
+
+        Args:
+            deltas (typing.Dict[str, int]): Username -> signed amount to add
+            gross (typing.Optional[typing.Dict[str, int]], optional): Cents "deposited" and "withdrawn" before netting, journaled with the balances and counted in the aggregates. Defaults to None.
+
+        Raises:
+            ValueError: See validate_deltas
+
+        Returns:
+            typing.Dict[str, int]: Username -> resulting balance
+        """
+        with self.locks.accounts(*deltas), self._lock:
+            self.refresh()
+            rows = {username: self._index.get(username) for username in deltas}
+            validate_deltas(
+                deltas,
+                {
+                    username: self._balances[row] if row is not None else None
+                    for username, row in rows.items()
+                },
+            )
+            balances = {username: self._balances[rows[username]] + delta for username, delta in deltas.items()}
+            self._set_balances("batch", balances, gross)
+            record: typing.Dict[str, typing.Any] = {"op": "batch", "balances": balances}
+            if gross:
+                record["gross"] = gross
+            lsn = self._log(record)
+        self._after_commit(lsn)
+        return balances
+
+    @instrumented("ledger.create_user")
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        """
+        Append a new row, add it to the index and journal it
+
+        Args:
+            username (str): New username
+            password (str): Hashed password
+            balance (int): Starting balance
+
+        Raises:
+            ValueError: Existing username
+        """
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            if username in self._index:
+                raise ValueError("Username already exists")
+            self._append_row(username, password, balance)
+            lsn = self._log(
+                {"op": "create", "user": username, "password": password, "balance": int(balance)}
+            )
+        self._after_commit(lsn)
+
+    @instrumented("ledger.create_users")
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        """
+        Append every new row and journal them as a single record
+
+        Args:
+            users (typing.Sequence[UserRecord]): New accounts with hashed passwords, no repeated usernames
+
+        Returns:
+            typing.List[str]: Usernames created, existing ones are skipped
+        """
+        if not users:
+            return []
+        with self.locks.accounts(*(user.username for user in users)), self._lock:
+            self.refresh()
+            new_users = [user for user in users if user.username not in self._index]
+            if not new_users:
+                return []
+            for username, password, balance in new_users:
+                self._append_row(username, password, balance)
+            lsn = self._log({
+                "op": "create_many",
+                "users": [[username, password, int(balance)] for username, password, balance in new_users],
+            })
+        self._after_commit(lsn)
+        return [user.username for user in new_users]
+
+    @instrumented("ledger.set_password")
+    def set_password(self, username: str, password: str) -> None:
+        """
+        Replace a password hash and journal it
+
+        Args:
+            username (str): Account to update, unknown usernames are ignored
+            password (str): New password hash
+        """
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            row = self._index.get(username)
+            if row is None:
+                return
+            self._passwords[row] = password
+            lsn = self._log({"op": "password", "user": username, "password": password})
+        self._after_commit(lsn)
+
+    def accounts(self) -> typing.List[UserRecord]:
+        with self._lock:
+            self.refresh()
+            return [
+                UserRecord(username, self._passwords[row], self._balances[row])
+                for row, username in enumerate(self._usernames)
+                if self._index[username] == row
+            ]
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        batch_size = max(1, batch_size)
+        with self._lock:
+            self.refresh()
+        start = 0
+        while True:
+            with self._lock:
+                rows = range(start, min(start + batch_size, len(self._usernames)))
+                batch = [
+                    UserRecord(self._usernames[row], self._passwords[row], self._balances[row])
+                    for row in rows
+                    if self._index[self._usernames[row]] == row
+                ]
+            if not rows:
+                return
+            yield batch
+            start = rows.stop
+
+    @instrumented("ledger.aggregates")
+    def aggregates(self) -> Aggregates:
+        """
+        Totals and largest balances, maintained as every write is applied
+
+        Returns:
+            Aggregates: Copy of the current aggregates
+        """
+        with self._lock:
+            self.refresh()
+            if not self._aggregates.top.complete:
+                self._aggregates.top.rebuild(
+                    (username, self._balances[row]) for username, row in self._index.items()
+                )
+            return Aggregates.from_dict(self._aggregates.to_dict())
+
+    @instrumented("ledger.flush")
+    def flush(self) -> None:
+        """
+        Fsync any journal records still waiting for a group commit
+        """
+        self.journal.sync()
+
+    @instrumented("ledger.compact")
+    def compact(self) -> None:
+        """
+        Checkpoint - fold the journal into a fresh snapshot and start a new journal
+
+        Writers are only held up for the two short steps that touch the
+        in-memory state, never for the table write:
+
+        1. Under the in-memory lock, copy the columns and aggregates and
+           note the journal offset they reflect.
+        2. With no lock held, write the copy to a temp file and fsync it.
+        3. Under the exclusive table lock, catch up, swap the file in with
+           os.replace and fsync the directory, save the aggregates, and
+           rotate the journal. Records appended after the noted offset
+           while the file was being written are carried into the new
+           journal.
+
+        A crash at any point leaves the old or the new snapshot whole, and
+        at worst replays records the snapshot already includes, which is
+        harmless since they carry absolute balances. If another process
+        checkpointed in the meantime this one is dropped.
+
+        Raises:
+            e: Error with write operation
+        """
+        try:
+            with self._checkpoint_lock:
+                with self.locks.accounts(), self._lock:
+                    self.refresh()
+                    loads = self._loads
+                    offset = self._journal_offset
+                    columns = {
+                        "Username": list(self._usernames),
+                        "Password": list(self._passwords),
+                        "BalanceCents": list(self._balances),
+                    }
+                    aggregates = Aggregates.from_dict(self._aggregates.to_dict())
+
+                with METRICS.timer("ledger.compact.write_snapshot"):
+                    tmp_path = stage_snapshot(
+                        pl.DataFrame(columns, schema=ACCOUNT_SCHEMA), self.snapshot_path, self.snapshot_format
+                    )
+
+                signature = None
+                try:
+                    with self.locks.exclusive(), self._lock:
+                        self.refresh()
+                        if self._loads != loads:
+                            logging.info(f"Snapshot of {self.snapshot_path} was replaced during checkpoint, skipping")
+                            return
+                        replace_file(tmp_path, self.snapshot_path)
+                        self._signature = signature = self._file_signature()
+                        save_aggregates(aggregates, self.aggregates_path, self._signature)
+                        self._journal_records = self.journal.rotate(carry_from=offset)
+                        self._journal_offset = self.journal.size()
+                        METRICS.increment("ledger.checkpoint_carried_records", self._journal_records)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                if signature is not None:
+                    self._refresh_cache(columns, signature)
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            raise e
+
+    def _refresh_cache(self, columns: typing.Dict[str, typing.List[typing.Any]], signature: typing.Tuple[int, int, int]) -> None:
+        """
+        Rewrite the account cache for a snapshot that was just swapped in
+
+        Only done if a cache already exists, i.e. something answers one-shot
+        lookups from it. No lock is held: if another checkpoint swaps in a
+        newer snapshot meanwhile, the signature no longer matches and the
+        cache is rebuilt on its next use.
+
+        Args:
+            columns (typing.Dict[str, typing.List[typing.Any]]): Columns the snapshot was written from
+            signature (typing.Tuple[int, int, int]): Signature of the new snapshot
+        """
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with METRICS.timer("ledger.compact.write_cache"):
+                write_cache(columns["Username"], columns["Password"], columns["BalanceCents"], self.cache_path, signature)
+        except Exception as e:
+            # The stale cache is ignored by its readers, so the checkpoint still counts
+            logging.warning(f"Could not refresh {self.cache_path}: {e}")
+
+    def close(self) -> None:
+        """
+        Stop the background threads, then fsync and close the journal
+
+        The journal is left for the next process to fold in rather than
+        compacted here, so exiting costs one fsync whatever the size of
+        the table.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._checkpoint_due.set()
+        for thread in (self._flusher, self._checkpointer):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+        self.journal.sync()
+        self.journal.close()
+
+    def _checkpoint_periodically(self) -> None:
+        """
+        Background loop that checkpoints on a schedule, or as soon as a commit reaches compact_every
+        """
+        while True:
+            self._checkpoint_due.wait(self.checkpoint_interval)
+            self._checkpoint_due.clear()
+            if self._closed.is_set():
+                return
+            if self._journal_records:
+                try:
+                    self.compact()
+                except Exception:
+                    # Already logged - the journal still has every record, try again next time
+                    pass
+
+    def _flush_periodically(self) -> None:
+        """
+        Background loop so grouped records reach disk even when no more commits arrive
+        """
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error: {e}")
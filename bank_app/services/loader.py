@@ -0,0 +1,99 @@
+import logging
+import typing
+import polars as pl
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import CENTS_PER_UNIT
+
+logging.basicConfig(level=logging.INFO)
+
+# Column types of the account table. Passing them to the scan means the
+# parser produces the right types directly - no inference pass and no
+# read-then-cast copy of every column.
+ACCOUNT_SCHEMA = {
+    "Username": pl.datatypes.Utf8,
+    "Password": pl.datatypes.Utf8,
+    "BalanceCents": pl.datatypes.Int64,
+}
+ACCOUNT_COLUMNS = list(ACCOUNT_SCHEMA)
+
+# Files written before balances moved to integer cents
+LEGACY_ACCOUNT_SCHEMA = {
+    "Username": pl.datatypes.Utf8,
+    "Password": pl.datatypes.Utf8,
+    "Balance": pl.datatypes.Float64,
+}
+
+
+def legacy_cents(balance: pl.Expr) -> pl.Expr:
+    """
+    Vectorized conversion of a legacy Float64 balance column to cents
+
+    Args:
+        balance (pl.Expr): Balance in whole units
+
+    Returns:
+        pl.Expr: Int64 cents named BalanceCents
+    """
+    return (balance * CENTS_PER_UNIT).round(0).cast(pl.datatypes.Int64).alias("BalanceCents")
+
+
+def is_legacy_csv(csv_path: str) -> bool:
+    """
+    Whether a CSV still has the old float Balance column
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        bool: True for a Balance column rather than BalanceCents
+    """
+    with open(csv_path) as csv_file:
+        header = csv_file.readline().strip().split(",")
+    return "BalanceCents" not in header and "Balance" in header
+
+
+def scan_accounts(csv_path: str) -> pl.LazyFrame:
+    """
+    Lazy, schema-typed scan of the bank system CSV
+
+    Nothing is read until the frame is collected, so any select() or
+    filter() added by the caller is pushed down into the CSV reader:
+    unused columns are never materialized and non-matching rows are
+    dropped while parsing. Files with a legacy Balance column are
+    converted to cents on the fly.
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        pl.LazyFrame: Username, Password and BalanceCents with ACCOUNT_SCHEMA types
+    """
+    if is_legacy_csv(csv_path):
+        return pl.scan_csv(csv_path, dtypes=LEGACY_ACCOUNT_SCHEMA).with_columns(
+            legacy_cents(pl.col("Balance"))
+        )
+    return pl.scan_csv(csv_path, dtypes=ACCOUNT_SCHEMA)
+
+
+@instrumented("loader.load_accounts")
+def load_accounts(
+    csv_path: str,
+    columns: typing.Optional[typing.List[str]] = None,
+    usernames: typing.Optional[typing.Iterable[str]] = None,
+) -> pl.DataFrame:
+    """
+    Read just the columns and rows an operation needs
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        columns (typing.Optional[typing.List[str]], optional): Columns to read. Defaults to all of ACCOUNT_COLUMNS.
+        usernames (typing.Optional[typing.Iterable[str]], optional): Only keep these accounts. Defaults to every row.
+
+    Returns:
+        pl.DataFrame: Matching rows in file order
+    """
+    lf = scan_accounts(csv_path)
+    if usernames is not None:
+        lf = lf.filter(pl.col("Username").is_in(list(usernames)))
+    return lf.select(columns or ACCOUNT_COLUMNS).collect()
+
@@ -0,0 +1,180 @@
+import contextlib
+import fcntl
+import os
+import threading
+import typing
+import zlib
+
+# Accounts hash onto this many lock stripes. Two usernames only contend
+# if they land on the same stripe, so with 65536 stripes disjoint accounts
+# effectively never wait on each other.
+DEFAULT_STRIPES = 65536
+
+# Byte 0 of the lock file is the table lock, stripe n is byte n + 1
+TABLE_BYTE = 0
+
+
+def lock_path_for(csv_path: str) -> str:
+    """
+    Lock file that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .lock file
+    """
+    return os.path.splitext(csv_path)[0] + ".lock"
+
+
+class LockManager:
+    """
+    Per-account locking that works across threads and processes
+
+    Each username hashes to a stripe. A stripe is an in-process
+    threading.Lock paired with an advisory fcntl byte-range lock on one
+    byte of the lock file, so threads and other processes working on
+    disjoint accounts never block each other.
+
+    fcntl locks belong to the process, not the thread, so the in-process
+    lock is always taken first: that way only one thread per process ever
+    holds or releases a given byte.
+
+    Operations also take a shared lock on the table byte. Whole-table work
+    such as compaction takes it exclusively, which waits for in-flight
+    account operations in every process to finish.
+
+    Multiple stripes are always taken in ascending order, which rules out
+    deadlock between transfers going in opposite directions.
+    """
+    def __init__(self, lock_path: str, stripes: int = DEFAULT_STRIPES) -> None:
+        self.lock_path = lock_path
+        self.stripes = stripes
+        self._fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._stripe_locks: typing.Dict[int, threading.Lock] = {}
+        self._stripe_locks_mutex = threading.Lock()
+
+        # In-process readers/writer state for the table byte
+        self._table_cond = threading.Condition()
+        self._table_readers = 0
+        self._table_writer = False
+        self._table_writers_waiting = 0
+
+    def stripe_for(self, username: str) -> int:
+        """
+        Stable stripe number for a username
+
+        crc32 rather than hash() so every process agrees on it
+
+        Args:
+            username (str): Account name
+
+        Returns:
+            int: Stripe in [0, stripes)
+        """
+        return zlib.crc32(username.encode()) % self.stripes
+
+    def _stripe_lock(self, stripe: int) -> threading.Lock:
+        with self._stripe_locks_mutex:
+            lock = self._stripe_locks.get(stripe)
+            if lock is None:
+                lock = self._stripe_locks[stripe] = threading.Lock()
+            return lock
+
+    def _acquire_table_shared(self) -> None:
+        with self._table_cond:
+            # Waiting writers go first so a steady stream of account
+            # operations can't starve compaction
+            while self._table_writer or self._table_writers_waiting:
+                self._table_cond.wait()
+            if self._table_readers == 0:
+                fcntl.lockf(self._fd, fcntl.LOCK_SH, 1, TABLE_BYTE, os.SEEK_SET)
+            self._table_readers += 1
+
+    def _release_table_shared(self) -> None:
+        with self._table_cond:
+            self._table_readers -= 1
+            if self._table_readers == 0:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, TABLE_BYTE, os.SEEK_SET)
+                self._table_cond.notify_all()
+
+    @contextlib.contextmanager
+    def accounts(self, *usernames: str) -> typing.Iterator[None]:
+        """
+        Hold the locks for every given account
+
+        Args:
+            usernames (str): Accounts the operation reads or writes
+
+        Returns:
+            typing.Iterator[None]: Context manager
+        """
+        stripes = sorted({self.stripe_for(username) for username in usernames})
+        self._acquire_table_shared()
+        held: typing.List[int] = []
+        try:
+            for stripe in stripes:
+                self._stripe_lock(stripe).acquire()
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe + 1, os.SEEK_SET)
+                except BaseException:
+                    self._stripe_lock(stripe).release()
+                    raise
+                held.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(held):
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe + 1, os.SEEK_SET)
+                self._stripe_lock(stripe).release()
+            self._release_table_shared()
+
+    @contextlib.contextmanager
+    def exclusive(self) -> typing.Iterator[None]:
+        """
+        Hold the whole table, waiting for every account operation to finish
+
+        Returns:
+            typing.Iterator[None]: Context manager
+        """
+        with self._table_cond:
+            self._table_writers_waiting += 1
+            while self._table_writer or self._table_readers:
+                self._table_cond.wait()
+            self._table_writers_waiting -= 1
+            self._table_writer = True
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, TABLE_BYTE, os.SEEK_SET)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, TABLE_BYTE, os.SEEK_SET)
+        finally:
+            with self._table_cond:
+                self._table_writer = False
+                self._table_cond.notify_all()
+
+
+_LOCK_MANAGERS: typing.Dict[str, LockManager] = {}
+_LOCK_MANAGERS_MUTEX = threading.Lock()
+
+
+def get_lock_manager(lock_path: str) -> LockManager:
+    """
+    Shared LockManager for lock_path
+
+    There must only be one per file per process: POSIX drops every fcntl
+    lock a process holds on a file as soon as any descriptor for it is
+    closed, so a second manager could silently release the first one's locks.
+
+    Args:
+        lock_path (str): Lock file path
+
+    Returns:
+        LockManager: Process-wide manager for that file
+    """
+    key = os.path.abspath(lock_path)
+    with _LOCK_MANAGERS_MUTEX:
+        manager = _LOCK_MANAGERS.get(key)
+        if manager is None:
+            manager = _LOCK_MANAGERS[key] = LockManager(key)
+        return manager
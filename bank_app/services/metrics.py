@@ -0,0 +1,303 @@
+import functools
+import io
+import logging
+import math
+import os
+import threading
+import time
+import tracemalloc
+import typing
+
+if typing.TYPE_CHECKING:
+    # Imported on first use, it pulls in pstats and costs startup time
+    import cProfile
+
+logging.basicConfig(level=logging.INFO)
+
+# BANK_METRICS=1 turns on counters and latency histograms
+METRICS_ENABLED = os.environ.get("BANK_METRICS", "0") == "1"
+
+# BANK_PROFILE=cprofile or BANK_PROFILE=tracemalloc captures a profile of the run
+PROFILE_MODE = os.environ.get("BANK_PROFILE", "")
+PROFILE_MODES = ["cprofile", "tracemalloc"]
+
+# Bucket i counts latencies under 2**i microseconds, the last one everything above
+HISTOGRAM_BUCKETS = 32
+
+# Rows shown per profile report
+PROFILE_TOP = 25
+
+F = typing.TypeVar("F", bound=typing.Callable[..., typing.Any])
+
+
+class Histogram:
+    """
+    Log2-bucketed latency histogram
+
+    Recording is a couple of integer operations, and percentiles are read
+    back to within a factor of two, which is plenty to spot a hot path.
+    """
+    __slots__ = ("count", "total_ns", "max_ns", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, elapsed_ns: int) -> None:
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[min((elapsed_ns // 1000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound of the bucket holding the given rank
+
+        Args:
+            fraction (float): 0.5 for p50, 0.99 for p99
+
+        Returns:
+            float: Latency in milliseconds, never more than the observed max
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(2 ** bucket * 1000, self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+    def summary(self) -> typing.Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ns / 1e6,
+        }
+
+
+class Metrics:
+    """
+    Process-wide registry of named counters and latency histograms
+
+    Every instrumented call checks `enabled` first and returns straight
+    away when it is off, so the hooks can stay in production code.
+    """
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: typing.Dict[str, Histogram] = {}
+        self._counters: typing.Dict[str, int] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """
+        Forget everything recorded so far
+        """
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def record(self, name: str, elapsed_ns: int) -> None:
+        """
+        Add one latency sample
+
+        Args:
+            name (str): Operation name, e.g. "ledger.apply_delta"
+            elapsed_ns (int): Duration in nanoseconds
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(elapsed_ns)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """
+        Bump a counter if metrics are enabled
+
+        Args:
+            name (str): Counter name
+            amount (int, optional): Amount to add. Defaults to 1.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def timer(self, name: str) -> "Timer":
+        """
+        Time a block of code
+
+        Args:
+            name (str): Operation name
+
+        Returns:
+            Timer: Context manager that records on exit
+        """
+        return Timer(self, name)
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        """
+        Everything recorded so far in a JSON-serializable form
+
+        Returns:
+            typing.Dict[str, typing.Any]: Per-operation latency summaries and counters
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "operations": {name: histogram.summary() for name, histogram in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def report(self) -> str:
+        """
+        Per-operation breakdown as a text table, slowest total time first
+
+        Returns:
+            str: Human readable report
+        """
+        snapshot = self.snapshot()
+        if not snapshot["operations"] and not snapshot["counters"]:
+            return "No metrics recorded (set BANK_METRICS=1 or pass --metrics)"
+
+        lines = [
+            f"{'operation':<36}{'count':>10}{'total ms':>12}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        ]
+        operations = sorted(snapshot["operations"].items(), key=lambda item: -item[1]["total_ms"])
+        for name, summary in operations:
+            lines.append(
+                f"{name:<36}{summary['count']:>10}{summary['total_ms']:>12.3f}{summary['mean_ms']:>10.3f}"
+                f"{summary['p50_ms']:>10.3f}{summary['p99_ms']:>10.3f}{summary['max_ms']:>10.3f}"
+            )
+        for name, value in snapshot["counters"].items():
+            lines.append(f"{name:<36}{value:>10}")
+        return "\n".join(lines)
+
+
+class Timer:
+    """
+    Context manager returned by Metrics.timer
+    """
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.start = 0
+
+    def __enter__(self) -> "Timer":
+        if self.metrics.enabled:
+            self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        if self.start:
+            self.metrics.record(self.name, time.perf_counter_ns() - self.start)
+
+
+METRICS = Metrics(METRICS_ENABLED)
+
+
+def instrumented(name: str) -> typing.Callable[[F], F]:
+    """
+    Decorator recording the latency of every call, and a `<name>.errors`
+    counter for calls that raise
+
+    Args:
+        name (str): Operation name
+
+    Returns:
+        typing.Callable[[F], F]: Decorator
+    """
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                METRICS.increment(f"{name}.errors")
+                raise
+            finally:
+                METRICS.record(name, time.perf_counter_ns() - start)
+        return typing.cast(F, wrapper)
+    return decorator
+
+
+class Profiler:
+    """
+    Optional whole-run capture with cProfile or tracemalloc
+
+    cProfile only sees the thread that started it, so in server mode it
+    profiles the event loop. Use tracemalloc or the metrics for the worker threads.
+    """
+    def __init__(self) -> None:
+        self.mode: typing.Optional[str] = None
+        self._profile: typing.Optional["cProfile.Profile"] = None
+
+    def start(self, mode: str) -> None:
+        """
+        Begin capturing
+
+        Args:
+            mode (str): "cprofile" or "tracemalloc"
+
+        Raises:
+            ValueError: Unknown mode
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.mode = mode
+        if mode == "cprofile":
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            tracemalloc.start()
+
+    def stop(self) -> str:
+        """
+        Stop capturing and summarize
+
+        Returns:
+            str: Top functions by cumulative time, or top allocation sites
+        """
+        if self.mode == "cprofile" and self._profile is not None:
+            self._profile.disable()
+            import pstats
+
+            output = io.StringIO()
+            pstats.Stats(self._profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            self._profile = None
+            report = output.getvalue()
+        elif self.mode == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB"]
+            lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP])
+            report = "\n".join(lines)
+        else:
+            report = ""
+        self.mode = None
+        return report
+
+
+PROFILER = Profiler()
@@ -0,0 +1,321 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import typing
+from bank_app.services.durable import replace_durably
+from bank_app.services.loader import load_accounts
+from bank_app.services.locks import get_lock_manager
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import units_to_cents
+from bank_app.services.storage import DEFAULT_SCAN_BATCH, StorageBackend, UserRecord, validate_deltas, validate_transfer
+
+logging.basicConfig(level=logging.INFO)
+
+MAGIC = b"BANKMMAP"
+# Version 1 files stored balances as float64 whole units, version 2 as
+# int64 cents, version 3 widened the password field for salted hashes
+FORMAT_VERSION = 3
+LEGACY_FORMAT_VERSIONS = (1, 2)
+# magic, format version, record count
+HEADER = struct.Struct("<8sII")
+USERNAME_SIZE = 32
+# Room for the longest versioned hash, "scrypt$N$r$p$salt$hash" is about 180 bytes
+PASSWORD_SIZE = 256
+# username, password hash, balance in cents - NUL padded fixed-width fields
+RECORD = struct.Struct(f"<{USERNAME_SIZE}s{PASSWORD_SIZE}sq")
+BALANCE = struct.Struct("<q")
+BALANCE_OFFSET = USERNAME_SIZE + PASSWORD_SIZE
+# Records of version 1 and 2 files - the balance is a float64 or an int64
+LEGACY_PASSWORD_SIZE = 160
+LEGACY_RECORD = struct.Struct(f"<{USERNAME_SIZE}s{LEGACY_PASSWORD_SIZE}s8s")
+LEGACY_BALANCE = struct.Struct("<d")
+INITIAL_CAPACITY = 1024
+
+
+def mmap_path_for(csv_path: str) -> str:
+    """
+    Fixed-width record file that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .dat file
+    """
+    return os.path.splitext(csv_path)[0] + ".dat"
+
+
+class MmapBackend(StorageBackend):
+    """
+    Memory-mapped fixed-width record storage backend
+
+    Each account is a RECORD.size byte slot, so a balance update is an
+    in-place 8 byte int64 write into the mapping at a known offset. The
+    Username -> slot index is rebuilt by scanning the username field on
+    open. The file grows by doubling when it runs out of slots.
+
+    The mapping is shared, so other processes see balance writes
+    immediately. Balance updates hold the LockManager locks for the
+    accounts involved; creating a user holds the whole table since it
+    may grow the file. Users created by other processes are picked up from
+    the header record count.
+    """
+    def __init__(self, csv_path: str) -> None:
+        self.csv_path = csv_path
+        self.data_path = mmap_path_for(csv_path)
+        self._lock = threading.RLock()
+        self._index: typing.Dict[str, int] = {}
+        self._count = 0
+        self.locks = get_lock_manager(f"{self.data_path}.lock")
+
+        with self.locks.exclusive():
+            if not os.path.exists(self.data_path):
+                self._create_file()
+            else:
+                self._convert_legacy()
+        self._file = open(self.data_path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        magic, version, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.data_path} is not a version {FORMAT_VERSION} account file")
+        self.refresh()
+
+    @instrumented("mmap.refresh")
+    def refresh(self) -> None:
+        """
+        Pick up users other processes appended and remap if they grew the file
+        """
+        with self._lock:
+            count = HEADER.unpack_from(self._map, 0)[2]
+            if count == self._count:
+                return
+            file_size = os.fstat(self._file.fileno()).st_size
+            if file_size > len(self._map):
+                self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), 0)
+            for slot in range(self._count, count):
+                offset = self._offset(slot)
+                username = self._map[offset:offset + USERNAME_SIZE].rstrip(b"\0").decode()
+                self._index.setdefault(username, slot)
+            self._count = count
+
+    def _create_file(self) -> None:
+        """
+        Lay out a new record file, importing the CSV rows if there is one
+        """
+        rows: typing.List[typing.Tuple[str, str, int]] = []
+        if os.path.exists(self.csv_path):
+            rows = load_accounts(self.csv_path).rows()
+        capacity = max(INITIAL_CAPACITY, len(rows) * 2)
+
+        tmp_path = f"{self.data_path}.tmp"
+        with open(tmp_path, "wb") as data_file:
+            data_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(rows)))
+            for username, password, balance in rows:
+                data_file.write(self._pack(username, password, balance))
+            data_file.truncate(HEADER.size + capacity * RECORD.size)
+        replace_durably(tmp_path, self.data_path)
+        if rows:
+            logging.info(f"Imported {len(rows)} accounts from {self.csv_path} into {self.data_path}")
+
+    def _convert_legacy(self) -> None:
+        """
+        One-time rewrite of a version 1 or 2 file in the current record layout
+
+        Version 1 balances are float64 whole units and become int64 cents,
+        and both get the wider password field. Records keep their slot
+        order. The converted copy is streamed beside the old file and
+        swapped in.
+        """
+        with open(self.data_path, "rb") as data_file:
+            magic, version, count = HEADER.unpack(data_file.read(HEADER.size))
+            if magic != MAGIC or version not in LEGACY_FORMAT_VERSIONS:
+                return
+            capacity = max(INITIAL_CAPACITY, count * 2)
+            tmp_path = f"{self.data_path}.tmp"
+            with open(tmp_path, "wb") as converted_file:
+                converted_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, count))
+                for _ in range(count):
+                    username, password, balance = LEGACY_RECORD.unpack(data_file.read(LEGACY_RECORD.size))
+                    if version == 1:
+                        cents = units_to_cents(LEGACY_BALANCE.unpack(balance)[0])
+                    else:
+                        cents = BALANCE.unpack(balance)[0]
+                    converted_file.write(RECORD.pack(username, password, cents))
+                converted_file.truncate(HEADER.size + capacity * RECORD.size)
+        replace_durably(tmp_path, self.data_path)
+        logging.info(f"Converted {count} accounts in {self.data_path} from version {version} to {FORMAT_VERSION}")
+
+    @staticmethod
+    def _pack(username: str, password: str, balance: int) -> bytes:
+        encoded_username = username.encode()
+        encoded_password = password.encode()
+        if len(encoded_username) > USERNAME_SIZE or len(encoded_password) > PASSWORD_SIZE:
+            raise ValueError("Username or password hash too long for fixed-width record")
+        return RECORD.pack(encoded_username, encoded_password, int(balance))
+
+    @staticmethod
+    def _offset(slot: int) -> int:
+        return HEADER.size + slot * RECORD.size
+
+    def _capacity(self) -> int:
+        return (len(self._map) - HEADER.size) // RECORD.size
+
+    @instrumented("mmap.get_user")
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        with self._lock:
+            self.refresh()
+            slot = self._index.get(username)
+            if slot is None:
+                return None
+            _, password, balance = RECORD.unpack_from(self._map, self._offset(slot))
+            return UserRecord(username, password.rstrip(b"\0").decode(), balance)
+
+    @instrumented("mmap.get_balance")
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        with self._lock:
+            self.refresh()
+            slot = self._index.get(username)
+            if slot is None:
+                return None
+            return BALANCE.unpack_from(self._map, self._offset(slot) + BALANCE_OFFSET)[0]
+
+    @instrumented("mmap.set_balance")
+    def set_balance(self, username: str, new_balance: int) -> None:
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            slot = self._index.get(username)
+            if slot is not None:
+                BALANCE.pack_into(self._map, self._offset(slot) + BALANCE_OFFSET, int(new_balance))
+
+    def _add(self, username: str, delta: int) -> int:
+        """
+        In-place balance update - caller holds the account locks and has validated
+
+        Args:
+            username (str): Existing account
+            delta (int): Signed amount to add
+
+        Returns:
+            int: Resulting balance
+        """
+        offset = self._offset(self._index[username]) + BALANCE_OFFSET
+        new_balance = BALANCE.unpack_from(self._map, offset)[0] + delta
+        BALANCE.pack_into(self._map, offset, new_balance)
+        return new_balance
+
+    @instrumented("mmap.apply_delta")
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        with self.locks.accounts(username), self._lock:
+            validate_deltas({username: delta}, {username: self.get_balance(username)})
+            return self._add(username, delta)
+
+    @instrumented("mmap.transfer")
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        with self.locks.accounts(source, recipient), self._lock:
+            validate_transfer(
+                source, recipient, amount, self.get_balance(source), self.get_balance(recipient)
+            )
+            return self._add(source, -amount), self._add(recipient, amount)
+
+    @instrumented("mmap.apply_deltas")
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        with self.locks.accounts(*deltas), self._lock:
+            validate_deltas(deltas, {username: self.get_balance(username) for username in deltas})
+            return {username: self._add(username, delta) for username, delta in deltas.items()}
+
+    @instrumented("mmap.create_user")
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        with self.locks.exclusive(), self._lock:
+            self.refresh()
+            if username in self._index:
+                raise ValueError("Username already exists")
+            record = self._pack(username, password, balance)
+            if self._count >= self._capacity():
+                self._map.resize(HEADER.size + self._capacity() * 2 * RECORD.size)
+            self._map[self._offset(self._count):self._offset(self._count + 1)] = record
+            self._index[username] = self._count
+            self._count += 1
+            HEADER.pack_into(self._map, 0, MAGIC, FORMAT_VERSION, self._count)
+
+    @instrumented("mmap.create_users")
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        with self.locks.exclusive(), self._lock:
+            self.refresh()
+            new_users = [user for user in users if user.username not in self._index]
+            records = b"".join(self._pack(*user) for user in new_users)
+            if not new_users:
+                return []
+            needed = self._count + len(new_users)
+            if needed > self._capacity():
+                self._map.resize(HEADER.size + max(needed, self._capacity() * 2) * RECORD.size)
+            self._map[self._offset(self._count):self._offset(needed)] = records
+            for slot, user in enumerate(new_users, start=self._count):
+                self._index[user.username] = slot
+            self._count = needed
+            # Other processes only see the rows once the header count covers them
+            HEADER.pack_into(self._map, 0, MAGIC, FORMAT_VERSION, self._count)
+        return [user.username for user in new_users]
+
+    @instrumented("mmap.set_password")
+    def set_password(self, username: str, password: str) -> None:
+        encoded_password = password.encode()
+        if len(encoded_password) > PASSWORD_SIZE:
+            raise ValueError("Password hash too long for fixed-width record")
+        with self.locks.accounts(username), self._lock:
+            self.refresh()
+            slot = self._index.get(username)
+            if slot is not None:
+                offset = self._offset(slot) + USERNAME_SIZE
+                self._map[offset:offset + PASSWORD_SIZE] = encoded_password.ljust(PASSWORD_SIZE, b"\0")
+
+    def _records(self, slots: range) -> typing.List[UserRecord]:
+        """
+        Decode a range of slots - caller holds self._lock
+
+        Args:
+            slots (range): Slots to read
+
+        Returns:
+            typing.List[UserRecord]: Rows that lookups resolve to, shadowed duplicates left out
+        """
+        records = []
+        for slot in slots:
+            username, password, balance = RECORD.unpack_from(self._map, self._offset(slot))
+            username = username.rstrip(b"\0").decode()
+            if self._index.get(username) == slot:
+                records.append(UserRecord(username, password.rstrip(b"\0").decode(), balance))
+        return records
+
+    def accounts(self) -> typing.List[UserRecord]:
+        with self._lock:
+            self.refresh()
+            return self._records(range(self._count))
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        batch_size = max(1, batch_size)
+        with self._lock:
+            self.refresh()
+            count = self._count
+        for start in range(0, count, batch_size):
+            with self._lock:
+                batch = self._records(range(start, min(start + batch_size, count)))
+            yield batch
+
+    @instrumented("mmap.flush")
+    def flush(self) -> None:
+        with self._lock:
+            self._map.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map.closed:
+                return
+            self._map.flush()
+            self._map.close()
+            self._file.close()
@@ -0,0 +1,59 @@
+import decimal
+import typing
+
+# Balances and amounts are integer minor units (cents) everywhere below
+# the UI, so arithmetic is exact and parsing is an integer parse
+CENTS_PER_UNIT = 100
+
+
+def parse_amount(amount: typing.Union[str, int, float, decimal.Decimal]) -> int:
+    """
+    Convert a user-facing amount like "12.34" into cents
+
+    Args:
+        amount (typing.Union[str, int, float, decimal.Decimal]): Amount in whole units
+
+    Raises:
+        ValueError: Not a number, or finer than one cent
+
+    Returns:
+        int: Amount in cents
+    """
+    try:
+        # str() first so 0.1 is read as written rather than as its binary approximation
+        value = decimal.Decimal(str(amount).strip()) * CENTS_PER_UNIT
+    except decimal.InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount {amount!r}")
+    if value != value.to_integral_value():
+        raise ValueError("Amount can't have fractions of a cent")
+    return int(value)
+
+
+def format_cents(cents: int) -> str:
+    """
+    Render cents for display, e.g. 39900 -> "399.00"
+
+    Args:
+        cents (int): Amount in cents
+
+    Returns:
+        str: Amount in whole units with two decimals
+    """
+    sign = "-" if cents < 0 else ""
+    units, remainder = divmod(abs(cents), CENTS_PER_UNIT)
+    return f"{sign}{units}.{remainder:02d}"
+
+
+def units_to_cents(units: float) -> int:
+    """
+    Convert a legacy floating point balance to cents
+
+    Args:
+        units (float): Balance in whole units as stored by older versions
+
+    Returns:
+        int: Nearest whole number of cents
+    """
+    return int(round(units * CENTS_PER_UNIT))
@@ -0,0 +1,395 @@
+import contextlib
+import json
+import logging
+import os
+import shutil
+import threading
+import typing
+import uuid
+import zlib
+import polars as pl
+from bank_app.services.aggregates import Aggregates
+from bank_app.services.journal import Journal
+from bank_app.services.ledger import Ledger, journal_cents
+from bank_app.services.loader import ACCOUNT_SCHEMA, load_accounts
+from bank_app.services.locks import get_lock_manager, lock_path_for
+from bank_app.services.metrics import instrumented
+from bank_app.services.storage import DEFAULT_SCAN_BATCH, StorageBackend, UserRecord, validate_deltas, validate_transfer
+
+logging.basicConfig(level=logging.INFO)
+
+# Partitions created when the CSV is first split. Fixed afterwards - the
+# manifest records the count actually used.
+DEFAULT_PARTITIONS = int(os.environ.get("BANK_PARTITIONS", "16"))
+
+MANIFEST_NAME = "manifest.json"
+INTENTS_NAME = "intents.journal"
+FORMAT_VERSION = 1
+
+
+def partition_dir_for(csv_path: str) -> str:
+    """
+    Directory of partition files that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .partitions directory
+    """
+    return os.path.splitext(csv_path)[0] + ".partitions"
+
+
+def partition_for(username: str, partitions: int) -> int:
+    """
+    Partition a username lives in
+
+    crc32 rather than hash() so every process agrees on it
+
+    Args:
+        username (str): Account name
+        partitions (int): Number of partitions
+
+    Returns:
+        int: Partition in [0, partitions)
+    """
+    return zlib.crc32(username.encode()) % partitions
+
+
+class PartitionedBackend(StorageBackend):
+    """
+    Account table sharded by username hash into N partition files
+
+    Each partition is an ordinary Ledger (snapshot + journal) over
+    part-NNNN.csv in the .partitions directory, opened the first time an
+    account in it is touched. Startup only reads the manifest, and memory
+    grows with the partitions actually used rather than the whole table.
+
+    Operations on one account, and transfers within one partition, go
+    straight to that partition's Ledger. Writes spanning partitions use an
+    intent log: with every involved account locked, the before and after
+    balances are fsynced to intents.journal, each partition journals its
+    leg, and a commit record closes the intent. An intent left open by a
+    crash is rolled forward the next time the store is opened.
+
+    The CSV is split once, when the directory is first created. Use the
+    `export` command to write the live state back out as one CSV.
+    """
+    def __init__(self, csv_path: str, partitions: int = DEFAULT_PARTITIONS) -> None:
+        self.csv_path = csv_path
+        self.directory = partition_dir_for(csv_path)
+        self.locks = get_lock_manager(lock_path_for(csv_path))
+        self._ledgers: typing.Dict[int, Ledger] = {}
+        self._ledgers_lock = threading.Lock()
+        self._closed = False
+
+        with self.locks.exclusive():
+            if not os.path.exists(os.path.join(self.directory, MANIFEST_NAME)):
+                self._split_csv(partitions)
+            with open(os.path.join(self.directory, MANIFEST_NAME)) as manifest_file:
+                self.partitions = json.load(manifest_file)["partitions"]
+            self.intents = Journal(os.path.join(self.directory, INTENTS_NAME))
+            if self.intents.torn():
+                self.intents.truncate_torn_tail()
+            self._recover()
+
+    def _partition_path(self, partition: int, directory: typing.Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, f"part-{partition:04d}.csv")
+
+    def _split_csv(self, partitions: int) -> None:
+        """
+        One-off migration of the CSV rows into partition files
+
+        Everything is written to a temporary directory that is renamed into
+        place last, so a crash mid-split leaves no half-built store.
+
+        Args:
+            partitions (int): Number of partitions to create
+        """
+        if os.path.exists(self.csv_path):
+            df = load_accounts(self.csv_path)
+        else:
+            df = pl.DataFrame(schema=ACCOUNT_SCHEMA)
+        df = df.with_columns(
+            pl.Series(
+                "Partition",
+                [partition_for(username, partitions) for username in df["Username"].to_list()],
+                dtype=pl.datatypes.UInt32,
+            )
+        )
+        chunks = df.partition_by(["Partition"], as_dict=True, include_key=False)
+
+        tmp_dir = f"{self.directory}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        empty = pl.DataFrame(schema=ACCOUNT_SCHEMA)
+        for partition in range(partitions):
+            chunks.get((partition,), empty).write_csv(self._partition_path(partition, tmp_dir))
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as manifest_file:
+            json.dump({"version": FORMAT_VERSION, "partitions": partitions, "hash": "crc32"}, manifest_file)
+        os.rename(tmp_dir, self.directory)
+        logging.info(f"Split {df.height} accounts from {self.csv_path} into {partitions} partitions")
+
+    def _ledger(self, partition: int) -> Ledger:
+        """
+        Ledger for a partition, loaded on first use
+
+        Args:
+            partition (int): Partition number
+
+        Returns:
+            Ledger: Shared ledger over that partition's files
+        """
+        with self._ledgers_lock:
+            ledger = self._ledgers.get(partition)
+            if ledger is None:
+                ledger = self._ledgers[partition] = Ledger(self._partition_path(partition))
+            return ledger
+
+    def _ledger_for(self, username: str) -> Ledger:
+        return self._ledger(partition_for(username, self.partitions))
+
+    @contextlib.contextmanager
+    def _hold(self, usernames: typing.Iterable[str]) -> typing.Iterator[typing.Dict[str, Ledger]]:
+        """
+        Lock accounts in several partitions at once
+
+        Partition locks are taken in partition order, and every lock file
+        before any in-memory lock, so this can't deadlock against another
+        multi-partition write or wait on another process while blocking
+        this one.
+
+        Args:
+            usernames (typing.Iterable[str]): Accounts to lock
+
+        Returns:
+            typing.Iterator[typing.Dict[str, Ledger]]: Username -> ledger holding it
+        """
+        by_partition: typing.Dict[int, typing.List[str]] = {}
+        for username in usernames:
+            by_partition.setdefault(partition_for(username, self.partitions), []).append(username)
+        ordered = [(self._ledger(partition), by_partition[partition]) for partition in sorted(by_partition)]
+
+        with contextlib.ExitStack() as stack:
+            for ledger, names in ordered:
+                stack.enter_context(ledger.locks.accounts(*names))
+            for ledger, _ in ordered:
+                stack.enter_context(ledger.hold())
+            yield {username: ledger for ledger, names in ordered for username in names}
+
+    def _apply_across(
+        self,
+        deltas: typing.Dict[str, int],
+        validate: typing.Callable[[typing.Dict[str, typing.Optional[int]]], None],
+    ) -> typing.Dict[str, int]:
+        """
+        All-or-nothing write spanning partitions, through the intent log
+
+        Args:
+            deltas (typing.Dict[str, int]): Username -> signed amount to add
+            validate (typing.Callable[[typing.Dict[str, typing.Optional[int]]], None]): Raises if the current balances don't allow the write
+
+        Returns:
+            typing.Dict[str, int]: Username -> resulting balance
+        """
+        # The shared table lock keeps recovery and intent log rotation out
+        with self.locks.accounts(*deltas), self._hold(deltas) as ledgers:
+            before = {username: ledgers[username].get_balance(username) for username in deltas}
+            validate(before)
+            after = {username: before[username] + delta for username, delta in deltas.items()}
+
+            txn = uuid.uuid4().hex
+            if self.intents.replaced_on_disk():
+                self.intents.reopen()
+            self.intents.sync(self.intents.append({"op": "begin", "txn": txn, "before": before, "after": after}))
+            for username, balance in after.items():
+                ledgers[username].set_held(username, balance, txn)
+            for ledger in set(ledgers.values()):
+                ledger.flush()
+            self.intents.append({"op": "commit", "txn": txn})
+        return after
+
+    def _recover(self) -> None:
+        """
+        Roll forward intents a crashed process left open, then start a new intent log
+
+        Called with the table lock held exclusively, so no live process
+        has an intent in flight. A leg whose account still shows the
+        before balance is applied; one that shows the after balance was
+        already written. Anything else means the account changed since the
+        crash and is only reported. A "failed" record, left by a sharded
+        write whose leg raised, keeps the intent open.
+        """
+        pending: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        seen = False
+        for record in self.intents.replay():
+            seen = True
+            if record["op"] == "begin":
+                pending[record["txn"]] = record
+            elif record["op"] == "commit":
+                pending.pop(record["txn"], None)
+
+        for txn, record in pending.items():
+            with self._hold(record["after"]) as ledgers:
+                for username, balance in record["after"].items():
+                    balance = journal_cents(balance)
+                    current = ledgers[username].get_balance(username)
+                    if current == journal_cents(record["before"][username]):
+                        ledgers[username].set_held(username, balance, txn)
+                    elif current != balance:
+                        logging.warning(
+                            f"Transaction {txn}: {username} changed since the crash, leaving balance {current}"
+                        )
+                for ledger in set(ledgers.values()):
+                    ledger.flush()
+            logging.info(f"Recovered cross-partition transaction {txn}")
+
+        if seen:
+            self.intents.rotate()
+
+    @instrumented("partitioned.get_user")
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        return self._ledger_for(username).get_user(username)
+
+    @instrumented("partitioned.get_balance")
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        return self._ledger_for(username).get_balance(username)
+
+    @instrumented("partitioned.set_balance")
+    def set_balance(self, username: str, new_balance: int) -> None:
+        self._ledger_for(username).set_balance(username, new_balance)
+
+    @instrumented("partitioned.apply_delta")
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        return self._ledger_for(username).apply_delta(username, delta, op)
+
+    @instrumented("partitioned.transfer")
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        if partition_for(source, self.partitions) == partition_for(recipient, self.partitions):
+            return self._ledger_for(source).transfer(source, recipient, amount)
+
+        def validate(balances: typing.Dict[str, typing.Optional[int]]) -> None:
+            validate_transfer(source, recipient, amount, balances[source], balances[recipient])
+
+        balances = self._apply_across({source: -amount, recipient: amount}, validate)
+        return balances[source], balances[recipient]
+
+    @instrumented("partitioned.apply_deltas")
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        partitions = {partition_for(username, self.partitions) for username in deltas}
+        if len(partitions) <= 1:
+            return self._ledger(partitions.pop()).apply_deltas(deltas, gross) if partitions else {}
+        # Journaled per partition as "set", so the gross amounts aren't recorded
+        return self._apply_across(deltas, lambda balances: validate_deltas(deltas, balances))
+
+    @instrumented("partitioned.create_user")
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        self._ledger_for(username).create_user(username, password, balance)
+
+    @instrumented("partitioned.create_users")
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        """
+        One create_users write per partition the users fall in
+
+        Accounts are independent, so there is no intent: if the process
+        dies part way some partitions have their new rows and the others
+        don't, and running the same import again creates only the rest.
+
+        Args:
+            users (typing.Sequence[UserRecord]): New accounts with hashed passwords, no repeated usernames
+
+        Returns:
+            typing.List[str]: Usernames created, grouped by partition
+        """
+        by_partition: typing.Dict[int, typing.List[UserRecord]] = {}
+        for user in users:
+            by_partition.setdefault(partition_for(user.username, self.partitions), []).append(user)
+        created = []
+        for partition in sorted(by_partition):
+            created.extend(self._ledger(partition).create_users(by_partition[partition]))
+        return created
+
+    @instrumented("partitioned.set_password")
+    def set_password(self, username: str, password: str) -> None:
+        self._ledger_for(username).set_password(username, password)
+
+    def partition_accounts(self, partition: int) -> typing.List[UserRecord]:
+        """
+        Every account in one partition, loading it if needed
+
+        Args:
+            partition (int): Partition number
+
+        Returns:
+            typing.List[UserRecord]: Current state of that partition
+        """
+        return self._ledger(partition).accounts()
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        """
+        Every account, partition by partition, in batches of at most batch_size
+
+        Args:
+            batch_size (int, optional): Accounts per batch. Defaults to BANK_SCAN_BATCH.
+
+        Returns:
+            typing.Iterator[typing.List[UserRecord]]: Batches of accounts
+        """
+        for partition in range(self.partitions):
+            yield from self._ledger(partition).iter_accounts(batch_size)
+
+    def accounts(self) -> typing.List[UserRecord]:
+        """
+        Every account, partition by partition - this loads every partition
+
+        Returns:
+            typing.List[UserRecord]: Current state of the whole table
+        """
+        records = []
+        for partition in range(self.partitions):
+            records.extend(self.partition_accounts(partition))
+        return records
+
+    def partition_aggregates(self, partition: int) -> Aggregates:
+        """
+        Aggregates one partition maintains, loading it if needed
+
+        Args:
+            partition (int): Partition number
+
+        Returns:
+            Aggregates: Aggregates of that partition
+        """
+        return self._ledger(partition).aggregates()
+
+    def aggregates(self) -> Aggregates:
+        """
+        Every partition's aggregates combined - this loads every partition
+
+        Returns:
+            Aggregates: Aggregates of the whole table
+        """
+        return Aggregates.merge(self.partition_aggregates(partition) for partition in range(self.partitions))
+
+    def flush(self) -> None:
+        with self._ledgers_lock:
+            ledgers = list(self._ledgers.values())
+        for ledger in ledgers:
+            ledger.flush()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        with self.locks.exclusive():
+            if self.intents.replaced_on_disk():
+                self.intents.reopen()
+            self._recover()
+        with self._ledgers_lock:
+            ledgers = list(self._ledgers.values())
+            self._ledgers.clear()
+        for ledger in ledgers:
+            ledger.close()
+        self.intents.close()
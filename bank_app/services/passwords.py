@@ -0,0 +1,276 @@
+import concurrent.futures
+import hashlib
+import hmac
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import typing
+from bank_app.services.metrics import instrumented
+
+logging.basicConfig(level=logging.INFO)
+
+# Key derivation used for new and upgraded hashes: "scrypt" or "pbkdf2_sha256"
+DEFAULT_SCHEME = os.environ.get("BANK_PASSWORD_SCHEME", "scrypt")
+# scrypt cost - memory is 128 * N * r bytes, so the defaults use 16 MiB per hash
+SCRYPT_N = int(os.environ.get("BANK_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("BANK_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("BANK_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("BANK_PBKDF2_ITERATIONS", "600000"))
+SALT_BYTES = 16
+
+# Processes deriving hashes. 0 derives them in the calling thread instead.
+DEFAULT_HASH_WORKERS = int(os.environ.get("BANK_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hashes queued or running before callers have to wait for a slot
+DEFAULT_HASH_QUEUE = int(os.environ.get("BANK_HASH_QUEUE", str(4 * max(1, DEFAULT_HASH_WORKERS))))
+# Seconds a caller waits for a slot before giving up
+DEFAULT_HASH_TIMEOUT = float(os.environ.get("BANK_HASH_TIMEOUT", "30"))
+
+HASH_SCHEMES = ["scrypt", "pbkdf2_sha256"]
+
+
+class HashingBusyError(Exception):
+    """Every hashing slot stayed busy for longer than the timeout
+
+    Callers can report it as "try again later" rather than a failed login
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+def is_legacy_hash(stored: str) -> bool:
+    """
+    Whether a stored hash is the original unsalted SHA-256 hex digest
+
+    Versioned hashes are "$"-separated and start with their scheme name
+
+    Args:
+        stored (str): Value of the Password column
+
+    Returns:
+        bool: True for a bare SHA-256 digest
+    """
+    return "$" not in stored
+
+
+def hash_password(password: str, scheme: typing.Optional[str] = None) -> str:
+    """
+    Derive a salted, versioned hash string for a password
+
+    "scrypt$N$r$p$salt$hash" or "pbkdf2_sha256$iterations$salt$hash", salt
+    and hash in hex. The cost parameters are stored with the hash, so
+    changing them later doesn't break existing hashes.
+
+    Args:
+        password (str): Password, as pre-hashed by User.hash_password
+        scheme (typing.Optional[str], optional): One of HASH_SCHEMES. Defaults to DEFAULT_SCHEME.
+
+    Raises:
+        ValueError: Unknown scheme
+
+    Returns:
+        str: Hash string for the Password column
+    """
+    scheme = scheme or DEFAULT_SCHEME
+    salt = os.urandom(SALT_BYTES)
+    if scheme == "scrypt":
+        derived = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${derived.hex()}"
+    if scheme == "pbkdf2_sha256":
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${derived.hex()}"
+    raise ValueError(f"Unknown password scheme {scheme!r}, expected one of {HASH_SCHEMES}")
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Check a password against any stored hash, legacy or versioned
+
+    Args:
+        password (str): Password, as pre-hashed by User.hash_password
+        stored (str): Value of the Password column
+
+    Returns:
+        bool: True if they match
+    """
+    if is_legacy_hash(stored):
+        return hmac.compare_digest(password, stored)
+    scheme, *fields = stored.split("$")
+    if scheme == "scrypt":
+        n, r, p, salt, expected = fields
+        derived = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    elif scheme == "pbkdf2_sha256":
+        iterations, salt, expected = fields
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    else:
+        logging.warning(f"Unknown password scheme {scheme!r}")
+        return False
+    return hmac.compare_digest(derived.hex(), expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    Whether a hash should be replaced after the next successful login
+
+    True for legacy SHA-256 digests and for hashes made with a different
+    scheme or cost than the current settings.
+
+    Args:
+        stored (str): Value of the Password column
+
+    Returns:
+        bool: True if it is out of date
+    """
+    if is_legacy_hash(stored):
+        return True
+    scheme, *fields = stored.split("$")
+    if scheme != DEFAULT_SCHEME:
+        return True
+    if scheme == "scrypt":
+        return fields[:3] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    return fields[0] != str(PBKDF2_ITERATIONS)
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # Default maxmem (32 MiB) is too small for N=2**15 and up
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024)
+
+
+class HashingExecutor:
+    """
+    Process pool that every password hash and verification goes through
+
+    Key derivation is deliberately slow CPU work, so it runs in worker
+    processes: logins on several threads or server connections then use
+    every core, and none of them holds the GIL for the duration of a hash.
+
+    At most `max_pending` hashes are queued or running. Further callers
+    wait for a slot, and give up with HashingBusyError after `timeout`
+    seconds, so a login storm turns into back-pressure instead of an
+    unbounded queue. Legacy SHA-256 comparisons are cheap and never leave
+    the calling thread.
+
+    The pool is started on first use with the spawn start method, which is
+    safe from a process that already runs threads.
+    """
+    def __init__(
+        self,
+        workers: int = DEFAULT_HASH_WORKERS,
+        max_pending: int = DEFAULT_HASH_QUEUE,
+        timeout: float = DEFAULT_HASH_TIMEOUT,
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _with_slot(self, fn: typing.Callable[[], typing.Any]) -> typing.Any:
+        """
+        Call fn once a slot is free, holding it until fn returns
+
+        Raises:
+            HashingBusyError: No slot freed up within the timeout
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusyError("Too many logins in progress, please try again")
+        try:
+            return fn()
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # A worker died - start a fresh pool for the next caller
+            with self._pool_lock:
+                self._pool = None
+            logging.error(f"Error: {e}")
+            raise e
+        finally:
+            self._slots.release()
+
+    def _run(self, fn: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+        """
+        Run fn in the pool once a slot is free and wait for the result
+
+        Raises:
+            HashingBusyError: No slot freed up within the timeout
+        """
+        if self.workers <= 0:
+            return self._with_slot(lambda: fn(*args))
+        return self._with_slot(lambda: self._get_pool().submit(fn, *args).result())
+
+    @instrumented("hashing.hash")
+    def hash(self, password: str) -> str:
+        """
+        New salted hash with the current scheme and cost
+
+        Args:
+            password (str): Password, as pre-hashed by User.hash_password
+
+        Returns:
+            str: Hash string for the Password column
+        """
+        return self._run(hash_password, password, DEFAULT_SCHEME)
+
+    @instrumented("hashing.hash_many")
+    def hash_many(self, passwords: typing.Sequence[str]) -> typing.List[str]:
+        """
+        New salted hashes for many passwords, spread over every worker
+
+        The whole batch holds one slot and goes to the pool in a few large
+        chunks rather than one task per password, so bulk loads don't pay
+        a round trip per hash. Logins still get the other slots, but share
+        the workers with the batch while it runs.
+
+        Args:
+            passwords (typing.Sequence[str]): Passwords, as pre-hashed by User.hash_password
+
+        Returns:
+            typing.List[str]: Hash strings in the same order
+        """
+        if not passwords:
+            return []
+        schemes = itertools.repeat(DEFAULT_SCHEME, len(passwords))
+        if self.workers <= 0:
+            return self._with_slot(lambda: list(map(hash_password, passwords, schemes)))
+        chunksize = max(1, len(passwords) // (4 * self.workers))
+        return self._with_slot(
+            lambda: list(self._get_pool().map(hash_password, passwords, schemes, chunksize=chunksize))
+        )
+
+    @instrumented("hashing.verify")
+    def verify(self, password: str, stored: str) -> bool:
+        """
+        Check a password against a stored hash
+
+        Args:
+            password (str): Password, as pre-hashed by User.hash_password
+            stored (str): Value of the Password column
+
+        Returns:
+            bool: True if they match
+        """
+        if is_legacy_hash(stored):
+            return verify_password(password, stored)
+        return self._run(verify_password, password, stored)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes - a later call starts a new pool
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+# Process-wide executor shared by every User
+HASHER = HashingExecutor()
@@ -0,0 +1,56 @@
+import os
+
+# Where each file that belongs to a bank system CSV lives. Kept free of
+# heavy imports so one-shot commands can find the files without loading
+# the dataframe library.
+
+# "csv" keeps the snapshot in bank_system.csv itself. "ipc" keeps it in an
+# Arrow IPC file next to it, which is read back memory-mapped instead of
+# being parsed from text.
+SNAPSHOT_FORMATS = ["csv", "ipc"]
+DEFAULT_SNAPSHOT_FORMAT = os.environ.get("BANK_SNAPSHOT_FORMAT", "csv")
+
+
+def ipc_path_for(csv_path: str) -> str:
+    """
+    Arrow IPC snapshot that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .arrow file
+    """
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def snapshot_path_for(csv_path: str, snapshot_format: str) -> str:
+    """
+    File the snapshot lives in for a given format
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+
+    Raises:
+        ValueError: Unknown format
+
+    Returns:
+        str: csv_path itself for "csv", the .arrow file for "ipc"
+    """
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format {snapshot_format!r}, expected one of {SNAPSHOT_FORMATS}")
+    return csv_path if snapshot_format == "csv" else ipc_path_for(csv_path)
+
+
+def journal_path_for(csv_path: str) -> str:
+    """
+    Journal file that sits next to a CSV snapshot
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .journal file
+    """
+    return os.path.splitext(csv_path)[0] + ".journal"
@@ -0,0 +1,252 @@
+import decimal
+import hashlib
+import io
+import itertools
+import logging
+import os
+import typing
+import polars as pl
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import parse_amount
+from bank_app.services.passwords import HASHER
+from bank_app.services.storage import StorageBackend, UserRecord
+
+logging.basicConfig(level=logging.INFO)
+
+# Rows read, hashed and written at a time - peak memory grows with this, not with the file
+DEFAULT_PROVISION_CHUNK = int(os.environ.get("BANK_PROVISION_CHUNK", "10000"))
+
+# Columns of a user file. Password is the plain text password and Balance
+# is the optional starting balance in whole units, as people write it.
+USER_FILE_COLUMNS = ["Username", "Password", "Balance"]
+
+# Largest balance in cents an Int64 column holds
+MAX_CENTS = 2 ** 63 - 1
+
+REJECTED_SCHEMA = {
+    "Row": pl.datatypes.UInt32,
+    "Username": pl.datatypes.Utf8,
+    "Reason": pl.datatypes.Utf8,
+}
+
+
+class ProvisionReport:
+    """
+    Outcome of a bulk import - how many users were created and which rows were rejected
+    """
+    def __init__(self) -> None:
+        self.total = 0
+        self.created = 0
+        self._rejected: typing.List[pl.DataFrame] = []
+
+    @property
+    def rejected(self) -> pl.DataFrame:
+        """
+        Rejected rows with their Row number and Reason - passwords are never included
+
+        Returns:
+            pl.DataFrame: Row, Username and Reason columns
+        """
+        if not self._rejected:
+            return pl.DataFrame(schema=REJECTED_SCHEMA)
+        return pl.concat(self._rejected).sort("Row")
+
+    def reject(self, rows: pl.DataFrame) -> None:
+        if rows.height:
+            self._rejected.append(rows.select(list(REJECTED_SCHEMA)).cast(REJECTED_SCHEMA))
+
+    def summary(self) -> str:
+        """
+        One-line human readable summary
+
+        Returns:
+            str: Counts of created and rejected rows
+        """
+        return f"Import of {self.total} users: {self.created} created, {self.rejected.height} rejected"
+
+
+def _normalize(chunk: pl.DataFrame) -> pl.DataFrame:
+    """
+    Every user file column as text, a missing Balance column meaning 0
+
+    Args:
+        chunk (pl.DataFrame): Rows as read from the file
+
+    Returns:
+        pl.DataFrame: Username, Password and Balance as Utf8
+    """
+    if "Balance" not in chunk.columns:
+        chunk = chunk.with_columns(pl.lit(None, dtype=pl.datatypes.Utf8).alias("Balance"))
+    return chunk.select(pl.col(column).cast(pl.datatypes.Utf8) for column in USER_FILE_COLUMNS)
+
+
+def load_user_chunks(path: str, chunk_size: int = DEFAULT_PROVISION_CHUNK) -> typing.Iterator[pl.DataFrame]:
+    """
+    Stream a CSV or JSONL user file a chunk at a time
+
+    Args:
+        path (str): File with Username, Password and optional Balance columns
+        chunk_size (int, optional): Rows per chunk. Defaults to BANK_PROVISION_CHUNK.
+
+    Raises:
+        ValueError: Unsupported file extension
+
+    Returns:
+        typing.Iterator[pl.DataFrame]: Chunks in file order, every column as text
+    """
+    chunk_size = max(1, chunk_size)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        reader = pl.read_csv_batched(path, infer_schema_length=0, batch_size=chunk_size)
+        # The reader's batch size is only a hint, so its batches are re-cut to chunk_size rows
+        pending = pl.DataFrame()
+        while True:
+            batches = reader.next_batches(1)
+            if batches:
+                pending = pl.concat([pending, batches[0]]) if pending.height else batches[0]
+            while pending.height >= chunk_size or (not batches and pending.height):
+                yield _normalize(pending.head(chunk_size))
+                pending = pending.slice(chunk_size)
+            if not batches:
+                return
+    elif extension in (".jsonl", ".ndjson", ".json"):
+        with open(path, "rb") as user_file:
+            while True:
+                lines = [line for line in itertools.islice(user_file, chunk_size) if line.strip()]
+                if not lines:
+                    return
+                yield _normalize(pl.read_ndjson(io.BytesIO(b"".join(lines))))
+    else:
+        raise ValueError(f"Unsupported user file {path}, expected .csv or .jsonl")
+
+
+def _parse_balance(balance: typing.Optional[str]) -> typing.Tuple[typing.Optional[int], typing.Optional[str]]:
+    """
+    Starting balance in cents, read by the same rules as money.parse_amount
+
+    Args:
+        balance (typing.Optional[str]): Balance as written in the file, blank meaning 0
+
+    Returns:
+        typing.Tuple[typing.Optional[int], typing.Optional[str]]: Cents, or None and the reason it was refused
+    """
+    if balance is None or not balance.strip():
+        return 0, None
+    try:
+        value = decimal.Decimal(balance.strip())
+    except decimal.InvalidOperation:
+        return None, "Balance must be a number"
+    if not value.is_finite():
+        return None, "Balance must be a number"
+    try:
+        cents = parse_amount(value)
+    except ValueError:
+        return None, "Balance can't have fractions of a cent"
+    if abs(cents) > MAX_CENTS:
+        return None, "Balance is too large"
+    return cents, None
+
+
+def _validate(users: pl.DataFrame) -> pl.DataFrame:
+    """
+    Checks on one chunk, including repeats of a username within it
+
+    Balances are parsed one by one with parse_amount's Decimal rules, so
+    the CLI, the server and bulk imports accept exactly the same amounts.
+    Next to hashing the passwords that costs nothing. The other checks
+    are vectorized.
+
+    Args:
+        users (pl.DataFrame): Chunk with a Row column
+
+    Returns:
+        pl.DataFrame: users plus Cents and Reason columns, Reason null for valid rows
+    """
+    cents, errors = zip(*map(_parse_balance, users["Balance"])) if users.height else ((), ())
+    users = users.with_columns(
+        pl.Series("Cents", cents, dtype=pl.datatypes.Int64),
+        pl.Series("BalanceError", errors, dtype=pl.datatypes.Utf8),
+    )
+    return users.with_columns(
+        pl.when(pl.col("Username").is_null() | (pl.col("Username").str.strip_chars() == ""))
+            .then(pl.lit("Username is required"))
+        .when(pl.col("Password").is_null() | (pl.col("Password") == ""))
+            .then(pl.lit("Password is required"))
+        .when(pl.col("BalanceError").is_not_null())
+            .then(pl.col("BalanceError"))
+        .when(pl.col("Cents") < 0)
+            .then(pl.lit("Balance can't be negative"))
+        .when(~pl.col("Username").is_first_distinct())
+            .then(pl.lit("Duplicate username in file"))
+        .otherwise(pl.lit(None, dtype=pl.datatypes.Utf8))
+        .alias("Reason")
+    ).drop("BalanceError")
+
+
+@instrumented("provisioning.provision_chunk")
+def _provision_chunk(storage: StorageBackend, users: pl.DataFrame, report: ProvisionReport) -> None:
+    """
+    Validate, hash and create one chunk with a single create_users write
+
+    Args:
+        storage (StorageBackend): Account store to add the users to
+        users (pl.DataFrame): Chunk with a Row column
+        report (ProvisionReport): Report to add the outcome to
+    """
+    validated = _validate(users)
+    report.reject(validated.filter(pl.col("Reason").is_not_null()))
+    candidates = validated.filter(pl.col("Reason").is_null()).drop("Reason")
+
+    # Earlier chunks are already committed, so this also catches repeats across chunks
+    known = pl.DataFrame(
+        {"Username": [username for username in candidates["Username"] if storage.get_balance(username) is not None]},
+        schema={"Username": pl.datatypes.Utf8},
+    )
+    fresh = candidates.join(known, on="Username", how="anti")
+    report.reject(
+        candidates.join(known, on="Username", how="semi")
+        .with_columns(pl.lit("Username already exists").alias("Reason"))
+    )
+    if not fresh.height:
+        return
+
+    prehashed = [hashlib.sha256(password.encode()).hexdigest() for password in fresh["Password"]]
+    hashes = HASHER.hash_many(prehashed)
+    created = storage.create_users([
+        UserRecord(username, password, balance)
+        for username, password, balance in zip(fresh["Username"], hashes, fresh["Cents"])
+    ])
+    report.created += len(created)
+    if len(created) < fresh.height:
+        # Someone else created these between the lookup and the write
+        report.reject(
+            fresh.filter(~pl.col("Username").is_in(created))
+            .with_columns(pl.lit("Username already exists").alias("Reason"))
+        )
+
+
+def provision_users(storage: StorageBackend, chunks: typing.Iterable[pl.DataFrame]) -> ProvisionReport:
+    """
+    Create every valid user in a stream of chunks
+
+    Each chunk is validated with vectorized expressions, repeated
+    usernames within it are rejected, and the rest are anti-joined
+    against the accounts that already exist. Passwords are pre-hashed like
+    User.hash_password and then hashed in bulk on the hashing pool, and
+    the new users are added with one StorageBackend.create_users call, so
+    a chunk costs one write instead of one per user. Only one chunk is in
+    memory at a time.
+
+    Args:
+        storage (StorageBackend): Account store to add the users to
+        chunks (typing.Iterable[pl.DataFrame]): Output of load_user_chunks
+
+    Returns:
+        ProvisionReport: Count of users created and the rejected rows
+    """
+    report = ProvisionReport()
+    for chunk in chunks:
+        _provision_chunk(storage, chunk.with_row_index("Row", offset=report.total), report)
+        report.total += chunk.height
+    logging.info(report.summary())
+    return report
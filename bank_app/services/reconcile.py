@@ -0,0 +1,431 @@
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import typing
+import polars as pl
+from bank_app.services.journal import journal_cents
+from bank_app.services.loader import ACCOUNT_SCHEMA, LEGACY_ACCOUNT_SCHEMA, legacy_cents
+from bank_app.services.locks import get_lock_manager, lock_path_for
+from bank_app.services.metrics import instrumented
+from bank_app.services.money import CENTS_PER_UNIT
+from bank_app.services.paths import DEFAULT_SNAPSHOT_FORMAT, journal_path_for, snapshot_path_for
+from bank_app.services.storage import StorageBackend
+
+logging.basicConfig(level=logging.INFO)
+
+# Rows read from either side at a time
+DEFAULT_RECONCILE_CHUNK = int(os.environ.get("BANK_RECONCILE_CHUNK", "1000000"))
+# Target size of one bucket of the external file - peak memory is a few times this
+DEFAULT_BUCKET_BYTES = int(os.environ.get("BANK_RECONCILE_BUCKET_MB", "64")) * 1024 * 1024
+# Seconds a reconciliation may run before it stops with a partial result, 0 for no limit
+DEFAULT_TIME_BUDGET = float(os.environ.get("BANK_RECONCILE_TIME_BUDGET", "0"))
+
+BALANCE_SCHEMA = {
+    "Username": pl.datatypes.Utf8,
+    "BalanceCents": pl.datatypes.Int64,
+}
+
+MISMATCH_SCHEMA = {
+    "Username": pl.datatypes.Utf8,
+    "StoreBalanceCents": pl.datatypes.Int64,
+    "ExternalBalanceCents": pl.datatypes.Int64,
+    "Issue": pl.datatypes.Utf8,
+}
+
+
+class ReconcileReport:
+    """
+    Outcome of a reconciliation - rows read from each side and mismatches by issue
+    """
+    def __init__(self) -> None:
+        self.accounts = 0
+        self.external = 0
+        self.issues: typing.Dict[str, int] = {}
+        # False if the time budget ran out before every bucket was compared
+        self.complete = True
+        self.elapsed = 0.0
+
+    @property
+    def mismatches(self) -> int:
+        return sum(self.issues.values())
+
+    def add(self, mismatches: pl.DataFrame) -> None:
+        for issue, count in mismatches.group_by("Issue").len().iter_rows():
+            self.issues[issue] = self.issues.get(issue, 0) + count
+
+    def summary(self) -> str:
+        """
+        One-line human readable summary
+
+        Returns:
+            str: Rows compared, mismatch counts and whether the run finished
+        """
+        issues = ", ".join(f"{count} {issue.lower()}" for issue, count in sorted(self.issues.items()))
+        return (
+            f"Reconciled {self.accounts} accounts against {self.external} external rows "
+            f"in {self.elapsed:.1f}s: {self.mismatches} mismatches"
+            + (f" ({issues})" if issues else "")
+            + ("" if self.complete else " - stopped at the time budget, results are incomplete")
+        )
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+@instrumented("reconcile.load_balance_chunks")
+def load_balance_chunks(path: str, chunk_size: int = DEFAULT_RECONCILE_CHUNK) -> typing.Iterator[pl.DataFrame]:
+    """
+    Stream an external balances CSV a chunk at a time
+
+    Args:
+        path (str): CSV with a Username column and either BalanceCents or Balance in whole units
+        chunk_size (int, optional): Rows per chunk, approximately. Defaults to BANK_RECONCILE_CHUNK.
+
+    Raises:
+        ValueError: Missing columns
+
+    Returns:
+        typing.Iterator[pl.DataFrame]: Username and BalanceCents, null where the balance doesn't parse
+    """
+    reader = pl.read_csv_batched(path, infer_schema_length=0, batch_size=max(1, chunk_size))
+    while True:
+        batches = reader.next_batches(1)
+        if not batches:
+            return
+        chunk = batches[0]
+        if "Username" not in chunk.columns:
+            raise ValueError(f"{path} needs a Username column")
+        if "BalanceCents" in chunk.columns:
+            cents = pl.col("BalanceCents").cast(pl.datatypes.Int64, strict=False)
+        elif "Balance" in chunk.columns:
+            cents = (
+                pl.col("Balance").cast(pl.datatypes.Float64, strict=False) * CENTS_PER_UNIT
+            ).round(0).cast(pl.datatypes.Int64)
+        else:
+            raise ValueError(f"{path} needs a BalanceCents or Balance column")
+        yield chunk.select(pl.col("Username"), cents.alias("BalanceCents"))
+
+
+def storage_balance_chunks(storage: StorageBackend, chunk_size: int = DEFAULT_RECONCILE_CHUNK) -> typing.Iterator[pl.DataFrame]:
+    """
+    Stream any backend's balances through StorageBackend.iter_accounts
+
+    Args:
+        storage (StorageBackend): Account store to read
+        chunk_size (int, optional): Accounts per chunk. Defaults to BANK_RECONCILE_CHUNK.
+
+    Returns:
+        typing.Iterator[pl.DataFrame]: Username and BalanceCents
+    """
+    for batch in storage.iter_accounts(chunk_size):
+        yield pl.DataFrame(
+            {
+                "Username": [record.username for record in batch],
+                "BalanceCents": [record.balance for record in batch],
+            },
+            schema=BALANCE_SCHEMA,
+        )
+
+
+def _journal_balances(journal_path: str) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]:
+    """
+    Fold the journal into final balances, the way Ledger._apply_record would
+
+    Args:
+        journal_path (str): Journal file
+
+    Returns:
+        typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]: Balances it last set, and the opening
+            balances of the accounts it created, in creation order
+    """
+    balances: typing.Dict[str, int] = {}
+    created: typing.Dict[str, int] = {}
+    try:
+        journal_file = open(journal_path, "rb")
+    except FileNotFoundError:
+        return balances, created
+    with journal_file:
+        for line in journal_file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record["op"]
+            if op == "create":
+                created.setdefault(record["user"], journal_cents(record["balance"]))
+            elif op == "create_many":
+                for username, _, balance in record["users"]:
+                    created.setdefault(username, journal_cents(balance))
+            elif op in ("deposit", "withdraw", "set"):
+                balances[record["user"]] = journal_cents(record["balance"])
+            elif op == "batch":
+                for username, balance in record["balances"].items():
+                    balances[username] = journal_cents(balance)
+            elif op == "transfer":
+                balances[record["from"]] = journal_cents(record["from_balance"])
+                balances[record["to"]] = journal_cents(record["to_balance"])
+    return balances, created
+
+
+def _csv_snapshot_chunks(snapshot_file: typing.BinaryIO, chunk_size: int) -> typing.Iterator[pl.DataFrame]:
+    header = snapshot_file.readline()
+    legacy = b"BalanceCents" not in header
+    while True:
+        lines = list(itertools.islice(snapshot_file, chunk_size))
+        if not lines:
+            return
+        chunk = pl.read_csv(
+            io.BytesIO(header + b"".join(lines)), dtypes=LEGACY_ACCOUNT_SCHEMA if legacy else ACCOUNT_SCHEMA
+        )
+        yield chunk.select("Username", legacy_cents(pl.col("Balance")) if legacy else "BalanceCents")
+
+
+def _ipc_snapshot_chunks(snapshot: pl.DataFrame, chunk_size: int) -> typing.Iterator[pl.DataFrame]:
+    balance = "BalanceCents" if "BalanceCents" in snapshot.columns else legacy_cents(pl.col("Balance"))
+    for start in range(0, snapshot.height, chunk_size):
+        yield snapshot.slice(start, chunk_size).select("Username", balance)
+
+
+@instrumented("reconcile.snapshot_balance_chunks")
+def snapshot_balance_chunks(
+    csv_path: str, chunk_size: int = DEFAULT_RECONCILE_CHUNK, snapshot_format: str = DEFAULT_SNAPSHOT_FORMAT
+) -> typing.Iterator[pl.DataFrame]:
+    """
+    Stream the CSV backend's current balances without loading the table
+
+    The snapshot is read a chunk at a time (a CSV line by line, an IPC
+    file memory-mapped) and the balances the journal ends with are laid
+    over it, followed by the accounts the journal created. Only the
+    journal's accounts are held in memory, and checkpoints keep that
+    small. The snapshot is opened and the journal read under the table
+    lock, so a checkpoint can't swap one and rotate the other in between.
+    The open handle keeps the file being read even if a checkpoint
+    replaces it afterwards.
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        chunk_size (int, optional): Rows per chunk. Defaults to BANK_RECONCILE_CHUNK.
+        snapshot_format (str, optional): One of SNAPSHOT_FORMATS. Defaults to BANK_SNAPSHOT_FORMAT.
+
+    Returns:
+        typing.Iterator[pl.DataFrame]: Username and BalanceCents, in snapshot order
+    """
+    chunk_size = max(1, chunk_size)
+    snapshot_path = snapshot_path_for(csv_path, snapshot_format)
+    if not os.path.exists(snapshot_path):
+        # The IPC snapshot is created from the CSV the first time a ledger opens it
+        snapshot_path, snapshot_format = csv_path, "csv"
+    snapshot_file: typing.Optional[typing.BinaryIO] = None
+    with get_lock_manager(lock_path_for(csv_path)).accounts():
+        if snapshot_format == "ipc":
+            chunks = _ipc_snapshot_chunks(pl.read_ipc(snapshot_path, memory_map=True), chunk_size)
+        else:
+            snapshot_file = open(snapshot_path, "rb")
+            chunks = _csv_snapshot_chunks(snapshot_file, chunk_size)
+        balances, created = _journal_balances(journal_path_for(csv_path))
+    try:
+        for chunk in chunks:
+            if balances:
+                chunk = chunk.with_columns(pl.coalesce(
+                    pl.col("Username").replace(balances, default=None, return_dtype=pl.datatypes.Int64),
+                    pl.col("BalanceCents"),
+                ).alias("BalanceCents"))
+            yield chunk.cast(BALANCE_SCHEMA)
+        # An account created again after a crash is also in the snapshot, and _compare keeps the first row
+        usernames = list(created)
+        for start in range(0, len(usernames), chunk_size):
+            chunk_usernames = usernames[start:start + chunk_size]
+            yield pl.DataFrame(
+                {
+                    "Username": chunk_usernames,
+                    "BalanceCents": [balances.get(username, created[username]) for username in chunk_usernames],
+                },
+                schema=BALANCE_SCHEMA,
+            )
+    finally:
+        if snapshot_file is not None:
+            snapshot_file.close()
+
+
+class _BucketFiles:
+    """
+    One side of the comparison, split by username hash into headerless CSV files
+    """
+    def __init__(self, directory: str, name: str, buckets: int) -> None:
+        self.buckets = buckets
+        self.paths = [os.path.join(directory, f"{name}-{bucket}.csv") for bucket in range(buckets)]
+        self._files = [open(path, "wb") for path in self.paths]
+
+    def write(self, rows: pl.DataFrame) -> None:
+        """
+        Append rows to the bucket each username hashes to
+
+        Args:
+            rows (pl.DataFrame): Username and BalanceCents
+        """
+        rows = rows.with_columns((pl.col("Username").hash(seed=0) % self.buckets).alias("Bucket"))
+        for part in rows.partition_by("Bucket"):
+            part.drop("Bucket").write_csv(self._files[part["Bucket"][0]], include_header=False)
+
+    def close(self) -> None:
+        for bucket_file in self._files:
+            bucket_file.close()
+
+    def read(self, bucket: int) -> pl.DataFrame:
+        if os.path.getsize(self.paths[bucket]) == 0:
+            return pl.DataFrame(schema=BALANCE_SCHEMA)
+        return pl.read_csv(self.paths[bucket], has_header=False, schema=BALANCE_SCHEMA)
+
+
+def _compare(store: pl.DataFrame, external: pl.DataFrame) -> pl.DataFrame:
+    """
+    Every mismatch between the two sides of one bucket
+
+    Args:
+        store (pl.DataFrame): Username and BalanceCents from the account store
+        external (pl.DataFrame): Username and BalanceCents from the external file
+
+    Returns:
+        pl.DataFrame: Mismatches with MISMATCH_SCHEMA columns, sorted by Username
+    """
+    duplicates = external.filter(~pl.col("Username").is_first_distinct()).select(
+        pl.col("Username"),
+        pl.lit(None, dtype=pl.datatypes.Int64).alias("StoreBalanceCents"),
+        pl.col("BalanceCents").alias("ExternalBalanceCents"),
+        pl.lit("Duplicate in external file").alias("Issue"),
+    )
+    # A username repeated in the store resolves to its first row, same as lookups
+    store = store.filter(pl.col("Username").is_first_distinct())
+    joined = store.select(
+        pl.col("Username"), pl.col("BalanceCents").alias("StoreBalanceCents"), pl.lit(True).alias("InStore")
+    ).join(
+        external.filter(pl.col("Username").is_first_distinct()).select(
+            pl.col("Username"), pl.col("BalanceCents").alias("ExternalBalanceCents"), pl.lit(True).alias("InExternal")
+        ),
+        on="Username",
+        how="outer_coalesce",
+    )
+    mismatches = joined.with_columns(
+        pl.when(pl.col("InExternal").is_null())
+            .then(pl.lit("Missing from external file"))
+        .when(pl.col("InStore").is_null())
+            .then(pl.lit("Missing from store"))
+        .when(pl.col("ExternalBalanceCents").is_null())
+            .then(pl.lit("Invalid external balance"))
+        .when(pl.col("StoreBalanceCents") != pl.col("ExternalBalanceCents"))
+            .then(pl.lit("Balance differs"))
+        .otherwise(pl.lit(None, dtype=pl.datatypes.Utf8))
+        .alias("Issue")
+    ).filter(pl.col("Issue").is_not_null()).select(list(MISMATCH_SCHEMA))
+    return pl.concat([mismatches, duplicates]).sort("Username")
+
+
+@instrumented("reconcile.reconcile")
+def reconcile(
+    storage: typing.Union[StorageBackend, typing.Iterable[pl.DataFrame]],
+    external_path: str,
+    output_path: typing.Optional[str] = None,
+    on_mismatches: typing.Optional[typing.Callable[[pl.DataFrame], None]] = None,
+    chunk_size: int = DEFAULT_RECONCILE_CHUNK,
+    buckets: typing.Optional[int] = None,
+    time_budget: float = DEFAULT_TIME_BUDGET,
+) -> ReconcileReport:
+    """
+    Compare every balance in the account store with an external balances file
+
+    A hash join that spills to disk, so memory does not depend on the
+    number of accounts. Both sides are streamed a chunk at a time
+    (storage_balance_chunks or snapshot_balance_chunks, and a batched CSV
+    reader) and split by username
+    hash into bucket files in a temporary directory. Then the buckets are
+    joined one pair at a time and their mismatches are emitted before the
+    next pair is read. Only one chunk or one bucket pair is ever in
+    memory. The bucket count is picked so a bucket of the external file is
+    about BANK_RECONCILE_BUCKET_MB.
+
+    Args:
+        storage (typing.Union[StorageBackend, typing.Iterable[pl.DataFrame]]): Account store to check, or its Username and BalanceCents chunks
+        external_path (str): External balances CSV, see load_balance_chunks
+        output_path (typing.Optional[str], optional): CSV to write mismatches to as they are found. Defaults to None.
+        on_mismatches (typing.Optional[typing.Callable[[pl.DataFrame], None]], optional): Called with each bucket's mismatches. Defaults to None.
+        chunk_size (int, optional): Rows read at a time. Defaults to BANK_RECONCILE_CHUNK.
+        buckets (typing.Optional[int], optional): Bucket files per side. Defaults to one per BANK_RECONCILE_BUCKET_MB of the external file.
+        time_budget (float, optional): Seconds before giving up with a partial result, 0 for no limit. Defaults to BANK_RECONCILE_TIME_BUDGET.
+
+    Returns:
+        ReconcileReport: Counts of rows and mismatches
+    """
+    started = time.monotonic()
+    deadline = started + time_budget if time_budget > 0 else None
+    buckets = buckets or max(1, math.ceil(os.path.getsize(external_path) / DEFAULT_BUCKET_BYTES))
+    report = ReconcileReport()
+
+    def check_time() -> None:
+        if deadline is not None and time.monotonic() > deadline:
+            raise _OutOfTime()
+
+    output_file = open(output_path, "wb") if output_path else None
+    try:
+        if output_file is not None:
+            pl.DataFrame(schema=MISMATCH_SCHEMA).write_csv(output_file)
+
+        def emit(mismatches: pl.DataFrame) -> None:
+            if not mismatches.height:
+                return
+            report.add(mismatches)
+            if output_file is not None:
+                mismatches.write_csv(output_file, include_header=False)
+                output_file.flush()
+            if on_mismatches is not None:
+                on_mismatches(mismatches)
+
+        with tempfile.TemporaryDirectory(prefix="bank-reconcile-") as directory:
+            store_buckets = _BucketFiles(directory, "store", buckets)
+            external_buckets = _BucketFiles(directory, "external", buckets)
+            try:
+                if isinstance(storage, StorageBackend):
+                    storage = storage_balance_chunks(storage, chunk_size)
+                for chunk in storage:
+                    store_buckets.write(chunk)
+                    report.accounts += chunk.height
+                    check_time()
+                for chunk in load_balance_chunks(external_path, chunk_size):
+                    unnamed = pl.col("Username").is_null() | (pl.col("Username") == "")
+                    emit(chunk.filter(unnamed).select(
+                        pl.col("Username"),
+                        pl.lit(None, dtype=pl.datatypes.Int64).alias("StoreBalanceCents"),
+                        pl.col("BalanceCents").alias("ExternalBalanceCents"),
+                        pl.lit("Missing username").alias("Issue"),
+                    ))
+                    external_buckets.write(chunk.filter(~unnamed))
+                    report.external += chunk.height
+                    check_time()
+                store_buckets.close()
+                external_buckets.close()
+
+                for bucket in range(buckets):
+                    check_time()
+                    emit(_compare(store_buckets.read(bucket), external_buckets.read(bucket)))
+            except _OutOfTime:
+                report.complete = False
+            finally:
+                store_buckets.close()
+                external_buckets.close()
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    report.elapsed = time.monotonic() - started
+    if report.complete:
+        logging.info(report.summary())
+    else:
+        logging.warning(report.summary())
+    return report
@@ -0,0 +1,261 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import typing
+from bank_app.services.bank_account import ACCOUNTS, BankAccount, BankAccountService
+from bank_app.services.commands import MAX_LINE_BYTES, dispatch, encode
+from bank_app.services.credentials import CREDENTIALS
+from bank_app.services.history import DEFAULT_STATEMENT_LIMIT
+from bank_app.services.metrics import METRICS
+from bank_app.services.money import format_cents, parse_amount
+from bank_app.services.storage import default_csv_path
+from bank_app.services.users import User
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Storage calls are short, so a modest pool keeps up with thousands of
+# mostly idle connections
+DEFAULT_WORKERS = 32
+
+# Pending connections the listening socket queues up
+BACKLOG = 4096
+
+
+class Session:
+    """
+    Per-connection state - who is logged in on this socket
+
+    Everything a logged-in connection needs is built once at login, so
+    later requests only look things up.
+    """
+    __slots__ = ("user", "account", "service")
+
+    def __init__(self) -> None:
+        self.user: typing.Optional[User] = None
+        self.account: typing.Optional[BankAccount] = None
+        self.service: typing.Optional[BankAccountService] = None
+
+
+class BankServer:
+    """
+    Line-delimited JSON front-end for the bank over asyncio TCP streams
+
+    Every request is one JSON object on its own line, e.g.
+    {"op": "deposit", "amount": "10.50", "id": 1}, and gets exactly one response
+    line back: {"ok": true, "balance": "409.50", "id": 1} or
+    {"ok": false, "error": "...", "id": 1}. The optional id is echoed so
+    clients can match responses. Amounts may be JSON numbers or strings in
+    whole units; balances come back as decimal strings so no client ever
+    sees a rounded float.
+
+    Operations reuse User and BankAccount. Those make blocking storage
+    calls, so each request runs in a thread pool and the event loop only
+    ever does socket I/O. Requests on one connection are answered in order.
+    """
+    def __init__(
+        self,
+        csv_path: typing.Optional[str] = None,
+        workers: int = DEFAULT_WORKERS,
+    ) -> None:
+        """
+        Args:
+            csv_path (typing.Optional[str], optional): Bank system CSV to serve. Defaults to bank_app/data/bank_system.csv.
+            workers (int, optional): Threads running storage operations. Defaults to DEFAULT_WORKERS.
+        """
+        self.csv_path = csv_path or default_csv_path()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bank-server"
+        )
+        self.operations: typing.Dict[
+            str, typing.Callable[[Session, typing.Dict[str, typing.Any]], typing.Dict[str, typing.Any]]
+        ] = {
+            "create": self.op_create,
+            "login": self.op_login,
+            "logout": self.op_logout,
+            "deposit": self.op_deposit,
+            "withdraw": self.op_withdraw,
+            "transfer": self.op_transfer,
+            "balance": self.op_balance,
+            "statement": self.op_statement,
+            "metrics": self.op_metrics,
+        }
+
+    def _user(self, username: str, password: typing.Optional[str] = None) -> User:
+        return User(username, password, csv_path=self.csv_path)
+
+    def _account(self, username: str) -> BankAccount:
+        return ACCOUNTS.account(username, self.csv_path)
+
+    def _logged_in(self, session: Session) -> BankAccount:
+        if session.account is None:
+            raise ValueError("Not logged in")
+        return session.account
+
+    def op_create(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        user = self._user(str(request["username"]), str(request["password"]))
+        user.create(parse_amount(request.get("balance", 0)))
+        return {"username": user.username}
+
+    def op_login(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        user = self._user(str(request["username"]), str(request["password"]))
+        user.login()
+        session.user = user
+        session.account = self._account(user.username)
+        session.service = BankAccountService(user, session.account)
+        return {"username": user.username}
+
+    def op_logout(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        account = self._logged_in(session)
+        account.flush()
+        session.user = None
+        session.account = None
+        session.service = None
+        return {}
+
+    def op_deposit(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        balance = self._logged_in(session).deposit(parse_amount(request["amount"]))
+        return {"balance": format_cents(balance)}
+
+    def op_withdraw(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        balance = self._logged_in(session).withdraw(parse_amount(request["amount"]))
+        return {"balance": format_cents(balance)}
+
+    def op_transfer(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        account = self._logged_in(session)
+        recipient = self._account(str(request["recipient"]))
+        balance = session.service.transfer(
+            account, recipient, parse_amount(request["amount"])
+        )
+        return {"balance": format_cents(balance)}
+
+    def op_balance(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        return {"balance": format_cents(self._logged_in(session).balance)}
+
+    def op_statement(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        account = self._logged_in(session)
+        if "start" in request:
+            end = request.get("end")
+            entries = account.statement(
+                start=datetime.date.fromisoformat(request["start"]),
+                end=datetime.date.fromisoformat(end) if end else None,
+            )
+        else:
+            entries = account.statement(limit=int(request.get("limit", DEFAULT_STATEMENT_LIMIT)))
+        return {
+            "transactions": [
+                {
+                    "id": entry.id,
+                    "time": datetime.datetime.fromtimestamp(entry.ts).isoformat(timespec="seconds"),
+                    "type": entry.type,
+                    "source": entry.source,
+                    "destination": entry.destination,
+                    "amount": format_cents(entry.amount),
+                    "balance": format_cents(entry.balance),
+                }
+                for entry in entries
+            ]
+        }
+
+    def op_metrics(self, session: Session, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        return {"metrics": METRICS.snapshot(), "credential_cache": CREDENTIALS.stats()}
+
+    def handle_request(self, session: Session, request: typing.Any) -> typing.Dict[str, typing.Any]:
+        """
+        Run one decoded request - blocking, called from the thread pool
+
+        Args:
+            session (Session): State of the connection the request came in on
+            request (typing.Any): Decoded JSON line
+
+        Returns:
+            typing.Dict[str, typing.Any]: Response object
+        """
+        return dispatch(self.operations, request, session, metric_prefix="server")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve one client until it disconnects
+
+        Args:
+            reader (asyncio.StreamReader): Incoming request lines
+            writer (asyncio.StreamWriter): Outgoing response lines
+        """
+        loop = asyncio.get_running_loop()
+        session = Session()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # readline raises ValueError once a line passes the stream limit
+                    writer.write(encode({"ok": False, "error": "Request too long"}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "error": "Invalid JSON"}
+                else:
+                    response = await loop.run_in_executor(
+                        self.executor, functools.partial(self.handle_request, session, request)
+                    )
+                writer.write(encode(response))
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            if session.account is not None:
+                # Same as leaving the interactive menu - nothing batched is left behind
+                await loop.run_in_executor(self.executor, session.account.flush)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """
+        Start listening without blocking
+
+        Args:
+            host (str, optional): Interface to bind. Defaults to DEFAULT_HOST.
+            port (int, optional): TCP port, 0 picks a free one. Defaults to DEFAULT_PORT.
+
+        Returns:
+            asyncio.AbstractServer: Listening server
+        """
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_LINE_BYTES, backlog=BACKLOG
+        )
+        for sock in server.sockets:
+            logging.info(f"Bank server listening on {sock.getsockname()}")
+        return server
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """
+        Listen and serve until cancelled
+
+        Args:
+            host (str, optional): Interface to bind. Defaults to DEFAULT_HOST.
+            port (int, optional): TCP port. Defaults to DEFAULT_PORT.
+        """
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        """
+        Wait for in-flight storage operations and stop the thread pool
+        """
+        self.executor.shutdown(wait=True)
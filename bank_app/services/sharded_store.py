@@ -0,0 +1,654 @@
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import typing
+import uuid
+from bank_app.services.aggregates import Aggregates
+from bank_app.services.journal import Journal
+from bank_app.services.metrics import instrumented
+from bank_app.services.partitioned_store import (
+    DEFAULT_PARTITIONS,
+    INTENTS_NAME,
+    PartitionedBackend,
+    partition_dir_for,
+    partition_for,
+)
+from bank_app.services.storage import DEFAULT_SCAN_BATCH, StorageBackend, UserRecord, validate_deltas, validate_transfer
+
+logging.basicConfig(level=logging.INFO)
+
+# Worker processes started by a sharded backend, capped at the partition count
+DEFAULT_SHARDS = int(os.environ.get("BANK_SHARDS", str(os.cpu_count() or 1)))
+# Seconds to wait for a worker to exit once asked to close
+SHUTDOWN_TIMEOUT = 30.0
+# Times the coordinator sends a commit leg before giving up on it
+COMMIT_ATTEMPTS = 3
+
+# Request id of the message a worker sends once its store is open
+READY = -1
+
+# Worker ops that write these accounts, so have to wait while a cross-shard transaction holds them
+_WRITES: typing.Dict[str, typing.Callable[..., typing.Iterable[str]]] = {
+    "set_balance": lambda username, *_: [username],
+    "apply_delta": lambda username, *_: [username],
+    "transfer": lambda source, recipient, *_: [source, recipient],
+    "apply_deltas": lambda deltas, *_: list(deltas),
+    "create_user": lambda username, *_: [username],
+    "create_users": lambda users: [user.username for user in users],
+    "prepare": lambda txn, usernames: usernames,
+}
+
+
+def shard_for(username: str, partitions: int, shards: int) -> int:
+    """
+    Worker process that owns a username
+
+    Whole partitions are dealt out round-robin, so a shard is a fixed set of
+    partition files and no two workers ever write the same file.
+
+    Args:
+        username (str): Account name
+        partitions (int): Partitions in the store
+        shards (int): Worker processes
+
+    Returns:
+        int: Shard in [0, shards)
+    """
+    return partition_for(username, partitions) % shards
+
+
+class ShardError(Exception):
+    """A shard worker process exited or could not open its partitions"""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ShardWorker:
+    """
+    Request loop of one shard, run in its own process by serve_shard()
+
+    Every operation on the shard's accounts is executed here, one at a
+    time, against a PartitionedBackend that only ever loads this shard's
+    partitions.
+
+    Cross-shard transactions reserve their accounts with "prepare" and
+    release them with "commit" or "abort". A write touching a reserved
+    account is parked, in arrival order, until the reservation is
+    released; reads see the last committed balance and never wait.
+
+    A commit leg that fails to write keeps its accounts reserved, since
+    the other legs of the transaction may already be applied. It is
+    written again when the coordinator retries it or a later write needs
+    those accounts; until then such writes are rejected rather than parked.
+    """
+    def __init__(self, backend: PartitionedBackend, conn: multiprocessing.connection.Connection) -> None:
+        self.backend = backend
+        self.conn = conn
+        # Username -> transaction that reserved it
+        self._reserved: typing.Dict[str, str] = {}
+        self._waiting: typing.List[typing.Tuple[int, str, typing.Tuple[typing.Any, ...]]] = []
+        # Transaction -> balances of its commit leg that failed to write
+        self._unwritten: typing.Dict[str, typing.Dict[str, int]] = {}
+
+    def run(self) -> None:
+        """
+        Serve requests until the coordinator asks to close or goes away
+        """
+        while True:
+            try:
+                request_id, op, args = self.conn.recv()
+            except (EOFError, OSError):
+                logging.warning("Coordinator went away, closing shard")
+                self.backend.close()
+                return
+            if op == "close":
+                self.backend.close()
+                self.conn.send((request_id, True, None))
+                return
+            self.handle(request_id, op, args)
+
+    def handle(self, request_id: int, op: str, args: typing.Tuple[typing.Any, ...]) -> None:
+        """
+        Execute a request now, or park it behind a reservation
+
+        Args:
+            request_id (int): Id the reply is tagged with
+            op (str): Operation name
+            args (typing.Tuple[typing.Any, ...]): Operation arguments
+        """
+        if self._unwritten and op in _WRITES:
+            stuck = set(_WRITES[op](*args)) & self._unwritten_accounts()
+            if stuck:
+                self._roll_forward()
+                stuck &= self._unwritten_accounts()
+            if stuck:
+                error = ShardError(f"Account {', '.join(sorted(stuck))} has a transaction that failed to commit")
+                self.conn.send((request_id, False, error))
+                return
+        if self._blocked(op, args, self._waiting):
+            self._waiting.append((request_id, op, args))
+            return
+        self._execute(request_id, op, args)
+        if op in ("commit", "abort"):
+            self._resume()
+
+    def _blocked(
+        self,
+        op: str,
+        args: typing.Tuple[typing.Any, ...],
+        ahead: typing.List[typing.Tuple[int, str, typing.Tuple[typing.Any, ...]]],
+    ) -> bool:
+        """
+        Whether a write has to wait for a reservation, or for a parked write on the same account
+        """
+        if op not in _WRITES:
+            return False
+        usernames = set(_WRITES[op](*args))
+        if usernames & self._reserved.keys():
+            return True
+        return any(usernames & set(_WRITES[parked_op](*parked_args)) for _, parked_op, parked_args in ahead)
+
+    def _unwritten_accounts(self) -> typing.Set[str]:
+        return {username for balances in self._unwritten.values() for username in balances}
+
+    def _roll_forward(self) -> None:
+        """
+        Write the failed commit legs again, releasing each one that succeeds
+        """
+        for txn, balances in list(self._unwritten.items()):
+            try:
+                self._write_leg(balances)
+            except Exception as e:
+                logging.warning(f"Transaction {txn}: commit leg still fails: {e}")
+                continue
+            del self._unwritten[txn]
+            self.op_abort(txn)
+            logging.info(f"Transaction {txn}: rolled the failed commit leg forward")
+        self._resume()
+
+    def _resume(self) -> None:
+        """
+        Run every parked request that a released reservation unblocked
+        """
+        progressed = True
+        while progressed:
+            progressed = False
+            for index, (request_id, op, args) in enumerate(self._waiting):
+                if not self._blocked(op, args, self._waiting[:index]):
+                    del self._waiting[index]
+                    self._execute(request_id, op, args)
+                    progressed = True
+                    break
+
+    def _execute(self, request_id: int, op: str, args: typing.Tuple[typing.Any, ...]) -> None:
+        # Two-phase commit steps are handled here, everything else is a StorageBackend method
+        handler = getattr(self, f"op_{op}", None) or getattr(self.backend, op)
+        try:
+            result = handler(*args)
+        except Exception as e:
+            self.conn.send((request_id, False, e))
+        else:
+            self.conn.send((request_id, True, result))
+
+    def op_prepare(self, txn: str, usernames: typing.List[str]) -> typing.Dict[str, typing.Optional[int]]:
+        """
+        Phase one - reserve accounts for txn and report their balances
+
+        Returns:
+            typing.Dict[str, typing.Optional[int]]: Username -> balance, None if missing
+        """
+        for username in usernames:
+            self._reserved[username] = txn
+        return {username: self.backend.get_balance(username) for username in usernames}
+
+    def op_commit(self, txn: str, balances: typing.Dict[str, int]) -> None:
+        """
+        Phase two - write the decided balances durably, then release txn's accounts
+
+        If the write fails the accounts stay reserved: releasing them
+        would let a later write change a balance the other legs were
+        decided against. The leg is kept to be written again.
+        """
+        self._unwritten.pop(txn, None)
+        try:
+            self._write_leg(balances)
+        except Exception as e:
+            self._unwritten[txn] = balances
+            raise e
+        self.op_abort(txn)
+
+    def _write_leg(self, balances: typing.Dict[str, int]) -> None:
+        for username, balance in balances.items():
+            self.backend.set_balance(username, balance)
+        self.backend.flush()
+
+    def op_abort(self, txn: str) -> None:
+        """
+        Release txn's accounts without writing anything
+        """
+        for username in [username for username, holder in self._reserved.items() if holder == txn]:
+            del self._reserved[username]
+
+    def op_partition_accounts(self, partitions: typing.List[int]) -> typing.Dict[int, typing.List[UserRecord]]:
+        """
+        Accounts of the given partitions, which must all belong to this shard
+
+        Returns:
+            typing.Dict[int, typing.List[UserRecord]]: Partition -> its accounts
+        """
+        return {partition: self.backend.partition_accounts(partition) for partition in partitions}
+
+    def op_partition_aggregates(self, partitions: typing.List[int]) -> typing.List[Aggregates]:
+        """
+        Aggregates of the given partitions, which must all belong to this shard
+
+        Returns:
+            typing.List[Aggregates]: One per partition
+        """
+        return [self.backend.partition_aggregates(partition) for partition in partitions]
+
+
+def serve_shard(csv_path: str, conn: multiprocessing.connection.Connection) -> None:
+    """
+    Entry point of a shard worker process
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        conn (multiprocessing.connection.Connection): Pipe to the coordinator
+    """
+    # Ctrl-C goes to the whole process group - let the coordinator shut us down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        backend = PartitionedBackend(csv_path)
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        conn.send((READY, False, e))
+        return
+    conn.send((READY, True, None))
+    ShardWorker(backend, conn).run()
+
+
+class ShardClient:
+    """
+    Coordinator side of one worker process
+
+    Any number of threads can have requests in flight at once. Requests
+    are written to the pipe under a lock and a reader thread hands each
+    reply to the Future waiting for it.
+    """
+    def __init__(self, context: typing.Any, csv_path: str, shard: int) -> None:
+        self.shard = shard
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=serve_shard, args=(csv_path, child_conn), name=f"bank-shard-{shard}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._pending: typing.Dict[int, concurrent.futures.Future] = {}
+        self._pending_lock = threading.Lock()
+        self._exited = False
+        self._reader: typing.Optional[threading.Thread] = None
+
+    def wait_ready(self) -> None:
+        """
+        Block until the worker has opened its store, then start reading replies
+
+        Raises:
+            ShardError: The worker failed to start
+        """
+        try:
+            _, ok, error = self._conn.recv()
+        except (EOFError, OSError):
+            ok, error = False, None
+        if not ok:
+            self.process.join(SHUTDOWN_TIMEOUT)
+            raise ShardError(f"Shard {self.shard} failed to start: {error}")
+        self._reader = threading.Thread(target=self._read_replies, name=f"bank-shard-{self.shard}-reader", daemon=True)
+        self._reader.start()
+
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                request_id, ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._pending_lock:
+                future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+        with self._pending_lock:
+            self._exited = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(ShardError(f"Shard {self.shard} exited"))
+
+    def submit(self, op: str, *args: typing.Any) -> concurrent.futures.Future:
+        """
+        Send a request without waiting for the reply
+
+        Args:
+            op (str): Operation name
+            args (typing.Any): Operation arguments
+
+        Raises:
+            ShardError: The worker has exited
+
+        Returns:
+            concurrent.futures.Future: Resolves to the result, or raises the worker's exception
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        request_id = next(self._ids)
+        with self._pending_lock:
+            if self._exited:
+                raise ShardError(f"Shard {self.shard} exited")
+            self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                self._conn.send((request_id, op, args))
+        except OSError as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise ShardError(f"Shard {self.shard} exited") from e
+        return future
+
+    def call(self, op: str, *args: typing.Any) -> typing.Any:
+        """
+        Send a request and wait for the reply
+
+        Args:
+            op (str): Operation name
+            args (typing.Any): Operation arguments
+
+        Returns:
+            typing.Any: Result of the operation
+        """
+        return self.submit(op, *args).result()
+
+    def join(self) -> None:
+        """
+        Wait for the worker and reader to finish after a close request
+        """
+        self.process.join(SHUTDOWN_TIMEOUT)
+        if self.process.is_alive():
+            logging.warning(f"Shard {self.shard} did not exit, terminating it")
+            self.process.terminate()
+        if self._reader is not None:
+            self._reader.join()
+        self._conn.close()
+
+
+class ShardedBackend(StorageBackend):
+    """
+    Partitioned store served by one worker process per shard
+
+    One Python process tops out at a single core for Polars, journal and
+    protocol work. Here the partitions are dealt out between N worker
+    processes (spawned, one per core by default) and this object, the
+    coordinator, routes every call by username hash to the worker owning
+    the account. Workers run in parallel and each one is the only writer
+    of its partition files.
+
+    Anything touching one shard - including transfers between two of its
+    accounts - is a single request. Writes spanning shards use two-phase
+    commit: each shard involved reserves its accounts and reports their
+    balances (prepare, in shard order so two transactions can't wait on
+    each other), the coordinator validates, fsyncs its decision to the
+    partition store's intent log and tells every shard to write its leg
+    (commit), or releases the reservations (abort). A leg that fails to
+    write is sent again, up to COMMIT_ATTEMPTS times, and its shard keeps
+    the accounts reserved until it lands. A decision whose legs didn't all
+    land - the coordinator died, or a leg still failed and was logged as
+    failed - is rolled forward the next time the store is opened, exactly
+    like a cross-partition write.
+
+    The files are the same as the "partitioned" backend's, so a store can
+    be opened either way - just not by both at once.
+    """
+    def __init__(self, csv_path: str, shards: int = DEFAULT_SHARDS) -> None:
+        self.csv_path = csv_path
+        # Creates the partitions if needed and rolls forward anything left open
+        store = PartitionedBackend(csv_path, max(DEFAULT_PARTITIONS, shards))
+        self.partitions = store.partitions
+        store.close()
+        self.shards = max(1, min(shards, self.partitions))
+        self._closed = False
+
+        context = multiprocessing.get_context("spawn")
+        self._clients = [ShardClient(context, csv_path, shard) for shard in range(self.shards)]
+        try:
+            for client in self._clients:
+                client.wait_ready()
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            self._shutdown()
+            raise e
+        self.intents = Journal(os.path.join(partition_dir_for(csv_path), INTENTS_NAME))
+        self._intents_lock = threading.Lock()
+        logging.info(f"Started {self.shards} shard workers over {self.partitions} partitions")
+
+    def _client_for(self, username: str) -> ShardClient:
+        return self._clients[shard_for(username, self.partitions, self.shards)]
+
+    def _by_shard(self, usernames: typing.Iterable[str]) -> typing.Dict[int, typing.List[str]]:
+        by_shard: typing.Dict[int, typing.List[str]] = {}
+        for username in usernames:
+            by_shard.setdefault(shard_for(username, self.partitions, self.shards), []).append(username)
+        return by_shard
+
+    def _two_phase(
+        self,
+        deltas: typing.Dict[str, int],
+        validate: typing.Callable[[typing.Dict[str, typing.Optional[int]]], None],
+    ) -> typing.Dict[str, int]:
+        """
+        All-or-nothing write spanning shards
+
+        Args:
+            deltas (typing.Dict[str, int]): Username -> signed amount to add
+            validate (typing.Callable[[typing.Dict[str, typing.Optional[int]]], None]): Raises if the current balances don't allow the write
+
+        Returns:
+            typing.Dict[str, int]: Username -> resulting balance
+        """
+        by_shard = self._by_shard(deltas)
+        txn = uuid.uuid4().hex
+        prepared: typing.List[int] = []
+        before: typing.Dict[str, typing.Optional[int]] = {}
+        try:
+            for shard in sorted(by_shard):
+                prepared.append(shard)
+                before.update(self._clients[shard].call("prepare", txn, by_shard[shard]))
+            validate(before)
+        except Exception as e:
+            for shard in prepared:
+                self._clients[shard].submit("abort", txn)
+            raise e
+        after = {username: before[username] + delta for username, delta in deltas.items()}
+
+        with self._intents_lock:
+            if self.intents.replaced_on_disk():
+                self.intents.reopen()
+        # Once this is durable the transaction happens, even if a shard dies before writing its leg
+        self.intents.sync(self.intents.append({"op": "begin", "txn": txn, "before": before, "after": after}))
+
+        def commit(shard: int) -> concurrent.futures.Future:
+            try:
+                return self._clients[shard].submit(
+                    "commit", txn, {username: after[username] for username in by_shard[shard]}
+                )
+            except ShardError as e:
+                leg: concurrent.futures.Future = concurrent.futures.Future()
+                leg.set_exception(e)
+                return leg
+
+        legs = {shard: commit(shard) for shard in by_shard}
+        for attempt in range(1, COMMIT_ATTEMPTS + 1):
+            errors: typing.Dict[int, Exception] = {}
+            for shard, leg in legs.items():
+                try:
+                    leg.result()
+                except Exception as e:
+                    errors[shard] = e
+            if not errors or attempt == COMMIT_ATTEMPTS:
+                break
+            # Legs set absolute balances, so writing one again is harmless
+            logging.warning(f"Transaction {txn}: retrying the commit leg on shards {sorted(errors)}")
+            legs = {shard: commit(shard) for shard in errors}
+        if errors:
+            error = next(iter(errors.values()))
+            # The begin record stays open, so the next open of the store rolls the missing legs forward
+            self.intents.sync(self.intents.append({"op": "failed", "txn": txn, "error": str(error)}))
+            logging.error(f"Error: {error}")
+            raise error
+        self.intents.append({"op": "commit", "txn": txn})
+        return after
+
+    @instrumented("sharded.get_user")
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        return self._client_for(username).call("get_user", username)
+
+    @instrumented("sharded.get_balance")
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        return self._client_for(username).call("get_balance", username)
+
+    @instrumented("sharded.set_balance")
+    def set_balance(self, username: str, new_balance: int) -> None:
+        self._client_for(username).call("set_balance", username, new_balance)
+
+    @instrumented("sharded.apply_delta")
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        return self._client_for(username).call("apply_delta", username, delta, op)
+
+    @instrumented("sharded.transfer")
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        if amount <= 0 or source == recipient:
+            # Fails on the arguments alone, before any shard is involved
+            validate_transfer(source, recipient, amount, None, None)
+        source_shard = shard_for(source, self.partitions, self.shards)
+        if source_shard == shard_for(recipient, self.partitions, self.shards):
+            return self._clients[source_shard].call("transfer", source, recipient, amount)
+
+        def validate(balances: typing.Dict[str, typing.Optional[int]]) -> None:
+            validate_transfer(source, recipient, amount, balances[source], balances[recipient])
+
+        balances = self._two_phase({source: -amount, recipient: amount}, validate)
+        return balances[source], balances[recipient]
+
+    @instrumented("sharded.apply_deltas")
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        by_shard = self._by_shard(deltas)
+        if len(by_shard) <= 1:
+            return self._clients[by_shard.popitem()[0]].call("apply_deltas", deltas, gross) if by_shard else {}
+        # Journaled per partition as "set", so the gross amounts aren't recorded
+        return self._two_phase(deltas, lambda balances: validate_deltas(deltas, balances))
+
+    @instrumented("sharded.create_user")
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        self._client_for(username).call("create_user", username, password, balance)
+
+    @instrumented("sharded.create_users")
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        """
+        Every shard creates its share of the users at the same time
+
+        Args:
+            users (typing.Sequence[UserRecord]): New accounts with hashed passwords, no repeated usernames
+
+        Returns:
+            typing.List[str]: Usernames created, grouped by shard
+        """
+        by_shard: typing.Dict[int, typing.List[UserRecord]] = {}
+        for user in users:
+            by_shard.setdefault(shard_for(user.username, self.partitions, self.shards), []).append(user)
+        requests = [
+            self._clients[shard].submit("create_users", by_shard[shard])
+            for shard in sorted(by_shard)
+        ]
+        return [username for request in requests for username in request.result()]
+
+    @instrumented("sharded.set_password")
+    def set_password(self, username: str, password: str) -> None:
+        self._client_for(username).call("set_password", username, password)
+
+    def accounts(self) -> typing.List[UserRecord]:
+        """
+        Every account, partition by partition - every shard loads all of its partitions
+
+        Returns:
+            typing.List[UserRecord]: Current state of the whole table
+        """
+        requests = [
+            client.submit("partition_accounts", list(range(client.shard, self.partitions, self.shards)))
+            for client in self._clients
+        ]
+        by_partition: typing.Dict[int, typing.List[UserRecord]] = {}
+        for request in requests:
+            by_partition.update(request.result())
+        return [record for partition in sorted(by_partition) for record in by_partition[partition]]
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        """
+        Every account, one partition per request, in batches of at most batch_size
+
+        Args:
+            batch_size (int, optional): Accounts per batch. Defaults to BANK_SCAN_BATCH.
+
+        Returns:
+            typing.Iterator[typing.List[UserRecord]]: Batches of accounts
+        """
+        batch_size = max(1, batch_size)
+        for partition in range(self.partitions):
+            client = self._clients[partition % self.shards]
+            records = client.call("partition_accounts", [partition])[partition]
+            for start in range(0, len(records), batch_size):
+                yield records[start:start + batch_size]
+
+    def aggregates(self) -> Aggregates:
+        """
+        Every shard's partition aggregates combined
+
+        Returns:
+            Aggregates: Aggregates of the whole table
+        """
+        requests = [
+            client.submit("partition_aggregates", list(range(client.shard, self.partitions, self.shards)))
+            for client in self._clients
+        ]
+        return Aggregates.merge(part for request in requests for part in request.result())
+
+    def flush(self) -> None:
+        for request in [client.submit("flush") for client in self._clients]:
+            request.result()
+
+    def _shutdown(self) -> None:
+        """
+        Ask every worker still running to close its store, then wait for them
+        """
+        for client in self._clients:
+            try:
+                client.submit("close")
+            except (ShardError, OSError):
+                pass
+        for client in self._clients:
+            client.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._shutdown()
+        self.intents.close()
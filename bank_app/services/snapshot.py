@@ -0,0 +1,183 @@
+import logging
+import os
+import typing
+import polars as pl
+from bank_app.services.durable import fsync_file, replace_durably, replace_file
+from bank_app.services.loader import ACCOUNT_COLUMNS, ACCOUNT_SCHEMA, is_legacy_csv, legacy_cents, load_accounts
+from bank_app.services.locks import get_lock_manager, lock_path_for
+from bank_app.services.metrics import instrumented
+from bank_app.services.paths import SNAPSHOT_FORMATS, ipc_path_for, snapshot_path_for
+from bank_app.services.storage import StorageBackend
+
+logging.basicConfig(level=logging.INFO)
+
+
+@instrumented("snapshot.read")
+def read_snapshot(path: str, snapshot_format: str) -> pl.DataFrame:
+    """
+    Read a whole account snapshot
+
+    IPC files are memory-mapped, so the columns are served straight from
+    the page cache rather than decoded from text. Snapshots written before
+    balances moved to cents are converted as they are read.
+
+    Args:
+        path (str): Snapshot file
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+
+    Returns:
+        pl.DataFrame: Username, Password and BalanceCents with ACCOUNT_SCHEMA types
+    """
+    if snapshot_format == "ipc":
+        df = pl.read_ipc(path, memory_map=True)
+        if "BalanceCents" not in df.columns:
+            return df.select("Username", "Password", legacy_cents(pl.col("Balance")))
+        return df.select(ACCOUNT_COLUMNS)
+    return load_accounts(path)
+
+
+@instrumented("snapshot.stage")
+def stage_snapshot(df: pl.DataFrame, path: str, snapshot_format: str) -> str:
+    """
+    Write a snapshot beside path and fsync it, ready to be swapped in
+
+    The temp name is unique to this process, so a snapshot can be staged
+    without holding the table lock.
+
+    Args:
+        df (pl.DataFrame): Account table
+        path (str): Snapshot file it will replace
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+
+    Returns:
+        str: Path of the synced temp file
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if snapshot_format == "ipc":
+            # Uncompressed so readers can memory-map the buffers directly
+            df.write_ipc(tmp_path, compression="uncompressed")
+        else:
+            df.write_csv(tmp_path)
+        fsync_file(tmp_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise e
+    return tmp_path
+
+
+@instrumented("snapshot.write")
+def write_snapshot(df: pl.DataFrame, path: str, snapshot_format: str) -> None:
+    """
+    Atomically and durably replace a snapshot
+
+    The new file is written and fsynced beside the old one, swapped in
+    with os.replace and the directory is fsynced, so a crash leaves either
+    the old or the new table. Nothing is ever rewritten in place, which
+    matters for IPC since other readers may have the old file
+    memory-mapped.
+
+    Args:
+        df (pl.DataFrame): Account table
+        path (str): Snapshot file
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+    """
+    replace_file(stage_snapshot(df, path, snapshot_format), path)
+
+
+def migrate_csv_to_ipc(csv_path: str) -> bool:
+    """
+    Create the IPC snapshot from the CSV if it doesn't exist yet
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        bool: True if a snapshot was written
+    """
+    ipc_path = ipc_path_for(csv_path)
+    if os.path.exists(ipc_path):
+        return False
+    if os.path.exists(csv_path):
+        df = load_accounts(csv_path)
+    else:
+        df = pl.DataFrame(schema=ACCOUNT_SCHEMA)
+    write_snapshot(df, ipc_path, "ipc")
+    logging.info(f"Migrated {df.height} accounts from {csv_path} to {ipc_path}")
+    return True
+
+
+def is_legacy_snapshot(path: str, snapshot_format: str) -> bool:
+    """
+    Whether a snapshot still stores float Balance rather than BalanceCents
+
+    Args:
+        path (str): Snapshot file
+        snapshot_format (str): One of SNAPSHOT_FORMATS
+
+    Returns:
+        bool: True if the file exists and needs converting
+    """
+    if not os.path.exists(path):
+        return False
+    if snapshot_format == "ipc":
+        return "BalanceCents" not in pl.read_ipc_schema(path)
+    return is_legacy_csv(path)
+
+
+def convert_legacy_snapshots(csv_path: str) -> typing.List[str]:
+    """
+    One-time rewrite of float Balance snapshots as integer BalanceCents
+
+    Covers the CSV and, if there is one, the IPC snapshot next to it. Each
+    file is converted with a single vectorized multiply-and-round and
+    swapped in atomically. Journal records from before the conversion
+    still carry float balances and are converted as they are replayed, so
+    the journal doesn't need touching. Caller should hold the table lock
+    exclusively.
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        typing.List[str]: Files that were converted
+    """
+    converted = []
+    for snapshot_format in SNAPSHOT_FORMATS:
+        path = snapshot_path_for(csv_path, snapshot_format)
+        if is_legacy_snapshot(path, snapshot_format):
+            write_snapshot(read_snapshot(path, snapshot_format), path, snapshot_format)
+            logging.info(f"Converted {path} to integer cents")
+            converted.append(path)
+    return converted
+
+
+def export_csv(storage: StorageBackend, output_path: str) -> int:
+    """
+    Write the current state of any backend out as a human readable CSV
+
+    Accounts are streamed with iter_accounts and appended a batch at a
+    time, so the export never holds a second copy of the table. The file
+    is written beside output_path and swapped in once it is complete,
+    under the exclusive table lock so no process is reading the bank's
+    files mid-swap.
+
+    Args:
+        storage (StorageBackend): Backend to export
+        output_path (str): CSV file to write
+
+    Returns:
+        int: Number of accounts written
+    """
+    tmp_path = f"{output_path}.tmp"
+    count = 0
+    with open(tmp_path, "wb") as export_file:
+        pl.DataFrame(schema=ACCOUNT_SCHEMA).write_csv(export_file)
+        for batch in storage.iter_accounts():
+            pl.DataFrame(batch, schema=ACCOUNT_SCHEMA, orient="row").write_csv(export_file, include_header=False)
+            count += len(batch)
+    with get_lock_manager(lock_path_for(storage.csv_path)).exclusive():
+        replace_durably(tmp_path, output_path)
+    logging.info(f"Exported {count} accounts to {output_path}")
+    return count
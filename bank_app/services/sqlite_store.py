@@ -0,0 +1,273 @@
+import logging
+import os
+import sqlite3
+import threading
+import typing
+from bank_app.services.loader import load_accounts
+from bank_app.services.metrics import instrumented
+from bank_app.services.storage import DEFAULT_SCAN_BATCH, StorageBackend, UserRecord, validate_deltas, validate_transfer
+
+logging.basicConfig(level=logging.INFO)
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache hands back the same prepared statement on every call
+CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS accounts ("
+    "username TEXT PRIMARY KEY, password TEXT NOT NULL, balance INTEGER NOT NULL)"
+)
+SELECT_USER_SQL = "SELECT username, password, balance FROM accounts WHERE username = ?"
+SELECT_BALANCE_SQL = "SELECT balance FROM accounts WHERE username = ?"
+SET_BALANCE_SQL = "UPDATE accounts SET balance = ? WHERE username = ?"
+ADD_BALANCE_SQL = "UPDATE accounts SET balance = balance + ? WHERE username = ?"
+SELECT_ALL_SQL = "SELECT username, password, balance FROM accounts ORDER BY rowid"
+SELECT_PAGE_SQL = "SELECT rowid, username, password, balance FROM accounts WHERE rowid > ? ORDER BY rowid LIMIT ?"
+SET_PASSWORD_SQL = "UPDATE accounts SET password = ? WHERE username = ?"
+INSERT_USER_SQL = "INSERT INTO accounts (username, password, balance) VALUES (?, ?, ?)"
+
+# PRAGMA user_version of a database whose balances are INTEGER cents.
+# Version 0 databases hold REAL balances in whole units.
+SCHEMA_VERSION = 1
+
+
+def sqlite_path_for(csv_path: str) -> str:
+    """
+    SQLite database that sits next to a CSV
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+
+    Returns:
+        str: Path of the matching .sqlite file
+    """
+    return os.path.splitext(csv_path)[0] + ".sqlite"
+
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLite storage backend
+
+    Runs the database in WAL mode so readers never block the writer, with
+    synchronous=FULL so every commit is durable when it returns and
+    flush() has nothing left to do, and
+    keeps one pooled connection per thread since sqlite3 connections must
+    not be shared across threads. The CSV is imported the first time the
+    database is created. Balances are INTEGER cents; databases from before
+    that are converted once, on open.
+    """
+    def __init__(self, csv_path: str) -> None:
+        self.csv_path = csv_path
+        self.db_path = sqlite_path_for(csv_path)
+        self._local = threading.local()
+        self._connections: typing.List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._connection()
+        existed = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'accounts'"
+        ).fetchone()
+        if existed is not None:
+            self._convert_legacy(conn)
+            return
+        conn.execute(CREATE_TABLE_SQL)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        if os.path.exists(csv_path):
+            self._import_csv(conn)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Connection owned by the calling thread, opened on first use
+
+        Returns:
+            sqlite3.Connection: Autocommit connection in WAL mode
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, isolation_level=None, check_same_thread=False, cached_statements=64
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            # NORMAL only syncs the WAL at checkpoints, so a commit could be lost on power failure
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _import_csv(self, conn: sqlite3.Connection) -> None:
+        """
+        One-off migration of the CSV rows into a new database
+
+        Args:
+            conn (sqlite3.Connection): Connection to import with
+        """
+        df = load_accounts(self.csv_path)
+        rows = df.iter_rows()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO accounts (username, password, balance) VALUES (?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logging.error(f"Error: {e}")
+            raise e
+        logging.info(f"Imported {df.height} accounts from {self.csv_path} into {self.db_path}")
+
+    def _convert_legacy(self, conn: sqlite3.Connection) -> None:
+        """
+        One-time rewrite of a REAL balance table into INTEGER cents
+
+        SQLite can't change a column type in place, so the rows are copied
+        into a new table in one INSERT ... SELECT and it is renamed over
+        the old one, all in a single transaction.
+
+        Args:
+            conn (sqlite3.Connection): Connection to convert with
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-checked under the write lock in case another process got here first
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                conn.execute(CREATE_TABLE_SQL.replace("accounts", "accounts_cents", 1))
+                conn.execute(
+                    "INSERT INTO accounts_cents (username, password, balance) "
+                    "SELECT username, password, CAST(ROUND(balance * 100) AS INTEGER) "
+                    "FROM accounts ORDER BY rowid"
+                )
+                conn.execute("DROP TABLE accounts")
+                conn.execute("ALTER TABLE accounts_cents RENAME TO accounts")
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                logging.info(f"Converted {self.db_path} to integer cents")
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logging.error(f"Error: {e}")
+            raise e
+
+    @instrumented("sqlite.get_user")
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        row = self._connection().execute(SELECT_USER_SQL, (username,)).fetchone()
+        return UserRecord(*row) if row is not None else None
+
+    @instrumented("sqlite.get_balance")
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        row = self._connection().execute(SELECT_BALANCE_SQL, (username,)).fetchone()
+        return row[0] if row is not None else None
+
+    @instrumented("sqlite.set_balance")
+    def set_balance(self, username: str, new_balance: int) -> None:
+        self._connection().execute(SET_BALANCE_SQL, (int(new_balance), username))
+
+    @instrumented("sqlite.apply_delta")
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so the balance can't change under us
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(SELECT_BALANCE_SQL, (username,)).fetchone()
+            validate_deltas({username: delta}, {username: row[0] if row is not None else None})
+            conn.execute(ADD_BALANCE_SQL, (delta, username))
+            conn.execute("COMMIT")
+            return row[0] + delta
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            raise e
+
+    @instrumented("sqlite.transfer")
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            source_row = conn.execute(SELECT_BALANCE_SQL, (source,)).fetchone()
+            recipient_row = conn.execute(SELECT_BALANCE_SQL, (recipient,)).fetchone()
+            validate_transfer(
+                source,
+                recipient,
+                amount,
+                source_row[0] if source_row is not None else None,
+                recipient_row[0] if recipient_row is not None else None,
+            )
+            conn.execute(ADD_BALANCE_SQL, (-amount, source))
+            conn.execute(ADD_BALANCE_SQL, (amount, recipient))
+            conn.execute("COMMIT")
+            return source_row[0] - amount, recipient_row[0] + amount
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            raise e
+
+    @instrumented("sqlite.apply_deltas")
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            balances = {}
+            for username in deltas:
+                row = conn.execute(SELECT_BALANCE_SQL, (username,)).fetchone()
+                balances[username] = row[0] if row is not None else None
+            validate_deltas(deltas, balances)
+            conn.executemany(
+                ADD_BALANCE_SQL, [(delta, username) for username, delta in deltas.items()]
+            )
+            conn.execute("COMMIT")
+            return {username: balances[username] + delta for username, delta in deltas.items()}
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            raise e
+
+    @instrumented("sqlite.create_user")
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        try:
+            self._connection().execute(INSERT_USER_SQL, (username, password, int(balance)))
+        except sqlite3.IntegrityError:
+            raise ValueError("Username already exists")
+
+    @instrumented("sqlite.create_users")
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            new_users = [
+                user for user in users
+                if conn.execute(SELECT_BALANCE_SQL, (user.username,)).fetchone() is None
+            ]
+            conn.executemany(
+                INSERT_USER_SQL, [(username, password, int(balance)) for username, password, balance in new_users]
+            )
+            conn.execute("COMMIT")
+            return [user.username for user in new_users]
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            raise e
+
+    @instrumented("sqlite.set_password")
+    def set_password(self, username: str, password: str) -> None:
+        self._connection().execute(SET_PASSWORD_SQL, (password, username))
+
+    def accounts(self) -> typing.List[UserRecord]:
+        return [UserRecord(*row) for row in self._connection().execute(SELECT_ALL_SQL)]
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        # Keyset pages, so no read transaction stays open between batches
+        batch_size = max(1, batch_size)
+        last_rowid = 0
+        while True:
+            rows = self._connection().execute(SELECT_PAGE_SQL, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [UserRecord(*row[1:]) for row in rows]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,416 @@
+import abc
+import atexit
+import importlib
+import logging
+import os
+import threading
+import typing
+from bank_app.services.aggregates import Aggregates
+from bank_app.services.credentials import CREDENTIALS
+from bank_app.services.history import close_histories
+
+logging.basicConfig(level=logging.INFO)
+
+# Which StorageBackend implementation get_backend() hands out
+DEFAULT_BACKEND = os.environ.get("BANK_STORAGE_BACKEND", "csv")
+
+# Backend name -> "module:Class", imported on first use
+BACKENDS = {
+    "csv": "bank_app.services.ledger:Ledger",
+    "sqlite": "bank_app.services.sqlite_store:SqliteBackend",
+    "mmap": "bank_app.services.mmap_store:MmapBackend",
+    "partitioned": "bank_app.services.partitioned_store:PartitionedBackend",
+    "sharded": "bank_app.services.sharded_store:ShardedBackend",
+}
+
+# Accounts per batch when a backend is read with iter_accounts()
+DEFAULT_SCAN_BATCH = int(os.environ.get("BANK_SCAN_BATCH", "100000"))
+
+
+def default_csv_path() -> str:
+    """
+    Location of the bank system CSV relative to the working directory
+
+    Returns:
+        str: Path to bank_app/data/bank_system.csv
+    """
+    return os.path.join(os.getcwd(), "bank_app", "data", "bank_system.csv")
+
+
+class UserRecord(typing.NamedTuple):
+    """
+    One row of the account table - balance is in cents
+    """
+    username: str
+    password: str
+    balance: int
+
+
+def validate_transfer(
+    source: str,
+    recipient: str,
+    amount: int,
+    source_balance: typing.Optional[int],
+    recipient_balance: typing.Optional[int],
+) -> None:
+    """
+    Checks shared by every backend before either leg of a transfer is applied
+
+    Args:
+        source (str): Username sending money
+        recipient (str): Username receiving money
+        amount (int): Amount to move
+        source_balance (typing.Optional[int]): Current source balance, None if missing
+        recipient_balance (typing.Optional[int]): Current recipient balance, None if missing
+
+    Raises:
+        ValueError: Invalid amount, unknown account, same account or insufficient funds
+    """
+    if amount <= 0:
+        raise ValueError("Transfer must be greater than 0")
+    if source == recipient:
+        raise ValueError("Cannot transfer to the same account")
+    if source_balance is None:
+        raise ValueError(f"User {source} does not exist")
+    if recipient_balance is None:
+        raise ValueError(f"User {recipient} does not exist")
+    if amount > source_balance:
+        raise ValueError("Insufficient funds")
+
+
+def validate_deltas(
+    deltas: typing.Dict[str, int], balances: typing.Dict[str, typing.Optional[int]]
+) -> None:
+    """
+    Checks shared by every backend before a batch of net deltas is applied
+
+    Args:
+        deltas (typing.Dict[str, int]): Username -> signed amount to add
+        balances (typing.Dict[str, typing.Optional[int]]): Current balances, None if missing
+
+    Raises:
+        ValueError: Unknown username or a debit that would overdraw
+    """
+    for username, delta in deltas.items():
+        balance = balances.get(username)
+        if balance is None:
+            raise ValueError(f"User {username} does not exist")
+        if delta < 0 and balance + delta < 0:
+            raise ValueError(f"Insufficient funds for {username}")
+
+
+class StorageBackend(abc.ABC):
+    """
+    Interface every account store implements
+
+    Every balance and amount is an integer number of cents.
+
+    User and BankAccount only talk to storage through these methods, so the
+    CSV, SQLite and mmap stores can be swapped by setting
+    BANK_STORAGE_BACKEND and benchmarked against the same workload.
+
+    Every backend is built from the path of the bank system CSV and keeps
+    it as csv_path. Backends
+    with their own file format keep it next to the CSV and import the CSV
+    rows the first time they are opened.
+    """
+    @abc.abstractmethod
+    def get_user(self, username: str) -> typing.Optional[UserRecord]:
+        """
+        Args:
+            username (str): Account to look up
+
+        Returns:
+            typing.Optional[UserRecord]: Row for username, or None if it does not exist
+        """
+
+    @abc.abstractmethod
+    def get_balance(self, username: str) -> typing.Optional[int]:
+        """
+        Args:
+            username (str): Account to look up
+
+        Returns:
+            typing.Optional[int]: Balance, or None if the user does not exist
+        """
+
+    @abc.abstractmethod
+    def set_balance(self, username: str, new_balance: int) -> None:
+        """
+        Overwrite a balance. Unknown usernames are ignored.
+
+        Args:
+            username (str): Account to update
+            new_balance (int): New balance
+        """
+
+    @abc.abstractmethod
+    def apply_delta(self, username: str, delta: int, op: str) -> int:
+        """
+        Add delta to a balance
+
+        Args:
+            username (str): Account to update
+            delta (int): Signed amount to add
+            op (str): Operation name - "deposit" or "withdraw"
+
+        Raises:
+            ValueError: Unknown username
+
+        Returns:
+            int: Resulting balance
+        """
+
+    @abc.abstractmethod
+    def transfer(self, source: str, recipient: str, amount: int) -> typing.Tuple[int, int]:
+        """
+        Move amount between two accounts as one all-or-nothing operation
+
+        Both legs are validated before anything is written, and are made
+        durable by a single write, so a failure can never apply only one.
+
+        Args:
+            source (str): Username sending money
+            recipient (str): Username receiving money
+            amount (int): Amount to move
+
+        Raises:
+            ValueError: See validate_transfer
+
+        Returns:
+            typing.Tuple[int, int]: New source and recipient balances
+        """
+
+    @abc.abstractmethod
+    def apply_deltas(
+        self, deltas: typing.Dict[str, int], gross: typing.Optional[typing.Dict[str, int]] = None
+    ) -> typing.Dict[str, int]:
+        """
+        Add a net delta to many balances as one all-or-nothing write
+
+        Args:
+            deltas (typing.Dict[str, int]): Username -> signed amount to add
+            gross (typing.Optional[typing.Dict[str, int]], optional): Cents "deposited" and "withdrawn" before netting, for stores that keep aggregates. Defaults to None.
+
+        Raises:
+            ValueError: Unknown username, or a debit that would leave a balance below 0
+
+        Returns:
+            typing.Dict[str, int]: Username -> resulting balance
+        """
+
+    @abc.abstractmethod
+    def create_user(self, username: str, password: str, balance: int) -> None:
+        """
+        Args:
+            username (str): New username
+            password (str): Hashed password
+            balance (int): Starting balance
+
+        Raises:
+            ValueError: Existing username
+        """
+
+    def create_users(self, users: typing.Sequence[UserRecord]) -> typing.List[str]:
+        """
+        Create many accounts at once, skipping usernames that already exist
+
+        This default creates them one at a time. Backends that can add
+        every row in a single write override it.
+
+        Args:
+            users (typing.Sequence[UserRecord]): New accounts with hashed passwords, no repeated usernames
+
+        Returns:
+            typing.List[str]: Usernames created, in input order
+        """
+        created = []
+        for user in users:
+            try:
+                self.create_user(user.username, user.password, user.balance)
+            except ValueError:
+                continue
+            created.append(user.username)
+        return created
+
+    @abc.abstractmethod
+    def set_password(self, username: str, password: str) -> None:
+        """
+        Replace the stored password hash, e.g. to upgrade it to a newer scheme
+
+        Args:
+            username (str): Existing account, missing accounts are ignored
+            password (str): New password hash
+        """
+
+    @abc.abstractmethod
+    def accounts(self) -> typing.List[UserRecord]:
+        """
+        Every account, oldest first. Duplicate usernames are reported once, as
+        the row every lookup resolves to.
+
+        Returns:
+            typing.List[UserRecord]: Current state of the whole table
+        """
+
+    def iter_accounts(self, batch_size: int = DEFAULT_SCAN_BATCH) -> typing.Iterator[typing.List[UserRecord]]:
+        """
+        Every account, oldest first, a batch at a time
+
+        This default slices accounts(). Backends override it to read one
+        batch at a time, so a full scan doesn't need a second copy of the
+        table. Each batch is consistent on its own, but writes can land
+        between batches.
+
+        Args:
+            batch_size (int, optional): Accounts per batch. Defaults to BANK_SCAN_BATCH.
+
+        Returns:
+            typing.Iterator[typing.List[UserRecord]]: Batches of accounts
+        """
+        records = self.accounts()
+        batch_size = max(1, batch_size)
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size]
+
+    def aggregates(self) -> Aggregates:
+        """
+        Account count, total balance, operation totals and largest balances
+
+        This default scans accounts() and has no operation totals. Backends
+        that maintain aggregates as they write override it.
+
+        Returns:
+            Aggregates: Aggregates of the whole table
+        """
+        records = self.accounts()
+        return Aggregates.from_balances(
+            [record.username for record in records], [record.balance for record in records]
+        )
+
+    def flush(self) -> None:
+        """
+        Make every completed operation durable
+        """
+
+    def close(self) -> None:
+        """
+        Flush and release any files or connections
+        """
+        self.flush()
+
+
+_BACKENDS: typing.Dict[typing.Tuple[str, str], StorageBackend] = {}
+_BACKENDS_LOCK = threading.Lock()
+# Bumped by close_backends() so anything holding on to a backend knows to resolve it again
+_GENERATION = 0
+
+
+def backends_generation() -> int:
+    """
+    Counter that changes whenever the open backends are closed
+
+    Returns:
+        int: Current generation
+    """
+    return _GENERATION
+
+
+def set_default_backend(kind: str) -> None:
+    """
+    Change the backend get_backend() hands out when no kind is given
+
+    Args:
+        kind (str): Key of BACKENDS
+
+    Raises:
+        ValueError: Unknown backend name
+    """
+    global DEFAULT_BACKEND
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {kind!r}, expected one of {sorted(BACKENDS)}")
+    DEFAULT_BACKEND = kind
+
+
+def get_backend(csv_path: str, kind: typing.Optional[str] = None, **options: typing.Any) -> StorageBackend:
+    """
+    Shared storage backend for csv_path, opening it on first use
+
+    Args:
+        csv_path (str): Path to the bank system CSV
+        kind (typing.Optional[str], optional): Key of BACKENDS. Defaults to BANK_STORAGE_BACKEND.
+        options (typing.Any): Keyword arguments for the backend class, only used when it is first opened
+
+    Raises:
+        ValueError: Unknown backend name
+
+    Returns:
+        StorageBackend: Process-wide backend for that file
+    """
+    kind = kind or DEFAULT_BACKEND
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {kind!r}, expected one of {sorted(BACKENDS)}")
+
+    key = (kind, os.path.abspath(csv_path))
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(key)
+        if backend is None:
+            module_name, class_name = BACKENDS[kind].split(":")
+            backend_cls = getattr(importlib.import_module(module_name), class_name)
+            backend = backend_cls(key[1], **options)
+            _BACKENDS[key] = backend
+        return backend
+
+
+class BackendRef:
+    """
+    Remembers which backend a csv_path resolved to
+
+    get_backend() normalizes the path and takes a lock on every call. User
+    and BankAccount hold one of these instead, so repeat accesses are two
+    comparisons. It re-resolves if the path changes or the backends were
+    closed since.
+    """
+    __slots__ = ("csv_path", "generation", "backend")
+
+    def __init__(self) -> None:
+        self.csv_path: typing.Optional[str] = None
+        self.generation = -1
+        self.backend: typing.Optional[StorageBackend] = None
+
+    def resolve(self, csv_path: str) -> StorageBackend:
+        """
+        Backend for csv_path, looked up again only when something changed
+
+        Args:
+            csv_path (str): Path to the bank system CSV
+
+        Returns:
+            StorageBackend: Process-wide backend for that file
+        """
+        if self.csv_path != csv_path or self.generation != _GENERATION or self.backend is None:
+            self.generation = _GENERATION
+            self.backend = get_backend(csv_path)
+            self.csv_path = csv_path
+        return self.backend
+
+
+def close_backends() -> None:
+    """
+    Close and forget every open backend - called on process exit
+
+    Cached credentials go too, since the files behind them may be replaced
+    before a backend is opened again, and buffered history is written out.
+    """
+    global _GENERATION
+    CREDENTIALS.clear()
+    close_histories()
+    with _BACKENDS_LOCK:
+        backends = list(_BACKENDS.values())
+        _BACKENDS.clear()
+        _GENERATION += 1
+    for backend in backends:
+        backend.close()
+
+
+atexit.register(close_backends)
@@ -2,12 +2,15 @@ import hashlib
 import polars as pl
 import typing
 import logging
-import os 
+from bank_app.services.credentials import CREDENTIALS
+from bank_app.services.loader import ACCOUNT_SCHEMA, LEGACY_ACCOUNT_SCHEMA
+from bank_app.services.storage import BackendRef, StorageBackend, default_csv_path
+from bank_app.services.metrics import instrumented
+from bank_app.services.passwords import HASHER, needs_rehash
+from bank_app.services.money import parse_amount
 
 logging.basicConfig(level=logging.INFO)
 
-# TO DO - parametrize os.getcwd pathing?
-
 class UserAuthError(Exception):
     """Custom exception class for user auth errors
     
@@ -27,18 +30,25 @@ class User:
         self, 
         username: typing.Optional[str] = None, 
         password: typing.Optional[str] = None, 
+        csv_path: typing.Optional[str] = None,
     ) -> None:
         self.username = username if username is not None else ""
         self.password = self.hash_password(password) if password is not None else ""
         self.logged_in = False
-        self.csv_path = os.path.join(
-            os.getcwd(), "bank_app", "data", "bank_system.csv"
-        )
+        # Passing csv_path skips the os.getcwd() lookup in default_csv_path
+        self.csv_path = csv_path or default_csv_path()
+        self._backend = BackendRef()
         
+    @instrumented("user.hash_password")
     def hash_password(self, password: str) -> str:
         """
         Hash the inputted password for security
 
+        This fast SHA-256 pre-hash is what User keeps instead of the plain
+        text. Storage holds a salted, slow hash of it made by the
+        passwords module - or, for accounts that haven't logged in since
+        that was introduced, this digest itself.
+
         Args:
             password (str): Str input password
 
@@ -46,46 +56,56 @@ class User:
             str: Hashed value
         """
         return hashlib.sha256(password.encode()).hexdigest()
+    
+    @property
+    def storage(self) -> StorageBackend:
+        """
+        Shared storage backend for self.csv_path
+
+        Resolved once and reused until csv_path changes or the backends are closed
 
+        Returns:
+            StorageBackend: Process-wide backend picked by BANK_STORAGE_BACKEND
+        """
+        return self._backend.resolve(self.csv_path)
+
+    @instrumented("user.create")
     def create(
         self,
-        balance: typing.Optional[float] = 0.0
+        balance: typing.Optional[int] = 0
     ) -> bool:
         """
-        Checks CSV for existing username, then creates new user if not found.
+        Probes storage for an existing username, then creates new user if not found.
 
         Args:
-            balance (typing.Optional[float], optional): Balance to start account with. Defaults to 0.0.
+            balance (typing.Optional[int], optional): Balance to start account with, in cents. Defaults to 0.
 
         Raises:
-            ValueError: Existing username
+            ValueError: Existing username, or a negative balance
             e: Other general exceptions
 
         Returns:
             bool: True or False if success or failure
         """
         try:
-            df = pl.read_csv(self.csv_path)
-            df = self.cast_df_col_data_types(df)
-            
-            if df.filter(df["Username"] == self.username).height > 0:
-                raise ValueError("Username already exists")
-            
-            new_row = pl.DataFrame({
-                "Username": [self.username],
-                "Password": [self.password],
-                "Balance": [float(balance)]
-            })
-            df = df.vstack(new_row)
-            df.write_csv(self.csv_path)
+            if int(balance) < 0:
+                raise ValueError("Balance can't be negative")
+            self.storage.create_user(self.username, HASHER.hash(self.password), int(balance))
+            CREDENTIALS.invalidate(self.csv_path, self.username)
             return True
         except Exception as e:
             logging.error(f"Error: {e}")
             raise e
         
+    @instrumented("user.authorize")
     def authorize(self, password: str) -> bool:
         """
-        Compares input password with hashed password in CSV
+        Compares input password with hashed password looked up in storage
+
+        The stored hash comes from the process-wide credential cache when
+        it can, so repeated logins don't touch storage. Verification runs
+        on the hashing executor, and a stored hash made with an older
+        scheme or cost is replaced after a successful check.
 
         Args:
             password (str): Password to compare - from user input
@@ -98,13 +118,16 @@ class User:
             bool: True or False for success or failure
         """
         try:
-            df = pl.read_csv(self.csv_path)
-            df = self.cast_df_col_data_types(df)
-            user_row = df.filter(df["Username"] == self.username)
+            stored = CREDENTIALS.get(self.csv_path, self.username)
+            if stored is None:
+                record = self.storage.get_user(self.username)
+                if record is not None:
+                    stored = record.password
+                    CREDENTIALS.put(self.csv_path, self.username, stored)
             
-            # only checks if height is 0, but does not handle duplicates
-            # something to check at later point if error with creation process
-            if user_row.height != 0 and user_row["Password"][0] == password:
+            if stored is not None and HASHER.verify(password, stored):
+                if needs_rehash(stored):
+                    self.upgrade_password_hash(password)
                 return True
             else:
                 raise ValueError("Invalid username or password")
@@ -113,6 +136,22 @@ class User:
             logging.error(f"Error: {e}")
             raise e    
 
+    @instrumented("user.upgrade_password_hash")
+    def upgrade_password_hash(self, password: str) -> None:
+        """
+        Store a fresh hash with the current scheme and cost
+
+        Only called once the password has been verified, since that is the
+        only time the pre-hash is known to be right.
+
+        Args:
+            password (str): Verified pre-hashed password
+        """
+        upgraded = HASHER.hash(password)
+        self.storage.set_password(self.username, upgraded)
+        CREDENTIALS.put(self.csv_path, self.username, upgraded)
+
+    @instrumented("user.login")
     def login(self) -> bool:
         """
         Wrapper logic to check if current user is logged in or not
@@ -137,8 +176,13 @@ class User:
             logging.warning("User is already logged in.")
             return True
         
+    @instrumented("user.cast_df_col_data_types")
     def cast_df_col_data_types(self, df: pl.DataFrame) -> pl.DataFrame:
         """Explicitly define column data types for Polars dataframes
+        
+        Frames read through loader.load_accounts already have these types,
+        this is only needed for frames built some other way. Frames with a
+        legacy float Balance column keep it.
 
         Args:
             df (pl.DataFrame): Dataframe from CSV
@@ -146,14 +190,9 @@ class User:
         Returns:
             pl.DataFrame: Dataframe with casted types
         """
-        df = df.with_columns(
-            [
-                df["Username"].cast(pl.datatypes.Utf8), 
-                df["Password"].cast(pl.datatypes.Utf8), 
-                df["Balance"].cast(pl.datatypes.Float64)
-            ]
-        )
-        return df
+        if "BalanceCents" in df.columns:
+            return df.cast(ACCOUNT_SCHEMA)
+        return df.cast(LEGACY_ACCOUNT_SCHEMA)
     
 class UserService():
     """
@@ -185,9 +224,9 @@ class UserService():
             balance = input("Starting balance: ")
             
             if balance == "":
-                balance = 0.0 
+                balance = 0
             else:
-                balance = float(balance)
+                balance = parse_amount(balance)
                 
             new_user = User(username, password)
             
@@ -1,4 +1,5 @@
+import sys
 from bank_app.run import run
     
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run(sys.argv[1:])
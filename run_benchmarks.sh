@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Add the current working directory to the Python path
+export PYTHONPATH=$PYTHONPATH:`pwd`
+
+# Usage: ./run_benchmarks.sh [accounts...]
+# Writes one JSON result per backend and account count to bench_results/<commit>/
+ACCOUNTS=${@:-"1000 100000 1000000"}
+OPS=${BENCH_OPS:-10000}
+CONCURRENCY=${BENCH_CONCURRENCY:-8}
+MIX=${BENCH_MIX:-"authorize=10,deposit=40,withdraw=30,transfer=20"}
+OUT_DIR=bench_results/$(git rev-parse --short HEAD 2>/dev/null || echo local)
+
+mkdir -p $OUT_DIR
+for backend in csv sqlite mmap; do
+    for accounts in $ACCOUNTS; do
+        echo "Benchmarking $backend backend with $accounts accounts..."
+        BANK_STORAGE_BACKEND=$backend python -m bank_app.bench \
+            --accounts $accounts \
+            --ops $OPS \
+            --concurrency $CONCURRENCY \
+            --mix $MIX \
+            --output $OUT_DIR/$backend-$accounts.json
+    done
+done
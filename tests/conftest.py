@@ -0,0 +1,25 @@
+import os
+import pytest
+import polars as pl
+from bank_app.services.storage import close_backends
+
+# Keep key derivation cheap in the suite - the cost is a deployment setting
+os.environ.setdefault("BANK_SCRYPT_N", "1024")
+os.environ.setdefault("BANK_PBKDF2_ITERATIONS", "1000")
+# Exercise cross-shard transactions even on a single-core runner
+os.environ.setdefault("BANK_SHARDS", "2")
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    csv_path = os.path.join(tmp_path, "bank_system.csv")
+    data = {
+        "Username": ["Test", "Test2"],
+        "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+                    "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
+        # passwords are all "hello"
+        "BalanceCents": [39900, 100000]
+    }
+    pl.DataFrame(data).write_csv(csv_path)
+    yield csv_path
+    close_backends()
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import pytest
+import polars as pl
+from bank_app.services.account_cache import (
+    AccountCache,
+    cache_path_for,
+    cached_user,
+    snapshot_signature,
+    write_cache,
+)
+from bank_app.services.ledger import Ledger
+from bank_app.services.storage import UserRecord
+
+HASH = "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+
+class TestAccountCache:
+    def test_lookup(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "accounts.cache")
+        usernames = [f"user{i}" for i in range(1000)] + ["user5"]
+        write_cache(usernames, ["hash"] * 1001, list(range(1001)), path, (1, 2, 3))
+
+        cache = AccountCache.open(path, (1, 2, 3))
+        assert cache.accounts == 1000
+        assert cache.get("user999") == UserRecord("user999", "hash", 999)
+        # First row wins for a repeated username
+        assert cache.get("user5").balance == 5
+        assert cache.get("Nobody") is None
+        cache.close()
+
+    def test_stale_or_other_version_is_ignored(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "accounts.cache")
+        write_cache(["Test"], ["hash"], [1], path, (1, 2, 3))
+
+        assert AccountCache.open(path, (1, 2, 4)) is None
+        with open(path, "r+b") as cache_file:
+            cache_file.seek(8)
+            cache_file.write(b"\xff")
+        assert AccountCache.open(path, (1, 2, 3)) is None
+        assert AccountCache.open(os.path.join(tmp_path, "missing.cache"), (1, 2, 3)) is None
+
+    def test_cached_user_builds_and_rebuilds(self, csv_path: str) -> None:
+        assert cached_user(csv_path, "Test") == UserRecord("Test", HASH, 39900)
+        assert cached_user(csv_path, "Nobody") is None
+        assert AccountCache.open(cache_path_for(csv_path), snapshot_signature(csv_path)) is not None
+
+        # Rewriting the CSV changes its signature, so the cache is rebuilt
+        pl.DataFrame({"Username": ["Test"], "Password": ["x"], "BalanceCents": [5]}).write_csv(csv_path)
+        assert cached_user(csv_path, "Test") == UserRecord("Test", "x", 5)
+        assert cached_user(csv_path, "Test2") is None
+
+    def test_journal_is_applied(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path, checkpoint_interval=0)
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.transfer("Test2", "Test", 500)
+        ledger.create_user("Robert", "hash", 700)
+        ledger.set_password("Test2", "new")
+        ledger.apply_deltas({"Robert": -200})
+        ledger.flush()
+
+        for username in ("Test", "Test2", "Robert"):
+            assert cached_user(csv_path, username) == ledger.get_user(username)
+        ledger.close()
+
+    def test_checkpoint_refreshes_cache(self, csv_path: str) -> None:
+        cached_user(csv_path, "Test")
+        ledger = Ledger(csv_path, checkpoint_interval=0)
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.compact()
+
+        cache = AccountCache.open(cache_path_for(csv_path), snapshot_signature(csv_path))
+        assert cache is not None
+        assert cache.get("Test").balance == 40000
+        cache.close()
+        ledger.close()
+
+    def test_balance_command_skips_dataframe_import(self, csv_path: str) -> None:
+        cached_user(csv_path, "Test")
+        script = (
+            "import sys\n"
+            "from bank_app.run import run\n"
+            f"run(['--csv-path', {csv_path!r}, 'balance', 'Test2'])\n"
+            "print('polars' in sys.modules)\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        assert result.stdout.strip() == "False"
+        assert "Test2: 1000.00" in result.stderr
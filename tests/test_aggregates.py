@@ -0,0 +1,157 @@
+import os
+import random
+import pytest
+import polars as pl
+from bank_app.services.aggregates import Aggregates, TopBalances, aggregates_path_for
+from bank_app.services.batch import apply_batch, load_transactions
+from bank_app.services.ledger import Ledger
+from bank_app.services.partitioned_store import PartitionedBackend
+from bank_app.services.sqlite_store import SqliteBackend
+
+
+class TestTopBalances:
+    def test_matches_a_full_sort(self) -> None:
+        rng = random.Random(7)
+        balances = {f"user{i}": rng.randrange(10000) for i in range(200)}
+        top = TopBalances(5)
+        for username, balance in balances.items():
+            top.update(username, balance)
+
+        for _ in range(2000):
+            username = f"user{rng.randrange(200)}"
+            balances[username] = max(0, balances[username] + rng.randrange(-3000, 3000))
+            top.update(username, balances[username])
+            if not top.complete:
+                top.rebuild(balances.items())
+            expected = sorted(balances.items(), key=lambda item: (item[1], item[0]), reverse=True)[:5]
+            assert [balance for _, balance in top.top()] == [balance for _, balance in expected]
+
+    def test_falling_candidates_leave(self) -> None:
+        top = TopBalances(1)
+        for username, balance in [("a", 10), ("b", 20), ("c", 30)]:
+            top.update(username, balance)
+        # Capacity is 2, so "a" was evicted and the floor is 10
+        assert top.top() == [("c", 30)]
+        top.update("c", 5)
+        assert top.top() == [("b", 20)]
+        top.update("b", 1)
+        assert not top.complete
+        top.rebuild([("a", 10), ("b", 1), ("c", 5)])
+        assert top.top() == [("a", 10)]
+
+    def test_round_trip(self) -> None:
+        top = TopBalances(2)
+        for username, balance in [("a", 10), ("b", 20), ("c", 30), ("d", 40), ("e", 50)]:
+            top.update(username, balance)
+        restored = TopBalances.from_dict(top.to_dict())
+        assert restored.top() == top.top() == [("e", 50), ("d", 40)]
+        assert restored.floor == top.floor
+
+
+class TestAggregates:
+    def test_record(self) -> None:
+        aggregates = Aggregates(top_n=2)
+        aggregates.record("create", [("Test", None, 1000)])
+        aggregates.record("create", [("Test2", None, 500)])
+        aggregates.record("deposit", [("Test", 1000, 1500)])
+        aggregates.record("transfer", [("Test", 1500, 1200), ("Test2", 500, 800)])
+        aggregates.record("set", [("Test", 1200, 1200)])
+
+        report = aggregates.report()
+        assert report["accounts"] == 2
+        assert report["total_balance"] == 2000
+        assert report["total_deposits"] == 500
+        assert report["total_withdrawals"] == 0
+        assert report["operations"]["transfer"] == {"count": 1, "credited": 300, "debited": 300}
+        # Writes that change nothing, like a replayed record, aren't counted
+        assert "set" not in report["operations"]
+        assert report["top_balances"] == [{"username": "Test", "balance": 1200}, {"username": "Test2", "balance": 800}]
+
+    def test_merge(self) -> None:
+        first = Aggregates.from_balances(["a", "b"], [10, 40], top_n=2)
+        second = Aggregates.from_balances(["c", "d"], [30, 20], top_n=2)
+        first.record("deposit", [("a", 10, 15)])
+        merged = Aggregates.merge([first, second], top_n=2)
+        assert merged.accounts == 4
+        assert merged.total_balance == 105
+        assert merged.total("deposit", "credited") == 5
+        assert merged.top.top() == [("b", 40), ("c", 30)]
+
+
+class TestStoreAggregates:
+    def exercise(self, backend) -> None:
+        backend.apply_delta("Test", 10000, "deposit")
+        backend.apply_delta("Test2", -5000, "withdraw")
+        backend.transfer("Test2", "Test", 20000)
+        backend.apply_deltas({"Test": -100, "Test2": 100})
+        backend.create_user("Robert", "hash", 500000)
+
+    @pytest.mark.parametrize("backend_cls", [Ledger, PartitionedBackend])
+    def test_maintained_by_writes(self, csv_path: str, backend_cls) -> None:
+        backend = backend_cls(csv_path)
+        self.exercise(backend)
+        report = backend.aggregates().report()
+        assert report["accounts"] == 3
+        assert report["total_balance"] == 39900 + 100000 + 10000 - 5000 + 500000
+        assert report["total_deposits"] == 10000
+        assert report["total_withdrawals"] == 5000
+        # apply_deltas without gross amounts only moves balances
+        assert sum(stats["credited"] for stats in report["operations"].values()) == 10000 + 20000 + 100 + 500000
+        assert [entry["username"] for entry in report["top_balances"]] == ["Robert", "Test2", "Test"]
+        backend.close()
+
+    def test_batch_counts_gross_deposits_and_withdrawals(self, csv_path: str, tmp_path) -> None:
+        path = os.path.join(tmp_path, "transactions.csv")
+        with open(path, "w") as transactions_file:
+            transactions_file.write(
+                "Type,Username,Recipient,Amount\n"
+                "deposit,Test,,100\n"
+                "withdraw,Test,,60\n"
+                "transfer,Test2,Test,5\n"
+                "withdraw,Test,,1000000\n"
+                "deposit,Test2,,0.5\n"
+            )
+        ledger = Ledger(csv_path)
+        apply_batch(ledger, load_transactions(path))
+        expected = ledger.aggregates().report()
+        # Gross amounts of the accepted rows, not Test's net 4500 credit
+        assert (expected["total_deposits"], expected["total_withdrawals"]) == (10050, 6000)
+        assert expected["operations"]["batch"]["deposited"] == 10050
+        ledger.close()
+
+        # Replayed from the journal
+        reopened = Ledger(csv_path)
+        assert reopened.aggregates().report() == expected
+        reopened.close()
+
+    def test_saved_with_the_snapshot(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path, compact_every=3, checkpoint_interval=0)
+        self.exercise(ledger)
+        assert os.path.exists(aggregates_path_for(csv_path))
+        expected = ledger.aggregates().report()
+        assert expected["operations"]["transfer"] == {"count": 1, "credited": 20000, "debited": 20000}
+        ledger.close()
+
+        # Saved aggregates plus the journal records written after them
+        reopened = Ledger(csv_path)
+        assert reopened.aggregates().report() == expected
+        reopened.close()
+
+    def test_recomputed_when_snapshot_changes(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.apply_delta("Test", 10000, "deposit")
+        ledger.compact()
+        ledger.close()
+        pl.DataFrame({"Username": ["Test"], "Password": ["x"], "BalanceCents": [7]}).write_csv(csv_path)
+
+        reopened = Ledger(csv_path)
+        report = reopened.aggregates().report()
+        assert (report["accounts"], report["total_balance"], report["total_deposits"]) == (1, 7, 0)
+        reopened.close()
+
+    def test_scanned_by_other_backends(self, csv_path: str) -> None:
+        backend = SqliteBackend(csv_path)
+        report = backend.aggregates().report()
+        assert (report["accounts"], report["total_balance"]) == (2, 139900)
+        assert report["top_balances"][0] == {"username": "Test2", "balance": 100000}
+        backend.close()
@@ -1,14 +1,19 @@
 import os
 import pytest
+import bank_app.services.storage
 import polars as pl
 from pytest_mock import MockerFixture
 from unittest.mock import Mock, patch
-from bank_app.services.bank_account import BankAccount, BankAccountService
+from bank_app.services.bank_account import AccountRegistry, BankAccount, BankAccountService
+from bank_app.services.paths import journal_path_for
+from bank_app.services.storage import close_backends
 from bank_app.services.users import User, UserService
 
 class TestBankAccount:
     @classmethod
     def teardown_class(cls) -> None:
+        # Release the files before they are reset
+        close_backends()
         csv_path = os.path.join(
             os.getcwd(), "tests", "test_data", "bank_system.csv"
         )
@@ -17,10 +22,13 @@ class TestBankAccount:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         df.write_csv(csv_path)
+        # Closing leaves the journal in place, and it records the old contents
+        if os.path.exists(journal_path_for(csv_path)):
+            os.remove(journal_path_for(csv_path))
 
     @pytest.fixture
     def user(self, mocker: MockerFixture) -> User:
@@ -43,24 +51,24 @@ class TestBankAccount:
         bank_account: BankAccount, 
         mocker: MockerFixture, 
     ) -> None:
-        assert bank_account.balance == 399.0
+        assert bank_account.balance == 39900
         
     def test_deposit(
         self,
         bank_account: BankAccount,
     ) -> None:
-        bank_account.deposit(100.0)
-        assert bank_account.balance == 499.0
+        bank_account.deposit(10000)
+        assert bank_account.balance == 49900
 
     @pytest.mark.parametrize(
         "deposit",
         [
-            -1000.0, -1.0, -893475983.0, -0.1
+            -100000, -100, -89347598300, -10
         ]
     )
     def test_deposit_invalid(
         self,
-        deposit: float,
+        deposit: int,
         bank_account: BankAccount,
     ) -> None:
         with pytest.raises(ValueError) as err_obj:
@@ -71,20 +79,66 @@ class TestBankAccount:
         self,
         bank_account: BankAccount,
     ) -> None:
-        bank_account.withdraw(150.0)
-        assert bank_account.balance == 349.0
+        bank_account.withdraw(15000)
+        assert bank_account.balance == 34900
 
     def test_withdraw_invalid(
         self,
         bank_account: BankAccount,
     ) -> None:
         with pytest.raises(ValueError) as err_obj:
-            bank_account.withdraw(100000000.0)
+            bank_account.withdraw(10000000000)
         assert err_obj.value.args[0] == "Insufficient funds"    
+
+    @pytest.mark.parametrize("withdrawal", [0, -100])
+    def test_withdraw_non_positive(
+        self,
+        withdrawal: int,
+        bank_account: BankAccount,
+    ) -> None:
+        with pytest.raises(ValueError) as err_obj:
+            bank_account.withdraw(withdrawal)
+        assert err_obj.value.args[0] == "Withdrawal must be greater than 0"
         
     def test_write_balance(
         self,
         bank_account: BankAccount,
     ) -> None:
-        bank_account.balance = 12345.0
-        assert bank_account.balance == 12345.0
+        bank_account.balance = 1234500
+        assert bank_account.balance == 1234500
+
+
+class TestAccountRegistry:
+    def test_handles_are_interned(self, csv_path: str) -> None:
+        registry = AccountRegistry()
+        account = registry.account("Test", csv_path)
+        assert registry.account("Test", csv_path) is account
+        assert registry.account("Test2", csv_path) is not account
+        assert account.csv_path == account.user.csv_path == csv_path
+        assert account.balance == 39900
+
+    def test_storage_is_resolved_once(self, csv_path: str, mocker: MockerFixture) -> None:
+        account = AccountRegistry().account("Test", csv_path)
+        assert account.balance == 39900
+        get_backend = mocker.spy(bank_app.services.storage, "get_backend")
+        for _ in range(10):
+            account.deposit(1)
+        assert get_backend.call_count == 0
+        assert account.balance == 39910
+
+    def test_least_recently_used_is_evicted(self, csv_path: str) -> None:
+        registry = AccountRegistry(max_size=2)
+        first = registry.account("Test", csv_path)
+        registry.account("Test2", csv_path)
+        assert registry.account("Test", csv_path) is first
+        registry.account("Robert", csv_path)
+        assert len(registry) == 2
+        assert registry.account("Test", csv_path) is first
+
+    def test_close_backends_drops_handles(self, csv_path: str) -> None:
+        registry = AccountRegistry()
+        account = registry.account("Test", csv_path)
+        close_backends()
+        assert registry.account("Test", csv_path) is not account
+        # A handle kept across the close resolves the reopened backend
+        assert account.balance == 39900
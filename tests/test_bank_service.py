@@ -6,11 +6,15 @@ from pytest_mock import MockerFixture
 from unittest.mock import MagicMock, Mock, patch
 import bank_app
 from bank_app.services.bank_account import BankAccount, BankAccountService
+from bank_app.services.paths import journal_path_for
+from bank_app.services.storage import close_backends
 from bank_app.services.users import User, UserService
         
 class TestBankService:
     @classmethod
     def teardown_class(cls) -> None:
+        # Release the files before they are reset
+        close_backends()
         csv_path = os.path.join(
             os.getcwd(), "tests", "test_data", "bank_system.csv"
         )
@@ -19,10 +23,13 @@ class TestBankService:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         df.write_csv(csv_path)
+        # Closing leaves the journal in place, and it records the old contents
+        if os.path.exists(journal_path_for(csv_path)):
+            os.remove(journal_path_for(csv_path))
     
     @pytest.fixture
     def bank_account_service(self, mocker: MockerFixture) -> BankAccountService:
@@ -57,7 +64,7 @@ class TestBankService:
         # 5 is to exit the while loop
         mocker.patch("builtins.input", side_effect=["1", "100.0", "5"])
         bank_account_service.manage_account()
-        assert bank_account_service.bank_account.balance == 499.0
+        assert bank_account_service.bank_account.balance == 49900
         
     def test_user_input_withdraw(
         self,
@@ -70,7 +77,7 @@ class TestBankService:
         # 5 is to exit the while loop
         mocker.patch("builtins.input", side_effect=["2", "100.0", "5"])
         bank_account_service.manage_account()
-        assert bank_account_service.bank_account.balance == 399.0
+        assert bank_account_service.bank_account.balance == 39900
     
     def test_user_input_check_balance(
         self,
@@ -84,8 +91,8 @@ class TestBankService:
         # 5 is to exit the while loop
         mocker.patch("builtins.input", side_effect=["4", "5"])
         bank_account_service.manage_account()
-        assert bank_account_service.bank_account.balance == 399.0
-        assert "Your current balance is: 399.0" in caplog.text
+        assert bank_account_service.bank_account.balance == 39900
+        assert "Your current balance is: 399.00" in caplog.text
         print(caplog.text)
 
     def test_user_input_transfer(
@@ -106,7 +113,7 @@ class TestBankService:
         assert mock_transfer_fn.call_args == mocker.call(
             bank_account_service.bank_account, 
             recipient_bank_account, 
-            100.0
+            10000
         )
         
     def test_transfer_fn(
@@ -119,9 +126,9 @@ class TestBankService:
         
         caplog.set_level(logging.INFO)
         
-        bank_account_service.transfer(bank_account_service.bank_account, recipient_bank_account, 100.0)
+        bank_account_service.transfer(bank_account_service.bank_account, recipient_bank_account, 10000)
         
-        assert bank_account_service.bank_account.balance == 299.0
-        assert recipient_bank_account.balance == 1100.0
+        assert bank_account_service.bank_account.balance == 29900
+        assert recipient_bank_account.balance == 110000
         
         print(caplog.text)
@@ -0,0 +1,140 @@
+import os
+import pytest
+import polars as pl
+from bank_app.services.batch import apply_batch, load_transactions
+from bank_app.services.history import HistoryStore
+from bank_app.services.ledger import Ledger
+
+
+class TestBatch:
+    @pytest.fixture
+    def ledger(self, tmp_path) -> Ledger:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+                        "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
+            # passwords are all "hello"
+            "BalanceCents": [39900, 100000]
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        ledger = Ledger(csv_path)
+        yield ledger
+        ledger.close()
+
+    @pytest.fixture
+    def transactions_csv(self, tmp_path) -> str:
+        path = os.path.join(tmp_path, "transactions.csv")
+        with open(path, "w") as transactions_file:
+            transactions_file.write(
+                "Type,Username,Recipient,Amount\n"
+                "deposit,Test,,100\n"
+                "withdraw,Test,,600\n"
+                "transfer,Test2,Test,500\n"
+                "withdraw,Test,,600\n"
+                "deposit,Nobody,,1\n"
+                "transfer,Test,Test,1\n"
+                "refund,Test,,1\n"
+                "deposit,Test2,,abc\n"
+            )
+        yield path
+
+    def test_load_transactions_csv(self, transactions_csv: str) -> None:
+        df = load_transactions(transactions_csv)
+        assert df.columns == ["Type", "Username", "Recipient", "Amount"]
+        assert df.height == 8
+        assert df["Amount"][0] == "100"
+        assert df["Amount"][7] == "abc"
+
+    def test_load_transactions_jsonl(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "transactions.jsonl")
+        with open(path, "w") as transactions_file:
+            transactions_file.write('{"Type": "Deposit", "Username": "Test", "Amount": 5}\n')
+        df = load_transactions(path)
+        assert df.row(0) == ("deposit", "Test", None, "5")
+
+    def test_apply_batch(self, ledger: Ledger, transactions_csv: str) -> None:
+        report = apply_batch(ledger, load_transactions(transactions_csv))
+
+        # First withdraw overdraws (499 < 600), the second is covered by the transfer in
+        assert report.rejected.select("Row", "Reason").rows() == [
+            (1, "Insufficient funds"),
+            (4, "Unknown account"),
+            (5, "Cannot transfer to the same account"),
+            (6, "Unknown transaction type"),
+            (7, "Amount must be greater than 0"),
+        ]
+        assert report.accepted == 3
+        assert report.balances == {"Test": 39900, "Test2": 50000}
+        assert ledger.get_balance("Test") == 39900
+        assert ledger.get_balance("Test2") == 50000
+
+    def test_apply_batch_missing_accounts(self, ledger: Ledger, tmp_path) -> None:
+        path = os.path.join(tmp_path, "transactions.csv")
+        with open(path, "w") as transactions_file:
+            transactions_file.write(
+                "Type,Username,Recipient,Amount\n"
+                "transfer,Test,,1\n"
+                "deposit,,,5\n"
+                "deposit,Test,,1\n"
+            )
+        report = apply_batch(ledger, load_transactions(path))
+
+        assert report.rejected.select("Row", "Reason").rows() == [
+            (0, "Recipient is required"),
+            (1, "Account is required"),
+        ]
+        assert report.accepted == 1
+        assert ledger.get_balance("Test") == 40000
+
+    def test_apply_batch_is_one_journal_record(self, ledger: Ledger) -> None:
+        transactions = pl.DataFrame({
+            "Type": ["deposit"] * 100,
+            "Username": ["Test", "Test2"] * 50,
+            "Recipient": [None] * 100,
+            "Amount": [1.0] * 100,
+        }, schema={"Type": pl.Utf8, "Username": pl.Utf8, "Recipient": pl.Utf8, "Amount": pl.Float64})
+        report = apply_batch(ledger, transactions)
+        assert report.rejected.height == 0
+        assert report.balances == {"Test": 44900, "Test2": 105000}
+        assert len(list(ledger.journal.replay())) == 1
+
+    def test_apply_batch_amounts_in_cents(self, ledger: Ledger) -> None:
+        transactions = pl.DataFrame({
+            "Type": ["deposit", "deposit", "withdraw"],
+            "Username": ["Test", "Test", "Test"],
+            "Recipient": [None] * 3,
+            "Amount": [0.29, 0.001, 0.1],
+        }, schema={"Type": pl.Utf8, "Username": pl.Utf8, "Recipient": pl.Utf8, "Amount": pl.Float64})
+        report = apply_batch(ledger, transactions)
+        assert report.rejected.select("Row", "Reason").rows() == [(1, "Amount can't have fractions of a cent")]
+        assert report.balances == {"Test": 39919}
+
+    def test_apply_batch_amounts_are_exact(self, ledger: Ledger) -> None:
+        transactions = pl.DataFrame({
+            "Type": ["deposit"] * 6,
+            "Username": ["Test"] * 6,
+            "Recipient": [None] * 6,
+            "Amount": ["90071992547409.93", "0.29", "inf", "nan", "1e30", "1e3"],
+        }, schema={"Type": pl.Utf8, "Username": pl.Utf8, "Recipient": pl.Utf8, "Amount": pl.Utf8})
+        report = apply_batch(ledger, transactions)
+        assert report.rejected.select("Row", "Reason").rows() == [
+            (2, "Amount must be greater than 0"),
+            (3, "Amount must be greater than 0"),
+            (4, "Amount is too large"),
+        ]
+        # A float would have ended at ...148.48
+        assert report.balances == {"Test": 39900 + 9007199254740993 + 29 + 100000}
+
+    def test_apply_batch_records_history(self, ledger: Ledger, transactions_csv: str, tmp_path) -> None:
+        history = HistoryStore(os.path.join(tmp_path, "history.sqlite"))
+        apply_batch(ledger, load_transactions(transactions_csv), history)
+
+        assert [(entry.type, entry.source, entry.destination, entry.amount, entry.balance)
+                for entry in history.last("Test")] == [
+            ("deposit", None, "Test", 10000, 49900),
+            ("transfer", "Test2", "Test", 50000, 99900),
+            ("withdraw", "Test", None, -60000, 39900),
+        ]
+        assert [(entry.amount, entry.balance) for entry in history.last("Test2")] == [(-50000, 50000)]
+        history.close()
@@ -0,0 +1,48 @@
+import os
+import pytest
+import polars as pl
+from bank_app.bench import BENCH_AMOUNT, BENCH_BALANCE, generate_csv, parse_mix, percentile, run_benchmark
+from bank_app.services.ledger import Ledger
+
+
+class TestBench:
+    @pytest.fixture
+    def csv_path(self, tmp_path) -> str:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        generate_csv(csv_path, 50)
+        yield csv_path
+
+    def test_generate_csv(self, csv_path: str) -> None:
+        df = pl.read_csv(csv_path)
+        assert df.height == 50
+        assert df["Username"][49] == "user49"
+        assert df["BalanceCents"].n_unique() == 1
+
+    def test_parse_mix(self) -> None:
+        assert parse_mix("deposit=3,withdraw") == {"deposit": 3.0, "withdraw": 1.0}
+        with pytest.raises(ValueError):
+            parse_mix("fly=1")
+        with pytest.raises(ValueError):
+            parse_mix("deposit=0")
+
+    def test_percentile(self) -> None:
+        samples = list(range(1, 101))
+        assert percentile(samples, 0.50) == 50.0
+        assert percentile(samples, 0.99) == 99.0
+        assert percentile([], 0.99) == 0.0
+
+    def test_run_benchmark(self, csv_path: str) -> None:
+        results = run_benchmark(
+            csv_path, 50, ops=200, concurrency=4, mix="create=1,authorize=1,deposit=1,withdraw=1,transfer=1"
+        )
+        operations = results["operations"]
+        assert sum(op["count"] for op in operations.values()) == 200
+        assert all(op["errors"] == 0 for op in operations.values())
+        assert results["peak_rss_mb"] > 0
+        assert operations["deposit"]["p99_ms"] >= operations["deposit"]["p50_ms"]
+
+        # Money only moves between accounts apart from deposits and withdrawals
+        ledger = Ledger(csv_path)
+        expected = 50 * BENCH_BALANCE + BENCH_AMOUNT * (operations["deposit"]["count"] - operations["withdraw"]["count"])
+        assert sum(account.balance for account in ledger.accounts()) == expected
+        ledger.close()
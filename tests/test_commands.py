@@ -0,0 +1,80 @@
+import io
+import json
+import typing
+import pytest
+from bank_app.services import commands
+from bank_app.services.commands import CommandRunner
+from bank_app.services.storage import get_backend
+
+
+class TestCommandRunner:
+    def pipeline(self, runner: CommandRunner, lines: bytes) -> typing.List[typing.Dict[str, typing.Any]]:
+        output = io.BytesIO()
+        runner.run_pipeline(io.BytesIO(lines), output)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_operations(self, csv_path: str) -> None:
+        runner = CommandRunner(csv_path)
+        assert runner.run({"op": "deposit", "username": "Test", "amount": "1.50"}) == {"balance": "400.50"}
+        assert runner.run({"op": "withdraw", "username": "Test", "amount": 0.5}) == {"balance": "400.00"}
+        assert runner.run({"op": "transfer", "username": "Test2", "recipient": "Test", "amount": "100"}) == {
+            "balance": "900.00"
+        }
+        assert runner.run({"op": "create", "username": "Robert", "password": "pw", "balance": "5"}) == {
+            "username": "Robert", "balance": "5.00"
+        }
+        assert runner.run({"op": "balance", "username": "Test"}) == {"balance": "500.00"}
+        assert get_backend(csv_path).get_balance("Robert") == 500
+
+    def test_rejected_operations_raise(self, csv_path: str) -> None:
+        runner = CommandRunner(csv_path)
+        with pytest.raises(ValueError, match="Insufficient funds"):
+            runner.run({"op": "withdraw", "username": "Test", "amount": "1000"})
+        with pytest.raises(ValueError, match="does not exist"):
+            runner.run({"op": "withdraw", "username": "Nobody", "amount": "1"})
+        with pytest.raises(ValueError, match="does not exist"):
+            runner.run({"op": "balance", "username": "Nobody"})
+        with pytest.raises(ValueError, match="Unknown op"):
+            runner.run({"op": "login", "username": "Test"})
+        assert get_backend(csv_path).get_balance("Test") == 39900
+
+    def test_pipeline(self, csv_path: str) -> None:
+        lines = b"".join([
+            b'{"op": "deposit", "username": "Test", "amount": "1", "id": 1}\n',
+            b"\n",
+            b"not json\n",
+            b'{"op": "deposit", "username": "Test"}\n',
+            b'{"op": "transfer", "username": "Test", "recipient": "Nobody", "amount": 1, "id": "t"}\n',
+            b'["deposit"]\n',
+            # The last line doesn't need a newline
+            b'{"op": "balance", "username": "Test"}',
+        ])
+        assert self.pipeline(CommandRunner(csv_path), lines) == [
+            {"ok": True, "balance": "400.00", "id": 1},
+            {"ok": False, "error": "Invalid JSON"},
+            {"ok": False, "error": "Missing field 'amount'"},
+            {"ok": False, "error": "User Nobody does not exist", "id": "t"},
+            {"ok": False, "error": "Request must be a JSON object"},
+            {"ok": True, "balance": "400.00"},
+        ]
+
+    def test_pipeline_flushes_once_per_read(self, csv_path: str, mocker) -> None:
+        mocker.patch.object(commands, "PIPELINE_READ_BYTES", 4096)
+        runner = CommandRunner(csv_path)
+        flush = mocker.spy(runner, "flush")
+        line = b'{"op": "deposit", "username": "Test", "amount": "0.01"}\n'
+        responses = self.pipeline(runner, line * 1000)
+
+        assert len(responses) == 1000
+        assert responses[-1] == {"ok": True, "balance": "409.00"}
+        # One flush per read of 4096 bytes, not one per command
+        assert flush.call_count == -(-len(line) * 1000 // 4096)
+
+    def test_pipeline_rejects_long_lines(self, csv_path: str, mocker) -> None:
+        mocker.patch.object(commands, "PIPELINE_READ_BYTES", 64)
+        mocker.patch.object(commands, "MAX_LINE_BYTES", 100)
+        lines = b'{"op": "balance", "username": "' + b"x" * 500 + b'"}\n{"op": "balance", "username": "Test"}\n'
+        assert self.pipeline(CommandRunner(csv_path), lines) == [
+            {"ok": False, "error": "Request too long"},
+            {"ok": True, "balance": "399.00"},
+        ]
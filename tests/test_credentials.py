@@ -0,0 +1,66 @@
+import pytest
+from pytest_mock import MockerFixture
+from bank_app.services.credentials import CREDENTIALS, CredentialCache
+from bank_app.services.ledger import Ledger
+from bank_app.services.users import User
+
+
+class TestCredentialCache:
+    @pytest.fixture
+    def csv_path(self, csv_path: str) -> str:
+        CREDENTIALS.reset()
+        yield csv_path
+
+    def test_lru_eviction(self) -> None:
+        cache = CredentialCache(max_size=2, ttl=60)
+        cache.put("a.csv", "one", "h1")
+        cache.put("a.csv", "two", "h2")
+        assert cache.get("a.csv", "one") == "h1"
+        cache.put("a.csv", "three", "h3")
+
+        assert cache.get("a.csv", "two") is None
+        assert cache.get("a.csv", "one") == "h1"
+        assert cache.get("b.csv", "one") is None
+        stats = cache.stats()
+        assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 2, 1)
+
+    def test_ttl_expiry(self, mocker: MockerFixture) -> None:
+        cache = CredentialCache(max_size=10, ttl=5)
+        clock = mocker.patch("bank_app.services.credentials.time.monotonic", return_value=100.0)
+        cache.put("a.csv", "one", "h1")
+        clock.return_value = 104.0
+        assert cache.get("a.csv", "one") == "h1"
+        clock.return_value = 106.0
+        assert cache.get("a.csv", "one") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_disabled(self) -> None:
+        cache = CredentialCache(max_size=0)
+        cache.put("a.csv", "one", "h1")
+        assert cache.get("a.csv", "one") is None
+
+    def test_repeated_logins_skip_storage(self, csv_path: str, mocker: MockerFixture) -> None:
+        get_user = mocker.spy(Ledger, "get_user")
+        for _ in range(3):
+            user = User("Test", "hello")
+            user.csv_path = csv_path
+            assert user.login() is True
+        assert get_user.call_count == 1
+        assert CREDENTIALS.stats()["hits"] == 2
+
+        user = User("Test", "wrong")
+        user.csv_path = csv_path
+        with pytest.raises(ValueError):
+            user.authorize(user.password)
+        assert get_user.call_count == 1
+
+    def test_create_invalidates(self, csv_path: str) -> None:
+        user = User("Robert", "hello")
+        user.csv_path = csv_path
+        with pytest.raises(ValueError):
+            user.authorize(user.password)
+
+        CREDENTIALS.put(csv_path, "Robert", "stale")
+        user.create(100)
+        assert CREDENTIALS.get(csv_path, "Robert") is None
+        assert user.authorize(user.password) is True
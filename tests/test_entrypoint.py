@@ -1,9 +1,12 @@
+import io
+import logging
 import pytest
 from unittest.mock import patch, Mock
 from pytest_mock import MockerFixture
 from bank_app.services.bank_account import BankAccount, BankAccountService
 from bank_app.services.users import UserService
 from bank_app.run import run
+from bank_app.services.ledger import Ledger
 
 def test_run_create_user(mocker: MockerFixture):
     mock_create_user = mocker.patch.object(UserService, 'create_user')
@@ -25,4 +28,136 @@ def test_run_login_failed_with_exception(mocker: MockerFixture):
     with pytest.raises(Exception) as e_info:
         run()
     assert str(e_info.value) == "Invalid login attempt, please try again"
-    assert mock_login.call_count == 1
\ No newline at end of file
+    assert mock_login.call_count == 1
+def test_run_batch(mocker: MockerFixture, tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+    transactions_path = tmp_path / "transactions.csv"
+    transactions_path.write_text("Type,Username,Recipient,Amount\ndeposit,Test,,5\nwithdraw,Test,,100\n")
+    report_path = tmp_path / "rejected.csv"
+    mock_input = mocker.patch('builtins.input')
+    
+    run(["--csv-path", str(csv_path), "batch", str(transactions_path), "--report", str(report_path)])
+    
+    assert mock_input.call_count == 0
+    ledger = Ledger(str(csv_path))
+    assert ledger.get_balance("Test") == 1500
+    ledger.close()
+    assert "Insufficient funds" in report_path.read_text()
+
+def test_run_provision(tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+    users_path = tmp_path / "users.csv"
+    users_path.write_text("Username,Password,Balance\nAlice,secret,12.5\nTest,hello,1\nBob,pw,\n")
+    report_path = tmp_path / "rejected.csv"
+
+    run(["--csv-path", str(csv_path), "provision", str(users_path), "--chunk-size", "2", "--report", str(report_path)])
+    export_path = tmp_path / "export.csv"
+    run(["--csv-path", str(csv_path), "export", "--output", str(export_path)])
+
+    exported = export_path.read_text()
+    assert "Alice" in exported and "1250" in exported and "Bob" in exported
+    assert "secret" not in exported
+    assert "Username already exists" in report_path.read_text()
+
+def test_run_reconcile(tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\nTest2,x,2550\n")
+    external_path = tmp_path / "general_ledger.csv"
+    external_path.write_text("Username,Balance\nTest,10.00\nTest2,25.00\n")
+    output_path = tmp_path / "mismatches.csv"
+
+    run(["--csv-path", str(csv_path), "reconcile", str(external_path), "--output", str(output_path)])
+
+    assert output_path.read_text() == (
+        "Username,StoreBalanceCents,ExternalBalanceCents,Issue\nTest2,2550,2500,Balance differs\n"
+    )
+
+def test_run_export(tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+    output_path = tmp_path / "export.csv"
+
+    run(["--csv-path", str(csv_path), "export", "--output", str(output_path)])
+
+    assert output_path.read_text() == "Username,Password,BalanceCents\nTest,x,1000\n"
+
+def test_run_export_rejects_live_snapshot(tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+
+    with pytest.raises(ValueError):
+        run(["--csv-path", str(csv_path), "export", "--output", str(csv_path)])
+    with pytest.raises(SystemExit):
+        run(["--csv-path", str(csv_path), "export"])
+    assert csv_path.read_text() == "Username,Password,BalanceCents\nTest,x,1000\n"
+
+def test_run_convert(tmp_path):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,Balance\nTest,x,10.5\n")
+
+    run(["--csv-path", str(csv_path), "convert"])
+
+    assert csv_path.read_text() == "Username,Password,BalanceCents\nTest,x,1050\n"
+
+def test_run_report(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\nTest2,x,2550\nTest3,x,5\n")
+
+    run(["--csv-path", str(csv_path), "report", "--top", "2"])
+
+    assert "Accounts: 3" in caplog.text
+    assert "Total balance: 35.55" in caplog.text
+    assert "1. Test2: 25.50" in caplog.text
+    assert "2. Test: 10.00" in caplog.text
+    assert "Test3: 0.05" not in caplog.text
+
+def test_run_balance(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+
+    run(["--csv-path", str(csv_path), "balance", "Test"])
+    assert "Test: 10.00" in caplog.text
+
+    with pytest.raises(ValueError):
+        run(["--csv-path", str(csv_path), "balance", "Nobody"])
+
+def test_run_scripted_commands(tmp_path, caplog, monkeypatch):
+    caplog.set_level(logging.INFO)
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\nTest2,x,2550\n")
+
+    run(["--csv-path", str(csv_path), "deposit", "Test", "5"])
+    assert "Test: 15.00" in caplog.text
+    run(["--csv-path", str(csv_path), "withdraw", "Test", "2.50"])
+    assert "Test: 12.50" in caplog.text
+    run(["--csv-path", str(csv_path), "transfer", "Test2", "Test", "0.50"])
+    assert "Test2: 25.00" in caplog.text
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("secret\n"))
+    run(["--csv-path", str(csv_path), "create", "Robert", "--balance", "3", "--password-stdin"])
+    assert "Robert: 3.00" in caplog.text
+
+    with pytest.raises(ValueError):
+        run(["--csv-path", str(csv_path), "withdraw", "Test", "100"])
+
+def test_run_pipeline(tmp_path, monkeypatch):
+    csv_path = tmp_path / "bank_system.csv"
+    csv_path.write_text("Username,Password,BalanceCents\nTest,x,1000\n")
+    stdin = io.TextIOWrapper(io.BytesIO(
+        b'{"op": "deposit", "username": "Test", "amount": "1", "id": 1}\n'
+        b'{"op": "withdraw", "username": "Test", "amount": "100", "id": 2}\n'
+    ))
+    stdout = io.TextIOWrapper(io.BytesIO())
+    monkeypatch.setattr("sys.stdin", stdin)
+    monkeypatch.setattr("sys.stdout", stdout)
+
+    run(["--csv-path", str(csv_path), "pipeline"])
+
+    assert stdout.buffer.getvalue().decode().splitlines() == [
+        '{"ok":true,"balance":"11.00","id":1}',
+        '{"ok":false,"error":"Insufficient funds","id":2}',
+    ]
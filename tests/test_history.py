@@ -0,0 +1,107 @@
+import datetime
+import logging
+import os
+import sqlite3
+import time
+import pytest
+from bank_app.services.bank_account import BankAccount, BankAccountService, format_statement
+from bank_app.services.history import HistoryStore, get_history, history_path_for
+from bank_app.services.storage import close_backends
+from bank_app.services.users import User
+
+
+class TestHistoryStore:
+    @pytest.fixture
+    def history(self, tmp_path) -> HistoryStore:
+        history = HistoryStore(os.path.join(tmp_path, "history.sqlite"), batch_size=3, flush_interval=60)
+        yield history
+        history.close()
+
+    def rows(self, history: HistoryStore) -> int:
+        return history._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def test_entries_are_written_in_batches(self, history: HistoryStore) -> None:
+        history.record("Test", "deposit", 100, 40000, destination="Test")
+        history.record("Test", "withdraw", -50, 39950, source="Test")
+        assert self.rows(history) == 0
+        history.record_transfer("Test", "Test2", 50, 39900, 100050)
+        assert self.rows(history) == 4
+
+    def test_buffer_is_flushed_in_the_background(self, tmp_path) -> None:
+        db_path = os.path.join(tmp_path, "history.sqlite")
+        history = HistoryStore(db_path, batch_size=100, flush_interval=0.05)
+        history.record("Test", "deposit", 100, 40000, destination="Test")
+        reader = sqlite3.connect(db_path)
+        deadline = time.monotonic() + 5
+        while reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 1
+        reader.close()
+        history.close()
+
+    def test_queries_see_buffered_entries(self, history: HistoryStore) -> None:
+        history.record("Test", "deposit", 100, 40000, destination="Test")
+        assert [entry.balance for entry in history.last("Test")] == [40000]
+
+    def test_last(self, history: HistoryStore) -> None:
+        for balance in range(1, 21):
+            history.record("Test", "deposit", 1, balance, destination="Test")
+        history.record("Test2", "deposit", 1, 1, destination="Test2")
+        assert [entry.balance for entry in history.last("Test", 3)] == [18, 19, 20]
+        assert len(history.last("Test2", 3)) == 1
+        assert history.last("Nobody") == []
+
+    def test_between(self, history: HistoryStore) -> None:
+        for ts in [100.0, 200.0, 300.0]:
+            history.record_many([("Test", "deposit", None, "Test", 1, int(ts))], ts=ts)
+        assert [entry.balance for entry in history.between("Test", 150, 300)] == [200]
+        assert [entry.balance for entry in history.between("Test", 0, 1000)] == [100, 200, 300]
+
+    def test_statements_use_the_account_index(self, history: HistoryStore) -> None:
+        plan = " ".join(
+            str(row) for row in history._conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM history WHERE account = ? AND ts >= ? AND ts < ? ORDER BY ts, id",
+                ("Test", 0, 1),
+            )
+        )
+        assert "history_account_ts" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+class TestStatement:
+    def test_account_operations_are_recorded(self, csv_path: str) -> None:
+        account = BankAccount(User("Test", csv_path=csv_path), csv_path)
+        recipient = BankAccount(User("Test2", csv_path=csv_path), csv_path)
+        account.deposit(100)
+        account.withdraw(1000)
+        BankAccountService(account.user, account).transfer(account, recipient, 900)
+
+        assert [(entry.type, entry.amount, entry.balance) for entry in account.statement()] == [
+            ("deposit", 100, 40000), ("withdraw", -1000, 39000), ("transfer", -900, 38100)
+        ]
+        assert [(entry.source, entry.amount, entry.balance) for entry in recipient.statement()] == [
+            ("Test", 900, 100900)
+        ]
+        assert len(account.statement(limit=1)) == 1
+
+        today = datetime.date.today()
+        assert len(account.statement(start=today)) == 3
+        assert account.statement(start=today - datetime.timedelta(days=7), end=today - datetime.timedelta(days=1)) == []
+
+    def test_history_survives_close(self, csv_path: str) -> None:
+        BankAccount(User("Test", csv_path=csv_path), csv_path).deposit(100)
+        close_backends()
+        assert os.path.exists(history_path_for(csv_path))
+        assert len(get_history(csv_path).last("Test")) == 1
+
+    def test_statement_menu_option(self, csv_path: str, mocker, caplog) -> None:
+        caplog.set_level(logging.INFO)
+        account = BankAccount(User("Test", csv_path=csv_path), csv_path)
+        account.deposit(100)
+        mocker.patch("builtins.input", side_effect=["6", "", "6", "2000-01-01", "", "5"])
+        BankAccountService(account.user, account).manage_account()
+        assert caplog.text.count("deposit") == 2
+        assert "+1.00" in caplog.text
+
+    def test_format_statement(self) -> None:
+        assert format_statement([]) == "No transactions"
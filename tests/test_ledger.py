@@ -0,0 +1,197 @@
+import os
+import time
+import pytest
+import polars as pl
+from bank_app.services.journal import Journal
+from bank_app.services import ledger as ledger_module
+from bank_app.services.ledger import Ledger, journal_path_for
+
+
+class TestLedger:
+    def file_balance(self, csv_path: str, username: str) -> int:
+        df = pl.read_csv(csv_path)
+        return df.filter(df["Username"] == username)["BalanceCents"][0]
+
+    def test_get_balance(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        assert ledger.get_balance("Test") == 39900
+        assert ledger.get_balance("Nobody") is None
+        ledger.close()
+
+    def test_transactions_append_to_journal(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        assert ledger.apply_delta("Test", 100, "deposit") == 40000
+        assert ledger.apply_delta("Test2", -5000, "withdraw") == 95000
+
+        records = list(Journal(journal_path_for(csv_path)).replay())
+        assert [record["op"] for record in records] == ["deposit", "withdraw"]
+        assert records[1] == {"op": "withdraw", "user": "Test2", "amount": 5000, "balance": 95000}
+        # Snapshot is untouched until compaction
+        assert self.file_balance(csv_path, "Test") == 39900
+        ledger.close()
+
+    def test_replay_on_startup(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.create_user("Robert", "hash", 500)
+        ledger.flush()
+
+        # Simulate a crash: a fresh ledger rebuilds state from snapshot + journal
+        recovered = Ledger(csv_path)
+        assert recovered.get_balance("Test") == 40000
+        assert recovered.get_user("Robert").password == "hash"
+
+    def test_torn_record_is_ignored(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.apply_delta("Test", 100, "deposit")
+        with open(journal_path_for(csv_path), "a") as journal_file:
+            journal_file.write('{"op":"deposit","user":"Te')
+
+        assert Ledger(csv_path).get_balance("Test") == 40000
+
+    def test_torn_record_is_truncated_before_appending(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.close()
+        intact = os.path.getsize(journal_path_for(csv_path))
+        with open(journal_path_for(csv_path), "a") as journal_file:
+            journal_file.write('{"op":"deposit","user":"Te')
+
+        reopened = Ledger(csv_path)
+        assert os.path.getsize(journal_path_for(csv_path)) == intact
+        # Without the truncation this record would be glued onto the torn one and lost
+        reopened.apply_delta("Test", 100, "deposit")
+        reopened.close()
+        recovered = Ledger(csv_path)
+        assert recovered.get_balance("Test") == 40100
+        recovered.close()
+
+    def test_corrupt_record_offset_is_logged(self, tmp_path, caplog) -> None:
+        path = os.path.join(tmp_path, "bank_system.journal")
+        with open(path, "w") as journal_file:
+            journal_file.write('{"op":"set","user":"Test","balance":1}\nnot json\n{"op":"set","user":"Test","balance":2}\n')
+        journal = Journal(path)
+        records, offset = journal.read_from(0)
+        journal.close()
+        assert [record["balance"] for record in records] == [1, 2]
+        assert offset == os.path.getsize(path)
+        assert f"Ignoring corrupt record at offset 39 of {path}" in caplog.text
+
+    def test_compaction(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path, compact_every=2, checkpoint_interval=0)
+        ledger.apply_delta("Test", 100, "deposit")
+        assert self.file_balance(csv_path, "Test") == 39900
+
+        ledger.apply_delta("Test", 100, "deposit")
+        assert self.file_balance(csv_path, "Test") == 40100
+        assert os.path.getsize(journal_path_for(csv_path)) == 0
+
+    def test_background_checkpoint(self, csv_path: str, mocker) -> None:
+        ledger = Ledger(csv_path, compact_every=2, checkpoint_interval=60)
+        compact = mocker.spy(ledger, "compact")
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.apply_delta("Test", 100, "deposit")
+
+        # The commit only woke the checkpointer, which writes the snapshot on its own thread
+        deadline = time.monotonic() + 10
+        while os.path.getsize(journal_path_for(csv_path)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert compact.call_count == 1
+        assert self.file_balance(csv_path, "Test") == 40100
+        ledger.close()
+
+    def test_checkpoint_carries_records_written_meanwhile(self, csv_path: str, mocker) -> None:
+        ledger = Ledger(csv_path, checkpoint_interval=0)
+        ledger.apply_delta("Test", 100, "deposit")
+        real_stage = ledger_module.stage_snapshot
+
+        def stage_while_writing(*args):
+            # The in-memory state is not locked while the snapshot is written
+            ledger.apply_delta("Test2", 500, "deposit")
+            return real_stage(*args)
+
+        mocker.patch.object(ledger_module, "stage_snapshot", side_effect=stage_while_writing)
+        ledger.compact()
+
+        assert self.file_balance(csv_path, "Test") == 40000
+        assert self.file_balance(csv_path, "Test2") == 100000
+        records = list(Journal(journal_path_for(csv_path)).replay())
+        assert [record["user"] for record in records] == ["Test2"]
+        assert Ledger(csv_path, checkpoint_interval=0).get_balance("Test2") == 100500
+        ledger.close()
+
+    def test_failed_checkpoint_keeps_snapshot(self, csv_path: str, mocker) -> None:
+        before = open(csv_path).read()
+        ledger = Ledger(csv_path, checkpoint_interval=0)
+        ledger.apply_delta("Test", 100, "deposit")
+        mocker.patch("bank_app.services.snapshot.fsync_file", side_effect=OSError("disk full"))
+
+        with pytest.raises(OSError):
+            ledger.compact()
+
+        assert open(csv_path).read() == before
+        assert [name for name in os.listdir(os.path.dirname(csv_path)) if name.endswith(".tmp")] == []
+        assert Ledger(csv_path, checkpoint_interval=0).get_balance("Test") == 40000
+        mocker.stopall()
+        ledger.close()
+
+    def test_close_leaves_the_journal(self, csv_path: str, mocker) -> None:
+        ledger = Ledger(csv_path)
+        ledger.set_balance("Test2", 7500)
+        compact = mocker.spy(ledger, "compact")
+        ledger.close()
+        assert compact.call_count == 0
+        assert self.file_balance(csv_path, "Test2") == 100000
+        assert os.path.getsize(journal_path_for(csv_path)) > 0
+
+        reopened = Ledger(csv_path)
+        assert reopened.get_balance("Test2") == 7500
+        reopened.close()
+
+    def test_next_process_checkpoints_the_journal(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path, checkpoint_interval=0)
+        ledger.set_balance("Test2", 7500)
+        ledger.close()
+
+        # A long-running process picks the journal up on its next scheduled checkpoint
+        reopened = Ledger(csv_path, checkpoint_interval=0.05)
+        deadline = time.monotonic() + 10
+        while os.path.getsize(journal_path_for(csv_path)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.file_balance(csv_path, "Test2") == 7500
+        reopened.close()
+
+    def test_create_user_updates_index(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.create_user("Robert", "hash", 10000)
+        assert ledger.get_balance("Robert") == 10000
+        assert ledger.get_user("Robert").password == "hash"
+
+        with pytest.raises(ValueError) as err_obj:
+            ledger.create_user("Robert", "hash", 100)
+        assert err_obj.value.args[0] == "Username already exists"
+
+        ledger.compact()
+        assert self.file_balance(csv_path, "Robert") == 10000
+        ledger.close()
+
+    def test_duplicate_usernames_first_row_wins(self, csv_path: str) -> None:
+        pl.DataFrame({
+            "Username": ["Dup", "Dup"], "Password": ["a", "b"], "BalanceCents": [100, 200]
+        }).write_csv(csv_path)
+        ledger = Ledger(csv_path)
+        assert ledger.get_user("Dup").password == "a"
+        assert ledger.get_balance("Dup") == 100
+
+    def test_transfer_is_one_journal_record(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+        ledger.transfer("Test", "Test2", 9900)
+
+        records = list(Journal(journal_path_for(csv_path)).replay())
+        assert records == [{
+            "op": "transfer", "from": "Test", "to": "Test2", "amount": 9900,
+            "from_balance": 30000, "to_balance": 109900,
+        }]
+        recovered = Ledger(csv_path)
+        assert recovered.get_balance("Test") == 30000
+        assert recovered.get_balance("Test2") == 109900
@@ -0,0 +1,35 @@
+import os
+import pytest
+import polars as pl
+from bank_app.services.loader import is_legacy_csv, load_accounts, scan_accounts
+
+
+class TestLoader:
+    @pytest.fixture
+    def csv_path(self, tmp_path) -> str:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        # Hash-looking passwords would be inferred as i64 without the schema
+        with open(csv_path, "w") as csv_file:
+            csv_file.write("Username,Password,BalanceCents\nTest,1,39900\nTest2,2,100000\nTest,3,500\n")
+        yield csv_path
+
+    def test_schema_types(self, csv_path: str) -> None:
+        df = load_accounts(csv_path)
+        assert df.schema == {"Username": pl.Utf8, "Password": pl.Utf8, "BalanceCents": pl.Int64}
+        assert df.height == 3
+
+    def test_projection_and_predicate_pushdown(self, csv_path: str) -> None:
+        plan = scan_accounts(csv_path).filter(pl.col("Username") == "Test2").select("BalanceCents").explain()
+        assert "PROJECT" in plan
+        assert "SELECTION" in plan
+
+        df = load_accounts(csv_path, columns=["Username", "BalanceCents"], usernames=["Test2"])
+        assert df.columns == ["Username", "BalanceCents"]
+        assert df.rows() == [("Test2", 100000)]
+
+    def test_legacy_balance_is_read_as_cents(self, tmp_path) -> None:
+        csv_path = os.path.join(tmp_path, "legacy.csv")
+        with open(csv_path, "w") as csv_file:
+            csv_file.write("Username,Password,Balance\nTest,hash1,0.29\nTest2,hash2,1000\n")
+        assert is_legacy_csv(csv_path)
+        assert load_accounts(csv_path).rows() == [("Test", "hash1", 29), ("Test2", "hash2", 100000)]
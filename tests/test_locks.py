@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import threading
+import pytest
+from bank_app.services.ledger import Ledger
+from bank_app.services.locks import LockManager
+
+
+def deposit_worker(csv_path: str, username: str, count: int) -> None:
+    ledger = Ledger(csv_path)
+    for _ in range(count):
+        ledger.apply_delta(username, 100, "deposit")
+    ledger.close()
+
+
+class TestLocks:
+    def test_stripes_are_stable(self, tmp_path) -> None:
+        locks = LockManager(os.path.join(tmp_path, "a.lock"))
+        other = LockManager(os.path.join(tmp_path, "b.lock"))
+        assert locks.stripe_for("Test") == other.stripe_for("Test")
+
+    def test_exclusive_waits_for_account_holders(self, tmp_path) -> None:
+        locks = LockManager(os.path.join(tmp_path, "bank.lock"))
+        events = []
+
+        def compact() -> None:
+            with locks.exclusive():
+                events.append("exclusive")
+
+        with locks.accounts("Test"):
+            thread = threading.Thread(target=compact)
+            thread.start()
+            thread.join(20)
+            events.append("accounts released")
+        thread.join()
+        assert events == ["accounts released", "exclusive"]
+
+    def test_opposite_transfers_do_not_deadlock(self, csv_path: str) -> None:
+        ledger = Ledger(csv_path)
+
+        def transfer_many(source: str, recipient: str) -> None:
+            for _ in range(100):
+                ledger.transfer(source, recipient, 100)
+
+        threads = [
+            threading.Thread(target=transfer_many, args=("Test", "Test2")),
+            threading.Thread(target=transfer_many, args=("Test2", "Test")),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert not any(thread.is_alive() for thread in threads)
+        assert ledger.get_balance("Test") + ledger.get_balance("Test2") == 139900
+        ledger.close()
+
+    def test_processes_do_not_lose_updates(self, csv_path: str) -> None:
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=deposit_worker, args=(csv_path, username, 25))
+            for username in ["Test", "Test2", "Test", "Test2"]
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+        assert all(worker.exitcode == 0 for worker in workers)
+
+        ledger = Ledger(csv_path)
+        assert ledger.get_balance("Test") == 44900
+        assert ledger.get_balance("Test2") == 105000
+        ledger.close()
@@ -0,0 +1,69 @@
+import pytest
+from bank_app.services.bank_account import BankAccount
+from bank_app.services.metrics import METRICS, Histogram, Profiler, instrumented
+from bank_app.services.users import User
+
+
+class TestMetrics:
+    @pytest.fixture
+    def metrics(self):
+        METRICS.reset()
+        METRICS.enable()
+        yield METRICS
+        METRICS.disable()
+        METRICS.reset()
+
+    def test_histogram_percentiles(self) -> None:
+        histogram = Histogram()
+        for _ in range(99):
+            histogram.record(1_500)  # 1.5us -> bucket below 2us
+        histogram.record(5_000_000)
+        assert histogram.count == 100
+        assert histogram.percentile(0.50) == 0.002
+        assert histogram.percentile(0.99) == 0.002
+        assert histogram.percentile(1.0) == 5.0
+
+    def test_disabled_records_nothing(self) -> None:
+        METRICS.reset()
+        instrumented("noop")(lambda: None)()
+        METRICS.increment("noop.count")
+        assert METRICS.snapshot()["operations"] == {}
+        assert METRICS.snapshot()["counters"] == {}
+
+    def test_instrumented_counts_errors(self, metrics) -> None:
+        @instrumented("fails")
+        def fails() -> None:
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            fails()
+        snapshot = metrics.snapshot()
+        assert snapshot["operations"]["fails"]["count"] == 1
+        assert snapshot["counters"]["fails.errors"] == 1
+
+    def test_service_and_storage_operations(self, metrics, csv_path: str) -> None:
+        user = User("Test", "hello")
+        user.csv_path = csv_path
+        account = BankAccount(user)
+        account.csv_path = csv_path
+        user.login()
+        account.deposit(100)
+
+        operations = metrics.snapshot()["operations"]
+        for name in ["user.hash_password", "user.authorize", "account.deposit",
+                     "ledger.load", "ledger.load.read_snapshot", "ledger.apply_delta", "journal.append"]:
+            assert operations[name]["count"] >= 1, name
+        assert "account.deposit" in metrics.report()
+
+    def test_profiler(self) -> None:
+        profiler = Profiler()
+        profiler.start("tracemalloc")
+        [str(i) for i in range(1000)]
+        assert "Traced memory" in profiler.stop()
+
+        profiler.start("cprofile")
+        sorted(range(1000))
+        assert "function calls" in profiler.stop()
+
+        with pytest.raises(ValueError):
+            profiler.start("perf")
@@ -0,0 +1,35 @@
+import pytest
+from bank_app.services.money import format_cents, parse_amount, units_to_cents
+
+
+class TestMoney:
+    @pytest.mark.parametrize(
+        "amount, expected",
+        [
+            ("12.34", 1234), ("100", 10000), (" 0.1 ", 10), (0.29, 29), (5, 500), ("-1.50", -150)
+        ]
+    )
+    def test_parse_amount(self, amount, expected: int) -> None:
+        assert parse_amount(amount) == expected
+
+    @pytest.mark.parametrize(
+        "amount, message",
+        [
+            ("abc", "Invalid amount 'abc'"),
+            ("nan", "Invalid amount 'nan'"),
+            ("0.001", "Amount can't have fractions of a cent"),
+        ]
+    )
+    def test_parse_amount_invalid(self, amount: str, message: str) -> None:
+        with pytest.raises(ValueError) as err_obj:
+            parse_amount(amount)
+        assert err_obj.value.args[0] == message
+
+    def test_format_cents(self) -> None:
+        assert format_cents(39900) == "399.00"
+        assert format_cents(5) == "0.05"
+        assert format_cents(-150) == "-1.50"
+
+    def test_units_to_cents(self) -> None:
+        assert units_to_cents(399.29) == 39929
+        assert units_to_cents(0.1 + 0.2) == 30
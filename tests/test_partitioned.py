@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import pytest
+import polars as pl
+from bank_app.services.partitioned_store import (
+    INTENTS_NAME,
+    PartitionedBackend,
+    partition_dir_for,
+    partition_for,
+)
+
+
+class TestPartitionedBackend:
+    @pytest.fixture
+    def csv_path(self, tmp_path) -> str:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"] + [f"user{i}" for i in range(100)],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"] * 102,
+            # passwords are all "hello"
+            "BalanceCents": [39900, 100000] + [1000] * 100
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        yield csv_path
+
+    def test_split_into_partitions(self, csv_path: str) -> None:
+        backend = PartitionedBackend(csv_path, partitions=8)
+        directory = partition_dir_for(csv_path)
+        with open(os.path.join(directory, "manifest.json")) as manifest_file:
+            assert json.load(manifest_file)["partitions"] == 8
+
+        total = 0
+        for partition in range(8):
+            df = pl.read_csv(os.path.join(directory, f"part-{partition:04d}.csv"))
+            assert all(partition_for(username, 8) == partition for username in df["Username"])
+            total += df.height
+        assert total == 102
+        backend.close()
+
+    def test_partitions_load_lazily(self, csv_path: str) -> None:
+        backend = PartitionedBackend(csv_path, partitions=8)
+        assert backend._ledgers == {}
+        assert backend.get_balance("Test") == 39900
+        assert list(backend._ledgers) == [partition_for("Test", 8)]
+        backend.close()
+
+    def test_partition_count_is_fixed(self, csv_path: str) -> None:
+        PartitionedBackend(csv_path, partitions=8).close()
+        reopened = PartitionedBackend(csv_path, partitions=32)
+        assert reopened.partitions == 8
+        reopened.close()
+
+    def test_cross_partition_transfers_conserve_money(self, csv_path: str) -> None:
+        backend = PartitionedBackend(csv_path, partitions=8)
+        assert partition_for("Test", 8) != partition_for("Test2", 8)
+
+        def transfer_many(source: str, recipient: str) -> None:
+            for _ in range(50):
+                backend.transfer(source, recipient, 100)
+
+        threads = [
+            threading.Thread(target=transfer_many, args=("Test", "Test2")),
+            threading.Thread(target=transfer_many, args=("Test2", "Test")),
+            threading.Thread(target=transfer_many, args=("Test", "Test2")),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert backend.get_balance("Test") == 34900
+        assert backend.get_balance("Test2") == 105000
+        backend.close()
+
+        reopened = PartitionedBackend(csv_path)
+        assert reopened.get_balance("Test") == 34900
+        reopened.close()
+
+    def test_crash_mid_transfer_is_rolled_forward(self, csv_path: str) -> None:
+        # A process logs the intent, writes only the debit and dies
+        crashed = PartitionedBackend(csv_path, partitions=8)
+        crashed.intents.sync(crashed.intents.append({
+            "op": "begin", "txn": "abc",
+            "before": {"Test": 39900, "Test2": 100000},
+            "after": {"Test": 29900, "Test2": 110000},
+        }))
+        with crashed._hold(["Test"]) as ledgers:
+            ledgers["Test"].set_held("Test", 29900, "abc")
+        crashed.flush()
+
+        recovered = PartitionedBackend(csv_path)
+        assert recovered.get_balance("Test") == 29900
+        assert recovered.get_balance("Test2") == 110000
+        assert os.path.getsize(os.path.join(partition_dir_for(csv_path), INTENTS_NAME)) == 0
+        recovered.close()
@@ -0,0 +1,102 @@
+import threading
+import pytest
+from bank_app.services import passwords
+from bank_app.services.passwords import (
+    HashingBusyError,
+    HashingExecutor,
+    hash_password,
+    needs_rehash,
+    verify_password,
+)
+from bank_app.services.storage import get_backend
+from bank_app.services.users import User
+
+# sha256 of "hello", the pre-hash User keeps
+HELLO = "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+
+class TestPasswords:
+    @pytest.mark.parametrize("scheme", ["scrypt", "pbkdf2_sha256"])
+    def test_hash_and_verify(self, scheme: str) -> None:
+        stored = hash_password(HELLO, scheme)
+        assert stored.startswith(f"{scheme}$")
+        assert stored != hash_password(HELLO, scheme)  # salted
+        assert verify_password(HELLO, stored)
+        assert not verify_password("wrong", stored)
+
+    def test_legacy_hash_still_verifies(self) -> None:
+        assert verify_password(HELLO, HELLO)
+        assert not verify_password("wrong", HELLO)
+        assert needs_rehash(HELLO)
+
+    def test_needs_rehash(self, mocker) -> None:
+        stored = hash_password(HELLO)
+        assert not needs_rehash(stored)
+        mocker.patch.object(passwords, "SCRYPT_N", passwords.SCRYPT_N * 2)
+        assert needs_rehash(stored)
+        assert needs_rehash(hash_password(HELLO, "pbkdf2_sha256"))
+
+    def test_unknown_scheme(self) -> None:
+        with pytest.raises(ValueError):
+            hash_password(HELLO, "md5")
+        assert not verify_password(HELLO, "md5$abc$def")
+
+    def test_process_pool(self) -> None:
+        executor = HashingExecutor(workers=1)
+        try:
+            stored = executor.hash(HELLO)
+            assert executor.verify(HELLO, stored)
+            assert not executor.verify("wrong", stored)
+        finally:
+            executor.shutdown()
+
+    @pytest.mark.parametrize("workers", [0, 1])
+    def test_hash_many(self, workers: int) -> None:
+        executor = HashingExecutor(workers=workers)
+        try:
+            hashes = executor.hash_many([HELLO, "other", HELLO])
+            assert verify_password(HELLO, hashes[0]) and verify_password("other", hashes[1])
+            # Every hash gets its own salt
+            assert hashes[0] != hashes[2]
+            assert executor.hash_many([]) == []
+        finally:
+            executor.shutdown()
+
+    def test_backpressure(self) -> None:
+        executor = HashingExecutor(workers=0, max_pending=1, timeout=0.05)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow() -> None:
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=executor._run, args=(slow,))
+        thread.start()
+        started.wait()
+        with pytest.raises(HashingBusyError):
+            executor.hash(HELLO)
+        release.set()
+        thread.join()
+        assert executor.verify(HELLO, executor.hash(HELLO))
+
+    def test_login_upgrades_legacy_hash(self, csv_path: str) -> None:
+        user = User("Test", "hello")
+        user.csv_path = csv_path
+        assert user.login() is True
+
+        stored = get_backend(csv_path).get_user("Test").password
+        assert stored.startswith("scrypt$")
+        assert verify_password(HELLO, stored)
+
+        again = User("Test", "hello")
+        again.csv_path = csv_path
+        assert again.login() is True
+        assert get_backend(csv_path).get_user("Test").password == stored
+
+    def test_create_stores_salted_hash(self, csv_path: str) -> None:
+        user = User("Robert", "hello")
+        user.csv_path = csv_path
+        user.create(0)
+        assert get_backend(csv_path).get_user("Robert").password.startswith("scrypt$")
+        assert user.authorize(user.password) is True
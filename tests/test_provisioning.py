@@ -0,0 +1,136 @@
+import json
+import os
+import pytest
+import polars as pl
+from bank_app.services.ledger import Ledger
+from bank_app.services.passwords import verify_password
+from bank_app.services.provisioning import load_user_chunks, provision_users
+from bank_app.services.users import User
+
+
+class TestProvisioning:
+    @pytest.fixture
+    def ledger(self, tmp_path) -> Ledger:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+                        "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
+            # passwords are all "hello"
+            "BalanceCents": [39900, 100000]
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        ledger = Ledger(csv_path)
+        yield ledger
+        ledger.close()
+
+    @pytest.fixture
+    def users_csv(self, tmp_path) -> str:
+        path = os.path.join(tmp_path, "users.csv")
+        with open(path, "w") as users_file:
+            users_file.write(
+                "Username,Password,Balance\n"
+                "Alice,secret,100\n"
+                "Bob,hunter2,\n"
+                "Test,hello,5\n"
+                "Alice,again,1\n"
+                ",nobody,1\n"
+                "Carol,,1\n"
+                "Dave,pw,-1\n"
+                "Erin,pw,0.001\n"
+                "Frank,pw,abc\n"
+                "Grace,pw,2.5\n"
+            )
+        yield path
+
+    def test_load_user_chunks_csv(self, users_csv: str) -> None:
+        chunks = list(load_user_chunks(users_csv, chunk_size=4))
+        assert sum(chunk.height for chunk in chunks) == 10
+        assert all(chunk.columns == ["Username", "Password", "Balance"] for chunk in chunks)
+
+    def test_load_user_chunks_jsonl(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "users.jsonl")
+        with open(path, "w") as users_file:
+            for i in range(5):
+                users_file.write(json.dumps({"Username": f"user{i}", "Password": "pw"}) + "\n")
+        chunks = list(load_user_chunks(path, chunk_size=2))
+        assert [chunk.height for chunk in chunks] == [2, 2, 1]
+        assert chunks[0]["Balance"].to_list() == [None, None]
+
+    def test_load_user_chunks_unsupported(self, tmp_path) -> None:
+        with pytest.raises(ValueError):
+            list(load_user_chunks(os.path.join(tmp_path, "users.xml")))
+
+    def test_provision_users(self, ledger: Ledger, users_csv: str) -> None:
+        report = provision_users(ledger, load_user_chunks(users_csv))
+
+        assert report.total == 10
+        assert report.created == 3
+        assert ledger.get_balance("Alice") == 10000
+        assert ledger.get_balance("Bob") == 0
+        assert ledger.get_balance("Grace") == 250
+        assert ledger.get_balance("Test") == 39900
+        assert dict(zip(report.rejected["Row"], report.rejected["Reason"])) == {
+            2: "Username already exists",
+            3: "Duplicate username in file",
+            4: "Username is required",
+            5: "Password is required",
+            6: "Balance can't be negative",
+            7: "Balance can't have fractions of a cent",
+            8: "Balance must be a number",
+        }
+        assert "Password" not in report.rejected.columns
+
+    def test_balances_parsed_like_parse_amount(self, ledger: Ledger, tmp_path) -> None:
+        path = os.path.join(tmp_path, "users.csv")
+        with open(path, "w") as users_file:
+            users_file.write(
+                "Username,Password,Balance\n"
+                "Big,pw,90071992547409.93\n"
+                "Exponent,pw,1e3\n"
+                "Cents,pw,0.29\n"
+                "Infinite,pw,inf\n"
+                "NotANumber,pw,nan\n"
+                "Huge,pw,1e30\n"
+            )
+        report = provision_users(ledger, load_user_chunks(path))
+
+        # Exact in Decimal, a float would have called it fractional
+        assert ledger.get_balance("Big") == 9007199254740993
+        assert ledger.get_balance("Exponent") == 100000
+        assert ledger.get_balance("Cents") == 29
+        assert dict(zip(report.rejected["Row"], report.rejected["Reason"])) == {
+            3: "Balance must be a number",
+            4: "Balance must be a number",
+            5: "Balance is too large",
+        }
+
+    def test_created_users_can_log_in(self, ledger: Ledger, users_csv: str) -> None:
+        provision_users(ledger, load_user_chunks(users_csv))
+        stored = ledger.get_user("Alice").password
+        assert stored.startswith("scrypt$")
+        assert verify_password(User("Alice", "secret").password, stored)
+
+    def test_duplicates_across_chunks(self, ledger: Ledger, users_csv: str) -> None:
+        report = provision_users(ledger, load_user_chunks(users_csv, chunk_size=2))
+        assert report.created == 3
+        # The repeat of Alice is in a later chunk, after the first one was committed
+        assert report.rejected.filter(pl.col("Row") == 3)["Reason"][0] == "Username already exists"
+
+    def test_one_write_per_chunk(self, ledger: Ledger, tmp_path, mocker) -> None:
+        path = os.path.join(tmp_path, "users.csv")
+        pl.DataFrame({"Username": [f"user{i}" for i in range(50)], "Password": ["pw"] * 50}).write_csv(path)
+        create_users = mocker.spy(ledger, "create_users")
+        create_user = mocker.spy(ledger, "create_user")
+
+        report = provision_users(ledger, load_user_chunks(path, chunk_size=25))
+
+        assert report.created == 50
+        assert create_users.call_count == 2
+        assert create_user.call_count == 0
+
+    def test_rerun_is_idempotent(self, ledger: Ledger, users_csv: str) -> None:
+        provision_users(ledger, load_user_chunks(users_csv))
+        report = provision_users(ledger, load_user_chunks(users_csv))
+        assert report.created == 0
+        assert len(ledger.accounts()) == 5
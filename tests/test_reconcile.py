@@ -0,0 +1,108 @@
+import os
+import pytest
+import polars as pl
+from bank_app.services.ledger import Ledger
+from bank_app.services.reconcile import load_balance_chunks, reconcile, snapshot_balance_chunks
+
+
+class TestReconcile:
+    @pytest.fixture
+    def ledger(self, tmp_path) -> Ledger:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"] + [f"user{i}" for i in range(20)],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"] * 22,
+            # passwords are all "hello"
+            "BalanceCents": [39900, 100000] + [1000] * 20
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        ledger = Ledger(csv_path)
+        yield ledger
+        ledger.close()
+
+    @pytest.fixture
+    def external_csv(self, tmp_path) -> str:
+        path = os.path.join(tmp_path, "general_ledger.csv")
+        rows = ["Username,BalanceCents", "Test,39900", "Test2,99999", "Nobody,500", "user0,abc", "user1,1000", "user1,1000", ",5"]
+        rows += [f"user{i},1000" for i in range(3, 20)]
+        with open(path, "w") as external_file:
+            external_file.write("\n".join(rows) + "\n")
+        yield path
+
+    def test_load_balance_chunks_in_dollars(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "balances.csv")
+        with open(path, "w") as balances_file:
+            balances_file.write("Username,Balance\nTest,399.00\nTest2,0.29\n")
+        chunk = pl.concat(load_balance_chunks(path))
+        assert chunk["BalanceCents"].to_list() == [39900, 29]
+
+    def test_load_balance_chunks_needs_balance(self, tmp_path) -> None:
+        path = os.path.join(tmp_path, "balances.csv")
+        with open(path, "w") as balances_file:
+            balances_file.write("Username,Amount\nTest,1\n")
+        with pytest.raises(ValueError):
+            list(load_balance_chunks(path))
+
+    @pytest.mark.parametrize("buckets, chunk_size", [(1, 1000), (4, 3)])
+    def test_reconcile(self, ledger: Ledger, external_csv: str, tmp_path, buckets: int, chunk_size: int) -> None:
+        output_path = os.path.join(tmp_path, "mismatches.csv")
+        emitted = []
+
+        report = reconcile(
+            ledger, external_csv, output_path, emitted.append, chunk_size=chunk_size, buckets=buckets
+        )
+
+        assert report.complete
+        assert (report.accounts, report.external) == (22, 24)
+        mismatches = pl.read_csv(output_path)
+        issues = {(username, issue) for username, _, _, issue in mismatches.iter_rows()}
+        assert issues == {
+            ("Test2", "Balance differs"),
+            ("Nobody", "Missing from store"),
+            ("user0", "Invalid external balance"),
+            ("user1", "Duplicate in external file"),
+            ("user2", "Missing from external file"),
+            (None, "Missing username"),
+        }
+        assert report.mismatches == mismatches.height == sum(df.height for df in emitted)
+        assert mismatches.filter(pl.col("Username") == "Test2").row(0) == ("Test2", 100000, 99999, "Balance differs")
+
+    def test_matching_files_have_no_mismatches(self, ledger: Ledger, tmp_path) -> None:
+        path = os.path.join(tmp_path, "export.csv")
+        pl.DataFrame(ledger.accounts(), orient="row", schema=["Username", "Password", "BalanceCents"]).write_csv(path)
+        report = reconcile(ledger, path, buckets=3)
+        assert report.complete and report.mismatches == 0
+
+    def test_time_budget(self, ledger: Ledger, external_csv: str) -> None:
+        report = reconcile(ledger, external_csv, time_budget=1e-9)
+        assert not report.complete
+
+    @pytest.mark.parametrize("snapshot_format", ["csv", "ipc"])
+    def test_snapshot_balance_chunks_overlay_the_journal(self, tmp_path, snapshot_format: str) -> None:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        pl.DataFrame({
+            "Username": ["Test", "Test2", "user0", "Test"],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"] * 4,
+            "BalanceCents": [39900, 100000, 1000, 1],
+        }).write_csv(csv_path)
+        ledger = Ledger(csv_path, snapshot_format=snapshot_format)
+        try:
+            ledger.set_balance("Test", 100)
+            ledger.transfer("Test2", "user0", 500)
+            ledger.create_user("Robert", "pw", 700)
+            ledger.set_balance("Robert", 800)
+            ledger.apply_deltas({"user0": 1})
+            ledger.journal.sync()
+            expected = {record.username: record.balance for batch in ledger.iter_accounts() for record in batch}
+
+            chunks = list(snapshot_balance_chunks(csv_path, chunk_size=2, snapshot_format=snapshot_format))
+        finally:
+            ledger.close()
+
+        assert all(chunk.height <= 2 for chunk in chunks)
+        streamed = pl.concat(chunks).filter(pl.col("Username").is_first_distinct())
+        assert dict(streamed.iter_rows()) == expected == {"Test": 100, "Test2": 99500, "user0": 1501, "Robert": 800}
+        path = os.path.join(tmp_path, "export.csv")
+        streamed.write_csv(path)
+        report = reconcile(snapshot_balance_chunks(csv_path, snapshot_format=snapshot_format), path)
+        assert report.complete and report.mismatches == 0
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import typing
+import pytest
+from bank_app.services.server import BankServer
+
+
+async def request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, **payload: typing.Any
+) -> typing.Dict[str, typing.Any]:
+    writer.write((json.dumps(payload) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+class TestServer:
+    def run_client(
+        self, csv_path: str, client: typing.Callable[[int], typing.Awaitable[typing.Any]]
+    ) -> typing.Any:
+        bank_server = BankServer(csv_path, workers=8)
+
+        async def main() -> typing.Any:
+            server = await bank_server.start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await client(port)
+
+        try:
+            return asyncio.run(main())
+        finally:
+            bank_server.close()
+
+    def test_session(self, csv_path: str) -> None:
+        async def client(port: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+            response = await request(reader, writer, op="balance", id=1)
+            assert response == {"ok": False, "error": "Not logged in", "id": 1}
+
+            response = await request(reader, writer, op="login", username="Test", password="hello")
+            assert response == {"ok": True, "username": "Test"}
+            assert (await request(reader, writer, op="deposit", amount=1))["balance"] == "400.00"
+            assert (await request(reader, writer, op="withdraw", amount=100))["balance"] == "300.00"
+            response = await request(reader, writer, op="transfer", recipient="Test2", amount=50)
+            assert response == {"ok": True, "balance": "250.00"}
+            assert (await request(reader, writer, op="balance"))["balance"] == "250.00"
+
+            response = await request(reader, writer, op="withdraw", amount=1000)
+            assert response == {"ok": False, "error": "Insufficient funds"}
+            response = await request(reader, writer, op="deposit", amount="0.005")
+            assert response == {"ok": False, "error": "Amount can't have fractions of a cent"}
+            assert (await request(reader, writer, op="deposit", amount="0.10"))["balance"] == "250.10"
+
+            response = await request(reader, writer, op="statement", limit=2)
+            assert [(line["type"], line["amount"], line["balance"]) for line in response["transactions"]] == [
+                ("transfer", "-50.00", "250.00"), ("deposit", "0.10", "250.10")
+            ]
+            response = await request(reader, writer, op="statement", start="2000-01-01")
+            assert [line["type"] for line in response["transactions"]] == ["deposit", "withdraw", "transfer", "deposit"]
+            writer.close()
+            await writer.wait_closed()
+
+        self.run_client(csv_path, client)
+
+    def test_create_and_bad_requests(self, csv_path: str) -> None:
+        async def client(port: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+            response = await request(reader, writer, op="create", username="Robert", password="pw", balance=5)
+            assert response == {"ok": True, "username": "Robert"}
+            response = await request(reader, writer, op="create", username="Robert", password="pw")
+            assert response == {"ok": False, "error": "Username already exists"}
+            response = await request(reader, writer, op="create", username="neg", password="pw", balance="-50")
+            assert response == {"ok": False, "error": "Balance can't be negative"}
+            response = await request(reader, writer, op="login", username="Robert", password="wrong")
+            assert response == {"ok": False, "error": "Invalid username or password"}
+            response = await request(reader, writer, op="login", username="Robert")
+            assert response == {"ok": False, "error": "Missing field 'password'"}
+            response = await request(reader, writer, op="metrics")
+            assert response["ok"] and "operations" in response["metrics"]
+            response = await request(reader, writer, op="fly")
+            assert response == {"ok": False, "error": "Unknown op 'fly'"}
+
+            writer.write(b"not json\n")
+            assert json.loads(await reader.readline()) == {"ok": False, "error": "Invalid JSON"}
+            writer.close()
+            await writer.wait_closed()
+
+        self.run_client(csv_path, client)
+
+    @pytest.mark.parametrize("amount", [-5, 0])
+    def test_non_positive_amounts(self, csv_path: str, amount: int) -> None:
+        async def client(port: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await request(reader, writer, op="login", username="Test", password="hello")
+
+            response = await request(reader, writer, op="deposit", amount=amount)
+            assert response == {"ok": False, "error": "Deposit must be greater than 0"}
+            response = await request(reader, writer, op="withdraw", amount=amount)
+            assert response == {"ok": False, "error": "Withdrawal must be greater than 0"}
+            assert (await request(reader, writer, op="balance"))["balance"] == "399.00"
+            writer.close()
+            await writer.wait_closed()
+
+        self.run_client(csv_path, client)
+
+    def test_concurrent_sessions(self, csv_path: str) -> None:
+        async def session(port: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await request(reader, writer, op="login", username="Test2", password="hello")
+            await request(reader, writer, op="deposit", amount=1)
+            writer.close()
+            await writer.wait_closed()
+
+        async def client(port: int) -> str:
+            await asyncio.gather(*(session(port) for _ in range(200)))
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await request(reader, writer, op="login", username="Test2", password="hello")
+            response = await request(reader, writer, op="balance")
+            writer.close()
+            await writer.wait_closed()
+            return response["balance"]
+
+        assert self.run_client(csv_path, client) == "1200.00"
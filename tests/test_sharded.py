@@ -0,0 +1,248 @@
+import concurrent.futures
+import os
+import threading
+import typing
+import pytest
+import polars as pl
+from bank_app.services.partitioned_store import PartitionedBackend
+from bank_app.services.sharded_store import ShardedBackend, ShardError, ShardWorker, shard_for
+
+
+class FakeConn:
+    def __init__(self) -> None:
+        self.sent: typing.List[typing.Tuple[int, bool, typing.Any]] = []
+
+    def send(self, message: typing.Tuple[int, bool, typing.Any]) -> None:
+        self.sent.append(message)
+
+
+class TestShardedBackend:
+    @pytest.fixture
+    def csv_path(self, tmp_path) -> str:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"] + [f"user{i}" for i in range(20)],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"] * 22,
+            # passwords are all "hello"
+            "BalanceCents": [39900, 100000] + [1000] * 20
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        yield csv_path
+
+    @pytest.fixture
+    def backend(self, csv_path: str) -> ShardedBackend:
+        backend = ShardedBackend(csv_path, shards=2)
+        yield backend
+        backend.close()
+
+    def test_cross_shard_transfer(self, backend: ShardedBackend) -> None:
+        assert shard_for("Test", backend.partitions, 2) != shard_for("user0", backend.partitions, 2)
+        assert backend.transfer("Test", "user0", 900) == (39000, 1900)
+        assert backend.get_balance("Test") == 39000
+        assert backend.get_balance("user0") == 1900
+
+    @pytest.mark.parametrize(
+        "source, recipient, amount, message",
+        [
+            ("Test", "user0", 10000000, "Insufficient funds"),
+            ("user0", "Nobody", 100, "User Nobody does not exist"),
+            ("Nobody", "user0", 100, "User Nobody does not exist"),
+        ]
+    )
+    def test_cross_shard_transfer_is_all_or_nothing(
+        self,
+        backend: ShardedBackend,
+        source: str,
+        recipient: str,
+        amount: int,
+        message: str,
+    ) -> None:
+        with pytest.raises(ValueError) as err_obj:
+            backend.transfer(source, recipient, amount)
+        assert err_obj.value.args[0] == message
+        assert backend.get_balance("Test") == 39900
+        assert backend.get_balance("user0") == 1000
+        # The aborted reservations are released
+        assert backend.apply_delta("user0", 100, "deposit") == 1100
+
+    def test_cross_shard_apply_deltas(self, backend: ShardedBackend) -> None:
+        assert backend.apply_deltas({"Test": -900, "user0": 400, "user4": 500}) == {
+            "Test": 39000, "user0": 1400, "user4": 1500
+        }
+        with pytest.raises(ValueError):
+            backend.apply_deltas({"Test": 100, "user0": -5000})
+        assert backend.get_balance("Test") == 39000
+        assert backend.get_balance("user0") == 1400
+
+    def test_concurrent_cross_shard_transfers_conserve_money(self, backend: ShardedBackend) -> None:
+        def transfer_many(source: str, recipient: str) -> None:
+            for _ in range(25):
+                backend.transfer(source, recipient, 10)
+
+        # Opposite directions over the same accounts - ordered prepares mean neither waits forever
+        threads = [
+            threading.Thread(target=transfer_many, args=pair)
+            for pair in [("Test", "user0"), ("user0", "Test"), ("Test2", "user1"), ("user1", "Test")]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        balances = {record.username: record.balance for record in backend.accounts()}
+        assert sum(balances.values()) == 39900 + 100000 + 20 * 1000
+        assert balances["Test"] == 39900 + 250 and balances["Test2"] == 100000 - 250
+
+    def test_aggregates(self, backend: ShardedBackend) -> None:
+        backend.apply_delta("user0", 500, "deposit")
+        backend.transfer("Test", "user0", 900)
+        report = backend.aggregates().report(2)
+        assert report["accounts"] == 22
+        assert report["total_balance"] == 39900 + 100000 + 20 * 1000 + 500
+        assert report["total_deposits"] == 500
+        assert report["top_balances"] == [
+            {"username": "Test2", "balance": 100000}, {"username": "Test", "balance": 39000}
+        ]
+
+    def test_same_files_as_partitioned(self, backend: ShardedBackend, csv_path: str) -> None:
+        backend.transfer("Test", "user0", 900)
+        backend.create_user("Robert", "hash", 500)
+        records = backend.accounts()
+        backend.close()
+
+        partitioned = PartitionedBackend(csv_path)
+        assert partitioned.accounts() == records
+        assert partitioned.get_balance("user0") == 1900
+        partitioned.close()
+
+    def test_shards_capped_at_partitions(self, csv_path: str) -> None:
+        PartitionedBackend(csv_path, partitions=2).close()
+        backend = ShardedBackend(csv_path, shards=4)
+        assert backend.shards == 2
+        backend.close()
+
+    def test_decision_without_legs_is_rolled_forward(self, backend: ShardedBackend, csv_path: str) -> None:
+        # A coordinator that fsynced its commit decision and died before the shards wrote their legs
+        backend.intents.sync(backend.intents.append(
+            {"op": "begin", "txn": "t1", "before": {"Test": 39900, "user0": 1000}, "after": {"Test": 39000, "user0": 1900}}
+        ))
+        backend.close()
+
+        reopened = ShardedBackend(csv_path, shards=2)
+        assert reopened.get_balance("Test") == 39000
+        assert reopened.get_balance("user0") == 1900
+        reopened.close()
+
+    def test_failed_leg_is_rolled_forward(self, backend: ShardedBackend, csv_path: str) -> None:
+        # A shard whose commit leg raised after the decision was made
+        backend.intents.sync(backend.intents.append(
+            {"op": "begin", "txn": "t1", "before": {"Test": 39900, "user0": 1000}, "after": {"Test": 39000, "user0": 1900}}
+        ))
+        backend.intents.sync(backend.intents.append({"op": "failed", "txn": "t1", "error": "disk full"}))
+        backend.close()
+
+        reopened = ShardedBackend(csv_path, shards=2)
+        assert reopened.get_balance("Test") == 39000
+        assert reopened.get_balance("user0") == 1900
+        reopened.close()
+
+    def test_second_leg_failure_is_retried(self, backend: ShardedBackend, mocker) -> None:
+        client = backend._clients[shard_for("user0", backend.partitions, 2)]
+        submit = client.submit
+        failures = []
+
+        def fail_first_commit(op: str, *args: typing.Any) -> concurrent.futures.Future:
+            if op == "commit" and not failures:
+                failures.append(op)
+                leg: concurrent.futures.Future = concurrent.futures.Future()
+                leg.set_exception(OSError("disk full"))
+                return leg
+            return submit(op, *args)
+
+        mocker.patch.object(client, "submit", side_effect=fail_first_commit)
+        assert backend.transfer("Test", "user0", 900) == (39000, 1900)
+        assert failures == ["commit"]
+        assert backend.get_balance("Test") == 39000
+        assert backend.get_balance("user0") == 1900
+        # The retried leg released the reservation
+        assert backend.apply_delta("user0", 100, "deposit") == 2000
+
+    def test_dead_worker(self, backend: ShardedBackend) -> None:
+        client = backend._clients[shard_for("user0", backend.partitions, 2)]
+        client.process.kill()
+        client.process.join()
+        with pytest.raises(ShardError):
+            backend.get_balance("user0")
+
+
+class TestShardWorker:
+    @pytest.fixture
+    def worker(self, tmp_path) -> ShardWorker:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        pl.DataFrame({
+            "Username": ["Test", "Test2"],
+            "Password": ["hash", "hash"],
+            "BalanceCents": [39900, 100000]
+        }).write_csv(csv_path)
+        backend = PartitionedBackend(csv_path)
+        yield ShardWorker(backend, FakeConn())
+        backend.close()
+
+    def test_writes_wait_for_reservation(self, worker: ShardWorker) -> None:
+        worker.handle(1, "prepare", ("t1", ["Test"]))
+        assert worker.conn.sent == [(1, True, {"Test": 39900})]
+
+        worker.handle(2, "apply_delta", ("Test", 100, "deposit"))
+        worker.handle(3, "get_balance", ("Test",))
+        worker.handle(4, "apply_delta", ("Test2", 100, "deposit"))
+        # Reads and other accounts go ahead, the write on Test is parked
+        assert worker.conn.sent[1:] == [(3, True, 39900), (4, True, 100100)]
+
+        worker.handle(5, "commit", ("t1", {"Test": 30000}))
+        assert worker.conn.sent[3:] == [(5, True, None), (2, True, 30100)]
+
+    def test_parked_writes_keep_their_order(self, worker: ShardWorker) -> None:
+        worker.handle(1, "prepare", ("t1", ["Test"]))
+        worker.handle(2, "prepare", ("t2", ["Test"]))
+        worker.handle(3, "set_balance", ("Test", 100))
+        worker.handle(4, "abort", ("t1",))
+        # t2 gets the reservation next, the write still waits behind it
+        assert [message[0] for message in worker.conn.sent] == [1, 4, 2]
+
+        worker.handle(5, "abort", ("t2",))
+        assert [message[0] for message in worker.conn.sent] == [1, 4, 2, 5, 3]
+        assert worker.backend.get_balance("Test") == 100
+
+    def test_errors_are_replied(self, worker: ShardWorker) -> None:
+        worker.handle(1, "apply_delta", ("Nobody", 100, "deposit"))
+        request_id, ok, error = worker.conn.sent[0]
+        assert (request_id, ok) == (1, False)
+        assert isinstance(error, ValueError)
+
+    def test_failed_commit_keeps_reservation(self, worker: ShardWorker, mocker) -> None:
+        worker.handle(1, "prepare", ("t1", ["Test"]))
+        set_balance = mocker.patch.object(worker.backend, "set_balance", side_effect=OSError("disk full"))
+        worker.handle(2, "commit", ("t1", {"Test": 30000}))
+        request_id, ok, error = worker.conn.sent[1]
+        assert (request_id, ok) == (2, False)
+        assert isinstance(error, OSError)
+
+        # The other leg may be applied, so the account can't be written until this one is
+        worker.handle(3, "apply_delta", ("Test", 100, "deposit"))
+        request_id, ok, error = worker.conn.sent[2]
+        assert (request_id, ok) == (3, False)
+        assert isinstance(error, ShardError)
+        assert worker.backend.get_balance("Test") == 39900
+
+        # A later write rolls the leg forward first
+        mocker.stop(set_balance)
+        worker.handle(4, "apply_delta", ("Test", 100, "deposit"))
+        assert worker.conn.sent[3:] == [(4, True, 30100)]
+
+    def test_retried_commit_releases_reservation(self, worker: ShardWorker, mocker) -> None:
+        worker.handle(1, "prepare", ("t1", ["Test"]))
+        mocker.patch.object(worker.backend, "flush", side_effect=[OSError("disk full"), None])
+        worker.handle(2, "commit", ("t1", {"Test": 30000}))
+        worker.handle(3, "commit", ("t1", {"Test": 30000}))
+        worker.handle(4, "set_balance", ("Test", 100))
+        assert worker.conn.sent[2:] == [(3, True, None), (4, True, None)]
+        assert worker.backend.get_balance("Test") == 100
@@ -0,0 +1,62 @@
+import os
+import pytest
+import polars as pl
+from bank_app.services.ledger import Ledger
+from bank_app.services.snapshot import (
+    convert_legacy_snapshots,
+    export_csv,
+    ipc_path_for,
+    migrate_csv_to_ipc,
+    read_snapshot,
+)
+
+
+class TestSnapshot:
+    def test_migrate_csv_to_ipc(self, csv_path: str) -> None:
+        assert migrate_csv_to_ipc(csv_path) is True
+        assert migrate_csv_to_ipc(csv_path) is False
+        df = read_snapshot(ipc_path_for(csv_path), "ipc")
+        assert df.rows() == pl.read_csv(csv_path).rows()
+
+    def test_ledger_on_ipc_snapshot(self, csv_path: str) -> None:
+        csv_before = open(csv_path).read()
+        ledger = Ledger(csv_path, snapshot_format="ipc", compact_every=2, checkpoint_interval=0)
+        assert ledger.get_balance("Test") == 39900
+        ledger.apply_delta("Test", 100, "deposit")
+        ledger.create_user("Robert", "hash", 500)
+
+        # Compaction went to the IPC file, the CSV is left alone
+        df = read_snapshot(ipc_path_for(csv_path), "ipc")
+        assert df.filter(pl.col("Username") == "Test")["BalanceCents"][0] == 40000
+        assert df.filter(pl.col("Username") == "Robert").height == 1
+        assert open(csv_path).read() == csv_before
+        ledger.close()
+
+        reopened = Ledger(csv_path, snapshot_format="ipc")
+        assert reopened.get_balance("Robert") == 500
+        reopened.close()
+
+    def test_export_csv(self, csv_path: str, tmp_path) -> None:
+        ledger = Ledger(csv_path, snapshot_format="ipc")
+        ledger.apply_delta("Test2", -100, "withdraw")
+        output_path = os.path.join(tmp_path, "export.csv")
+
+        assert export_csv(ledger, output_path) == 2
+        df = pl.read_csv(output_path)
+        assert df.columns == ["Username", "Password", "BalanceCents"]
+        assert df.filter(pl.col("Username") == "Test2")["BalanceCents"][0] == 99900
+        ledger.close()
+
+    def test_convert_legacy_snapshots(self, csv_path: str) -> None:
+        legacy = pl.DataFrame({"Username": ["Test"], "Password": ["hash"], "Balance": [0.29]})
+        legacy.write_csv(csv_path)
+        legacy.write_ipc(ipc_path_for(csv_path))
+
+        assert convert_legacy_snapshots(csv_path) == [csv_path, ipc_path_for(csv_path)]
+        assert convert_legacy_snapshots(csv_path) == []
+        assert pl.read_csv(csv_path).rows() == [("Test", "hash", 29)]
+        assert pl.read_ipc(ipc_path_for(csv_path), memory_map=False).rows() == [("Test", "hash", 29)]
+
+    def test_unknown_format(self, csv_path: str) -> None:
+        with pytest.raises(ValueError):
+            Ledger(csv_path, snapshot_format="xml")
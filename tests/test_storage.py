@@ -0,0 +1,247 @@
+import os
+import sqlite3
+import struct
+import threading
+import pytest
+import polars as pl
+from bank_app.services.passwords import hash_password, verify_password
+from bank_app.services.storage import BACKENDS, DEFAULT_BACKEND, StorageBackend, UserRecord, get_backend, close_backends, set_default_backend
+from bank_app.services.ledger import Ledger, journal_path_for
+from bank_app.services.sqlite_store import SqliteBackend, sqlite_path_for
+from bank_app.services.mmap_store import HEADER, LEGACY_RECORD, MAGIC, MmapBackend, mmap_path_for
+from bank_app.services.partitioned_store import PartitionedBackend
+from bank_app.services.sharded_store import ShardedBackend
+from bank_app.services.users import User
+
+
+class TestStorageBackends:
+    @pytest.fixture(params=[Ledger, SqliteBackend, MmapBackend, PartitionedBackend, ShardedBackend])
+    def backend(self, request, csv_path: str) -> StorageBackend:
+        backend = request.param(csv_path)
+        yield backend
+        backend.close()
+
+    def test_imports_csv(self, backend: StorageBackend) -> None:
+        record = backend.get_user("Test")
+        assert record.password == "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+        assert record.balance == 39900
+        assert backend.get_balance("Test2") == 100000
+        assert backend.get_user("Nobody") is None
+        assert backend.get_balance("Nobody") is None
+
+    def test_apply_delta(self, backend: StorageBackend) -> None:
+        assert backend.apply_delta("Test", 10000, "deposit") == 49900
+        assert backend.apply_delta("Test", -15000, "withdraw") == 34900
+        assert backend.get_balance("Test") == 34900
+        with pytest.raises(ValueError):
+            backend.apply_delta("Nobody", 100, "deposit")
+
+    def test_set_balance(self, backend: StorageBackend) -> None:
+        backend.set_balance("Test", 1234500)
+        backend.set_balance("Nobody", 100)
+        assert backend.get_balance("Test") == 1234500
+
+    def test_create_user(self, backend: StorageBackend) -> None:
+        backend.create_user("Robert", "hash", 10000)
+        assert backend.get_user("Robert").password == "hash"
+        with pytest.raises(ValueError) as err_obj:
+            backend.create_user("Robert", "hash", 100)
+        assert err_obj.value.args[0] == "Username already exists"
+
+    def test_iter_accounts(self, backend: StorageBackend) -> None:
+        backend.create_users([UserRecord(f"new{i}", "hash", i) for i in range(10)])
+        batches = list(backend.iter_accounts(batch_size=3))
+        assert all(0 < len(batch) <= 3 for batch in batches)
+        assert sorted(record for batch in batches for record in batch) == sorted(backend.accounts())
+
+    def test_create_users(self, backend: StorageBackend) -> None:
+        users = [UserRecord(f"new{i}", "hash", i * 100) for i in range(30)] + [UserRecord("Test", "other", 5)]
+        created = backend.create_users(users)
+        assert sorted(created) == sorted(f"new{i}" for i in range(30))
+        assert backend.get_balance("new29") == 2900
+        # Existing accounts are left as they were
+        assert backend.get_user("Test").balance == 39900
+        assert backend.create_users(users[:2]) == []
+        assert len(backend.accounts()) == 32
+
+    def test_set_password(self, backend: StorageBackend, csv_path: str) -> None:
+        backend.set_password("Test", "scrypt$1024$8$1$salt$hash")
+        backend.set_password("Nobody", "hash")
+        assert backend.get_user("Test").password == "scrypt$1024$8$1$salt$hash"
+        backend.close()
+
+        reopened = type(backend)(csv_path)
+        assert reopened.get_user("Test") == ("Test", "scrypt$1024$8$1$salt$hash", 39900)
+        reopened.close()
+
+    def test_state_survives_reopen(self, backend: StorageBackend, csv_path: str) -> None:
+        backend.apply_delta("Test", 100, "deposit")
+        backend.create_user("Robert", "hash", 500)
+        backend.close()
+
+        reopened = type(backend)(csv_path)
+        assert reopened.get_balance("Test") == 40000
+        assert reopened.get_balance("Robert") == 500
+        reopened.close()
+
+    def test_concurrent_deposits(self, backend: StorageBackend) -> None:
+        def deposit_many() -> None:
+            for _ in range(50):
+                backend.apply_delta("Test2", 100, "deposit")
+
+        threads = [threading.Thread(target=deposit_many) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert backend.get_balance("Test2") == 120000
+
+    @pytest.mark.parametrize("kind", ["csv", "sqlite", "mmap", "partitioned", "sharded"])
+    def test_get_backend_is_shared(self, csv_path: str, kind: str) -> None:
+        assert get_backend(csv_path, kind) is get_backend(csv_path, kind)
+        close_backends()
+
+    def test_get_backend_unknown(self, csv_path: str) -> None:
+        with pytest.raises(ValueError):
+            get_backend(csv_path, "parquet")
+
+    def test_transfer(self, backend: StorageBackend) -> None:
+        assert backend.transfer("Test", "Test2", 10000) == (29900, 110000)
+        assert backend.get_balance("Test") == 29900
+        assert backend.get_balance("Test2") == 110000
+
+    @pytest.mark.parametrize(
+        "source, recipient, amount, message",
+        [
+            ("Test", "Test2", 10000000, "Insufficient funds"),
+            ("Test", "Nobody", 100, "User Nobody does not exist"),
+            ("Nobody", "Test", 100, "User Nobody does not exist"),
+            ("Test", "Test", 100, "Cannot transfer to the same account"),
+            ("Test", "Test2", -100, "Transfer must be greater than 0"),
+        ]
+    )
+    def test_transfer_is_all_or_nothing(
+        self,
+        backend: StorageBackend,
+        source: str,
+        recipient: str,
+        amount: int,
+        message: str,
+    ) -> None:
+        with pytest.raises(ValueError) as err_obj:
+            backend.transfer(source, recipient, amount)
+        assert err_obj.value.args[0] == message
+        assert backend.get_balance("Test") == 39900
+        assert backend.get_balance("Test2") == 100000
+
+    def test_apply_deltas(self, backend: StorageBackend) -> None:
+        assert backend.apply_deltas({"Test": -9900, "Test2": 100}) == {"Test": 30000, "Test2": 100100}
+        assert backend.get_balance("Test") == 30000
+
+        with pytest.raises(ValueError):
+            backend.apply_deltas({"Test2": 100, "Test": -100000})
+        with pytest.raises(ValueError):
+            backend.apply_deltas({"Test2": 100, "Nobody": 100})
+        assert backend.get_balance("Test2") == 100100
+
+    def test_accounts(self, backend: StorageBackend) -> None:
+        backend.create_user("Robert", "hash", 500)
+        backend.apply_delta("Test", 100, "deposit")
+        assert sorted((record.username, record.balance) for record in backend.accounts()) == [
+            ("Robert", 500), ("Test", 40000), ("Test2", 100000)
+        ]
+
+    def test_sqlite_commits_are_durable(self, csv_path: str) -> None:
+        backend = SqliteBackend(csv_path)
+        # 2 is FULL - the WAL is fsynced on every commit
+        assert backend._connection().execute("PRAGMA synchronous").fetchone()[0] == 2
+        backend.close()
+
+
+class TestLegacyConversion:
+    """
+    Files written before balances were integer cents
+    """
+    @pytest.fixture
+    def csv_path(self, tmp_path) -> str:
+        csv_path = os.path.join(tmp_path, "bank_system.csv")
+        data = {
+            "Username": ["Test", "Test2"],
+            "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+                        "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
+            # passwords are all "hello"
+            "Balance": [399.29, 1000.0]
+        }
+        pl.DataFrame(data).write_csv(csv_path)
+        yield csv_path
+
+    def test_ledger_converts_csv_and_journal(self, csv_path: str) -> None:
+        with open(journal_path_for(csv_path), "w") as journal_file:
+            journal_file.write('{"op": "deposit", "user": "Test", "amount": 0.7, "balance": 399.99}\n')
+            journal_file.write('{"op": "create", "user": "Robert", "password": "hash", "balance": 5.1}\n')
+
+        ledger = Ledger(csv_path)
+        assert ledger.get_balance("Test") == 39999
+        assert ledger.get_balance("Test2") == 100000
+        assert ledger.get_balance("Robert") == 510
+        with open(csv_path) as csv_file:
+            assert csv_file.readline().strip() == "Username,Password,BalanceCents"
+        ledger.close()
+        assert Ledger(csv_path).get_balance("Test") == 39999
+
+    def test_sqlite_converts_real_table(self, csv_path: str) -> None:
+        conn = sqlite3.connect(sqlite_path_for(csv_path))
+        conn.execute("CREATE TABLE accounts (username TEXT PRIMARY KEY, password TEXT NOT NULL, balance REAL NOT NULL)")
+        conn.execute("INSERT INTO accounts VALUES ('Test', 'hash', 399.29)")
+        conn.commit()
+        conn.close()
+
+        backend = SqliteBackend(csv_path)
+        assert backend.get_balance("Test") == 39929
+        assert backend.apply_delta("Test", 1, "deposit") == 39930
+        backend.close()
+
+    def test_mmap_converts_version_2_file(self, csv_path: str) -> None:
+        with open(mmap_path_for(csv_path), "wb") as data_file:
+            data_file.write(HEADER.pack(MAGIC, 2, 2))
+            data_file.write(LEGACY_RECORD.pack(b"Test", b"hash", struct.pack("<q", 39929)))
+            data_file.write(LEGACY_RECORD.pack(b"Test2", b"hash2", struct.pack("<q", 100000)))
+            data_file.truncate(HEADER.size + 4 * LEGACY_RECORD.size)
+
+        backend = MmapBackend(csv_path)
+        assert backend.get_user("Test2") == UserRecord("Test2", "hash2", 100000)
+        backend.set_password("Test", hash_password("hello"))
+        assert verify_password("hello", backend.get_user("Test").password)
+        assert backend.get_balance("Test") == 39929
+        backend.close()
+
+    def test_mmap_converts_version_1_file(self, csv_path: str) -> None:
+        with open(mmap_path_for(csv_path), "wb") as data_file:
+            data_file.write(HEADER.pack(MAGIC, 1, 1))
+            data_file.write(LEGACY_RECORD.pack(b"Test", b"hash", struct.pack("<d", 399.29)))
+            data_file.truncate(HEADER.size + 4 * LEGACY_RECORD.size)
+
+        backend = MmapBackend(csv_path)
+        assert backend.get_balance("Test") == 39929
+        assert backend.apply_delta("Test", 1, "deposit") == 39930
+        backend.close()
+
+
+class TestUsersOnEveryBackend:
+    @pytest.fixture(params=sorted(BACKENDS))
+    def csv_path(self, request, csv_path: str) -> str:
+        set_default_backend(request.param)
+        yield csv_path
+        close_backends()
+        set_default_backend(DEFAULT_BACKEND)
+
+    def test_create_login_and_rehash(self, csv_path: str) -> None:
+        assert User("Robert", "secret", csv_path=csv_path).create(500)
+        assert get_backend(csv_path).get_user("Robert").password.startswith("scrypt$")
+        assert User("Robert", "secret", csv_path=csv_path).login()
+
+        # A legacy SHA-256 digest is replaced by a salted hash on login
+        assert User("Test", "hello", csv_path=csv_path).login()
+        stored = get_backend(csv_path).get_user("Test").password
+        assert stored.startswith("scrypt$")
+        assert verify_password(User("Test", "hello").password, stored)
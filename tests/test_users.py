@@ -5,6 +5,8 @@ import polars as pl
 from pytest_mock import MockerFixture
 from unittest.mock import MagicMock, Mock, patch
 import bank_app
+from bank_app.services.paths import journal_path_for
+from bank_app.services.storage import close_backends, get_backend
 from bank_app.services.users import UserService, User, UserAuthError
 
 # Should just create mock_files and set that as mock fixture into user object but not enough time
@@ -16,13 +18,15 @@ class TestExistingUser:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         yield df
     
     @classmethod
     def teardown_class(cls) -> None:
+        # Release the files before they are reset
+        close_backends()
         csv_path = os.path.join(
             os.getcwd(), "tests", "test_data", "bank_system.csv"
         )
@@ -31,10 +35,13 @@ class TestExistingUser:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         df.write_csv(csv_path)
+        # Closing leaves the journal in place, and it records the old contents
+        if os.path.exists(journal_path_for(csv_path)):
+            os.remove(journal_path_for(csv_path))
 
     @pytest.fixture
     def user(self, mocker: MockerFixture) -> User:
@@ -110,13 +117,15 @@ class TestNewUser:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         yield df
     
     @classmethod
     def teardown_class(cls) -> None:
+        # Release the files before they are reset
+        close_backends()
         csv_path = os.path.join(
             os.getcwd(), "tests", "test_data", "bank_system.csv"
         )
@@ -125,10 +134,13 @@ class TestNewUser:
             "Password": ["2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824", 
                         "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"],
             # passwords are all "hello"
-            "Balance": [399.0, 1000.0]
+            "BalanceCents": [39900, 100000]
         }
         df = pl.DataFrame(data)
         df.write_csv(csv_path)
+        # Closing leaves the journal in place, and it records the old contents
+        if os.path.exists(journal_path_for(csv_path)):
+            os.remove(journal_path_for(csv_path))
 
     @pytest.fixture
     def user(self, mocker: MockerFixture) -> User:
@@ -140,8 +152,9 @@ class TestNewUser:
         
     def test_create(self, user: User, mocker: MockerFixture, caplog: pytest.LogCaptureFixture) -> None:
         result = user.create(100)
-        df = pl.read_csv(user.csv_path)
-        assert df.filter(df["Username"] == "Robert").height > 0
+        close_backends()
+        # A freshly opened store replays the journal the closed one left
+        assert get_backend(user.csv_path).get_user("Robert") is not None
         assert result == True
 
 class TestUserService:
@@ -167,7 +180,7 @@ class TestUserService:
         mocker.patch("bank_app.services.users.User.create", return_value=True)
         user_service.create_user()
         assert "Successfully created new user!" in caplog.text
-        assert bank_app.services.users.User.create.call_args_list == [mocker.call(100)]
+        assert bank_app.services.users.User.create.call_args_list == [mocker.call(10000)]
         
         print(caplog.text)
 